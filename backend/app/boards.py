@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""boards.py: In-process cache of decoded board snapshots.
+
+Every read of a board used to fetch its whole state item and re-encode
+the snapshot for each client asking. State items carry a `version` that
+every write bumps; a cached board is reused while a projection read of
+`version` still matches, and its snapshot frame is encoded only once.
+
+A board also keeps a summed-area table of its cells, so the number of
+active cells inside any box is four lookups. Adding a cell derives the
+next version's table from the previous one instead of rebuilding it.
+"""
+from decimal import Decimal, InvalidOperation
+from functools import cached_property
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.delivery import Frame
+from app.messages import GRID_SIZE
+
+
+class Board:
+    """One version of a board's active cells."""
+
+    def __init__(self, version: int, cells: List[str]) -> None:
+        self.version = version
+        self.cells = cells
+        self.active = set(cells)
+
+    @cached_property
+    def sat(self) -> List[List[int]]:
+        """Return the summed-area table, sat[i][j] counts cells x < i, y < j."""
+        grid = [[0] * GRID_SIZE for _ in range(GRID_SIZE)]
+        for cell in self.active:
+            x, y = cell.split(",")
+            grid[int(x)][int(y)] = 1
+        sat = [[0] * (GRID_SIZE + 1) for _ in range(GRID_SIZE + 1)]
+        for i in range(GRID_SIZE):
+            row = 0
+            for j in range(GRID_SIZE):
+                row += grid[i][j]
+                sat[i + 1][j + 1] = sat[i][j + 1] + row
+        return sat
+
+    def count(self, x1: int, y1: int, x2: int, y2: int) -> int:
+        """Return the active cells with x1 <= x < x2 and y1 <= y < y2.
+
+        Corners may be given in any order, they are clamped to the grid.
+        """
+        x1, x2 = sorted((_clamp(x1), _clamp(x2)))
+        y1, y2 = sorted((_clamp(y1), _clamp(y2)))
+        sat = self.sat
+        return sat[x2][y2] - sat[x1][y2] - sat[x2][y1] + sat[x1][y1]
+
+    def with_cell(self, version: int, cell: str) -> "Board":
+        """Return the next version of the board, with `cell` active."""
+        board = Board(version, self.cells + [cell])
+        if "sat" in self.__dict__ and cell not in self.active:
+            x, y = (int(v) for v in cell.split(","))
+            sat = [row[:] for row in self.sat]
+            for i in range(x + 1, GRID_SIZE + 1):
+                row = sat[i]
+                for j in range(y + 1, GRID_SIZE + 1):
+                    row[j] += 1
+            board.sat = sat
+        return board
+
+    @cached_property
+    def payload(self) -> List[Dict[str, int]]:
+        """Return the active cells as sent to clients."""
+        return [
+            {
+                "x": int(cell.split(",")[0]),
+                "y": int(cell.split(",")[1]),
+            }
+            for cell in self.cells
+        ]
+
+    @cached_property
+    def frame(self) -> Frame:
+        """Return the board snapshot frame, shared by every reader."""
+        return Frame(action="all_active_cells", message=self.payload)
+
+
+def _clamp(value: int) -> int:
+    return min(max(value, 0), GRID_SIZE)
+
+
+def _coord(value: Any) -> Optional[int]:
+    # stored boxes come back as Decimal, or as strings once JSON encoded
+    if isinstance(value, bool) or not isinstance(value, (int, str, Decimal)):
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        return None
+    if not number.is_finite() or number != number.to_integral_value():
+        return None
+    return int(number)
+
+
+def box_of(item: Dict) -> Optional[Tuple[int, int, int, int]]:
+    """Return a stored alert box's corners, None if one is not an integer."""
+    coords = [_coord(item.get(name)) for name in ("x1", "y1", "x2", "y2")]
+    if None in coords:
+        return None
+    x1, y1, x2, y2 = coords
+    return x1, y1, x2, y2
+
+
+# state item type -> newest board seen by this container
+cache: Dict[str, Board] = {}
+
+
+def get(name: str, version: Optional[int]) -> Optional[Board]:
+    """Return the cached board if it is still at `version`."""
+    board = cache.get(name)
+    if board is None or version is None or board.version != version:
+        return None
+    return board
+
+
+def put(
+    name: str, version: int, cells: List[str], added: Optional[str] = None
+) -> Board:
+    """Cache a board, unless a newer version is already cached.
+
+    `added` names the one cell a write added, so the board can be derived
+    from the cached previous version.
+    """
+    board = cache.get(name)
+    if board is not None and board.version > version:
+        return board
+    if added is not None and board is not None and board.version == version - 1:
+        board = board.with_cell(version, added)
+    else:
+        board = Board(version, list(cells))
+    cache[name] = board
+    return board
+
+
+def reset() -> None:
+    """Drop every cached board, e.g. after switching tables."""
+    cache.clear()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""channels.py: Channel membership, so broadcasts reach a subset of sockets.
+
+Every connection belongs to one channel (a board). Membership is stored
+under the channel's own partition, `type = "channel#<name>"` with the
+connection id as the range key, so a broadcast is a Query over its
+channel rather than a Scan over the table. The member item carries the
+fields a sender needs to post, and the connection's TTL.
+"""
+from typing import Dict, Iterator, Optional
+
+from boto3.dynamodb.conditions import Key
+
+from app.messages import DEFAULT_CHANNEL
+
+PREFIX = "channel#"
+
+
+def partition(channel: str) -> str:
+    """Return the partition holding the channel's members."""
+    return f"{PREFIX}{channel}"
+
+
+def scoped(name: str, channel: str) -> str:
+    """Scope a per-board item name, the default channel keeps the bare name."""
+    return name if channel == DEFAULT_CHANNEL else f"{name}#{channel}"
+
+
+def unscoped(name: str) -> str:
+    """Return the channel encoded in a name built by `scoped`."""
+    _, _, channel = name.partition("#")
+    return channel or DEFAULT_CHANNEL
+
+
+def join(table, connection_id: str, channel: str, fields: Dict) -> None:
+    """Add the connection to the channel."""
+    table.put_item(
+        Item={
+            "key": connection_id,
+            "type": partition(channel),
+            **fields,
+        }
+    )
+
+
+def leave(table, connection_id: str, channel: Optional[str]) -> None:
+    """Remove the connection from the channel."""
+    if not channel:
+        return
+    table.delete_item(
+        Key={
+            "key": connection_id,
+            "type": partition(channel),
+        }
+    )
+
+
+def members(table, channel: str) -> Iterator[Dict]:
+    """Yield the channel's members, shaped as connection records."""
+    kwargs = {"KeyConditionExpression": Key("type").eq(partition(channel))}
+    while True:
+        response = table.query(**kwargs)
+        for item in response.get("Items", []):
+            yield {
+                **item,
+                "key": "websocket",
+                "type": item["key"],
+                "channel": channel,
+            }
+        if "LastEvaluatedKey" not in response:
+            return
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""clients.py: boto3 clients shared across warm invocations.
+
+Client construction costs tens of milliseconds, so each client is built
+once per container and reused. boto3 resources are not thread safe, so
+the DynamoDB resource is built once per thread instead.
+"""
+import functools
+import threading
+
+import boto3
+
+from app.config import Config
+
+config = Config()
+
+LOCAL_ENDPOINT = "http://localhost:3001"
+
+_local = threading.local()
+_generation = 0
+
+
+def dynamodb():
+    """Return this thread's DynamoDB resource."""
+    if getattr(_local, "generation", None) != _generation:
+        _local.dynamodb = boto3.resource("dynamodb", region_name=config.region)
+        _local.table = _local.dynamodb.Table(config.table)
+        _local.generation = _generation
+    return _local.dynamodb
+
+
+def table():
+    """Return this thread's handle on the application table."""
+    dynamodb()
+    return _local.table
+
+
+@functools.lru_cache(maxsize=1)
+def sns():
+    """Return the SNS client."""
+    return boto3.client("sns", region_name=config.region)
+
+
+@functools.lru_cache(maxsize=1)
+def s3():
+    """Return the S3 client."""
+    return boto3.client("s3", region_name=config.region)
+
+
+@functools.lru_cache(maxsize=32)
+def gateway(endpoint_url: str):
+    """Return the API Gateway management client for an endpoint."""
+    return boto3.client("apigatewaymanagementapi", endpoint_url=endpoint_url)
+
+
+def gateway_for(domain: str, stage: str):
+    """Return the management client for a connection's domain/stage."""
+    if config.is_offline or domain == "localhost":
+        return gateway(LOCAL_ENDPOINT)
+    return gateway(f"https://{domain}/{stage}")
+
+
+def reset() -> None:
+    """Drop every cached client, e.g. after patching boto3."""
+    global _generation
+    _generation += 1
+    sns.cache_clear()
+    s3.cache_clear()
+    gateway.cache_clear()
@@ -28,3 +28,65 @@ class Config:
         self.app_client_id = os.environ.get("CLIENT_ID", "")
         if not self.app_client_id:
             raise ValueError("CLIENT_ID environment variable not set")
+        # logging, see app/logs.py
+        self.log_level = os.environ.get("LOG_LEVEL", "INFO").upper()
+        self.log_sample_rates = os.environ.get(
+            "LOG_SAMPLE_RATES", "*=0.01,schedule_random=1"
+        )
+        self.log_event_max = int(os.environ.get("LOG_EVENT_MAX", "512"))
+        # broadcasts to at most this many connections skip the SNS hop
+        self.direct_fanout_max = int(os.environ.get("DIRECT_FANOUT_MAX", "10"))
+        # connection records expire this many seconds after last activity
+        self.connection_ttl = int(os.environ.get("CONNECTION_TTL", "3600"))
+        # concurrent get_connection checks while reaping
+        self.reaper_workers = int(os.environ.get("REAPER_WORKERS", "16"))
+        # connections addressed by one SNS message, see Broadcast._messages
+        self.sns_group_max = int(os.environ.get("SNS_GROUP_MAX", "100"))
+        # concurrent deliveries per SNS batch
+        self.sns_workers = int(os.environ.get("SNS_WORKERS", "8"))
+        # seconds a delivered SNS MessageId is remembered, see app/dedupe.py
+        self.dedupe_ttl = int(os.environ.get("DEDUPE_TTL", "300"))
+        # per-container rate limits and retries, see app/delivery.py
+        self.delivery_rate = float(os.environ.get("DELIVERY_RATE", "1000"))
+        self.delivery_burst = float(os.environ.get("DELIVERY_BURST", "100"))
+        self.publish_rate = float(os.environ.get("PUBLISH_RATE", "1000"))
+        self.publish_burst = float(os.environ.get("PUBLISH_BURST", "100"))
+        self.delivery_attempts = int(os.environ.get("DELIVERY_ATTEMPTS", "6"))
+        # frames this large are compressed and chunked, see app/delivery.py
+        self.compress_min = int(os.environ.get("COMPRESS_MIN_BYTES", "16384"))
+        self.chunk_max = int(os.environ.get("CHUNK_MAX_BYTES", str(96 * 1024)))
+        # inbound frames per connection and action, see app/ratelimit.py
+        self.inbound_rate = float(os.environ.get("INBOUND_RATE", "10"))
+        self.inbound_burst = float(os.environ.get("INBOUND_BURST", "20"))
+        self.inbound_action_rates = os.environ.get(
+            "INBOUND_ACTION_RATES",
+            "clear_backend_state=0.1:2,save_alert_box=1:5,send_all_active_cells=1:5",
+        )
+        self.inbound_window = float(os.environ.get("INBOUND_WINDOW", "10"))
+        # seconds a snapshot broadcast waits to be superseded, off by default
+        self.snapshot_window = float(os.environ.get("SNAPSHOT_WINDOW_MS", "0")) / 1000
+        # seconds a container trusts its newest snapshot seq, see app/snapshots.py
+        self.snapshot_cache = float(os.environ.get("SNAPSHOT_CACHE_MS", "1000")) / 1000
+        # board simulation, see app/scheduler.py
+        self.tick_rate = float(os.environ.get("TICK_RATE", "1"))
+        self.scheduler_workers = int(os.environ.get("SCHEDULER_WORKERS", "16"))
+        self.schedule_boards = [
+            b for b in os.environ.get("SCHEDULE_BOARDS", "default").split(",") if b
+        ]
+        # seconds kept in reserve before the Lambda timeout
+        self.schedule_margin = float(os.environ.get("SCHEDULE_MARGIN", "2"))
+        # seconds a new invocation waits for boards still leased by the last
+        self.schedule_handoff = float(os.environ.get("SCHEDULE_HANDOFF", "15"))
+        # opt-in tracemalloc accounting, see app/memory.py
+        self.memory_trace = os.environ.get("MEMORY_TRACE", "off").lower() == "on"
+        self.memory_top = int(os.environ.get("MEMORY_TOP", "10"))
+        self.memory_frames = int(os.environ.get("MEMORY_FRAMES", "1"))
+        self.memory_log_max = int(os.environ.get("MEMORY_LOG_MAX", "4096"))
+        # sampling profiler, see app/profiler.py
+        self.profile_rates = os.environ.get("PROFILE_RATES", "")
+        self.profile_interval = float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000
+        self.profile_output = os.environ.get("PROFILE_OUTPUT", "/tmp/profiles")
+        # metrics, see app/metrics.py
+        default_metrics = "off" if self.is_offline else "emf"
+        self.metrics_mode = os.environ.get("METRICS", default_metrics).lower()
+        self.metrics_namespace = os.environ.get("METRICS_NAMESPACE", self.prefix)
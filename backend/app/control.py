@@ -1,21 +1,32 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """Websocket controller."""
+import copy
 import decimal
 import json
-import logging
 import random
 import time
-from typing import Dict, List
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import Dict, Iterator, List, Optional, Union
 
-import boto3
-from botocore.client import logger
 from botocore.exceptions import ClientError, EndpointConnectionError
 
+from app import boards, channels, clients, dedupe, delivery, ratelimit, snapshots, store
 from app.config import Config
-
-logger = logging.getLogger("handler_logger")
-logger.setLevel(logging.DEBUG)
+from app.logs import get_logger
+from app.messages import (
+    DEFAULT_CHANNEL,
+    AlertBoxMessage,
+    Message,
+    MessageError,
+    SubscribeMessage,
+    decode,
+)
+from app.metrics import metrics, timed, timer
+
+logger = get_logger()
 
 config = Config()
 
@@ -32,14 +43,52 @@ class DecimalEncoder(json.JSONEncoder):
         return super(DecimalEncoder, self).default(o)
 
 
+def in_boxes(cell: Dict[str, int], boxes: List[Dict]) -> bool:
+    """Check if the cell is inside any of the boxes."""
+    for box in boxes:
+        if (
+            cell["x"] >= box["x1"]
+            and cell["x"] < box["x2"]
+            and cell["y"] >= box["y1"]
+            and cell["y"] < box["y2"]
+        ):
+            return True
+    return False
+
+
+def is_gone(e: ClientError) -> bool:
+    """Check if a management API error means the socket is gone."""
+    code = str(e.response.get("Error", {}).get("Code", ""))
+    status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return code in ("GoneException", "410") or status == 410
+
+
+def is_live(item: Dict, now: Optional[int] = None) -> bool:
+    """Check a connection record has not passed its TTL."""
+    ttl = item.get("ttl")
+    return ttl is None or int(ttl) > (now or int(time.time()))
+
+
+def alert_message(cell: Dict[str, int]) -> Dict[str, str]:
+    """Return the alert sent when a cell lights up inside an alert box."""
+    return {
+        "action": "alert",
+        "message": f"Cell {cell['x']},{cell['y']} is in an alert box",
+    }
+
+
 class Lock:
+    """A lease on a named item, taken over once its ttl has passed."""
+
     KEY = "lock"
 
-    def __init__(self, name: str) -> None:
+    def __init__(self, name: str, ttl: int = 60) -> None:
         """Initialize the Lock class."""
-        self.dynamodb = boto3.resource("dynamodb", region_name=config.region)
-        self.table = self.dynamodb.Table(config.table)
+        self.table = clients.table()
         self.name = name
+        self.ttl = ttl
+        self.owner = uuid.uuid4().hex
+        self.expires = 0
 
     @property
     def current_lock(self):
@@ -53,28 +102,26 @@ class Lock:
         return int(response.get("Item", {}).get("ttl", -1))
 
     def lock(self):
-        """Acquire the lock."""
-        if self.current_lock != -1:
-            diff = self.current_lock - int(time.time())
-            if diff < 0:
-                logger.info("Breaking lock!!!!, diff: %s", diff)
-                self.unlock()
-            else:
-                logger.info("Lock is still valid")
-                return False
+        """Acquire the lock, in one conditional write."""
+        now = int(time.time())
         try:
             self.table.put_item(
                 Item={
                     "key": self.KEY,
                     "type": self.name,
                     "value": "locked",
-                    "ttl": int(time.time()) + 60,
+                    "owner": self.owner,
+                    "ttl": now + self.ttl,
                 },
-                ConditionExpression="attribute_not_exists(#key)",
+                # an expired lock is taken over rather than deleted first
+                ConditionExpression="attribute_not_exists(#key) OR #ttl < :now",
                 ExpressionAttributeNames={
                     "#key": "key",
+                    "#ttl": "ttl",
                 },
+                ExpressionAttributeValues={":now": now},
             )
+            self.expires = now + self.ttl
             logger.info("Lock acquired %s", self.name)
             return True
         except ClientError as e:
@@ -83,16 +130,53 @@ class Lock:
                 != "ConditionalCheckFailedException"
             ):
                 raise
+            logger.info("Lock is still valid %s", self.name)
+            return False
+
+    def renew(self) -> bool:
+        """Extend the lock, returns False if it was lost."""
+        now = int(time.time())
+        try:
+            self.table.update_item(
+                Key={
+                    "key": self.KEY,
+                    "type": self.name,
+                },
+                UpdateExpression="set #ttl = :t",
+                ConditionExpression="#owner = :o",
+                ExpressionAttributeNames={"#ttl": "ttl", "#owner": "owner"},
+                ExpressionAttributeValues={":t": now + self.ttl, ":o": self.owner},
+            )
+        except ClientError as e:
+            if (
+                e.response.get("Error", {}).get("Code")
+                != "ConditionalCheckFailedException"
+            ):
+                raise
+            logger.info("Lock lost %s", self.name)
             return False
+        self.expires = now + self.ttl
+        return True
 
     def unlock(self):
-        """Release the lock."""
-        self.table.delete_item(
-            Key={
-                "key": self.KEY,
-                "type": self.name,
-            },
-        )
+        """Release the lock, unless another owner has taken it over."""
+        try:
+            self.table.delete_item(
+                Key={
+                    "key": self.KEY,
+                    "type": self.name,
+                },
+                ConditionExpression="#owner = :o",
+                ExpressionAttributeNames={"#owner": "owner"},
+                ExpressionAttributeValues={":o": self.owner},
+            )
+        except ClientError as e:
+            if (
+                e.response.get("Error", {}).get("Code")
+                != "ConditionalCheckFailedException"
+            ):
+                raise
+            return
         logger.info("Lock released %s", self.name)
 
 
@@ -100,49 +184,84 @@ class CellState:
     KEY = "state"
     TYPE = "active_cells"
 
-    def __init__(self) -> None:
-        """Initialize the ActiveCell class."""
-        self.dynamodb = boto3.resource("dynamodb", region_name=config.region)
-        self.table = self.dynamodb.Table(config.table)
+    def __init__(self, channel: str = DEFAULT_CHANNEL) -> None:
+        """Initialize the ActiveCell class for the channel's board."""
+        self.table = clients.table()
+        self.channel = channel
+        self.type = channels.scoped(self.TYPE, channel)
 
-    def _get_active(self) -> List[str]:
-        """Get all the active cells."""
+    def _version(self) -> Optional[int]:
+        """Read only the board's version, None if it does not exist yet."""
+        response = self.table.get_item(
+            Key={
+                "key": self.KEY,
+                "type": self.type,
+            },
+            ProjectionExpression="#v",
+            ExpressionAttributeNames={"#v": "version"},
+        )
+        if "Item" not in response:
+            return None
+        return int(response["Item"].get("version", 0))
+
+    def _board(self) -> boards.Board:
+        """Return the board, from the cache while its version matches."""
+        board = boards.get(self.type, self._version())
+        if board is not None:
+            return board
         response = self.table.get_item(
             Key={
                 "key": self.KEY,
-                "type": self.TYPE,
+                "type": self.type,
             }
         )
-        res = response.get("Item", {}).get(self.TYPE, None)
+        item = response.get("Item", {})
+        res = item.get(self.TYPE, None)
         if res is None:
             self.table.put_item(
                 Item={
                     "key": self.KEY,
-                    "type": self.TYPE,
+                    "type": self.type,
                     self.TYPE: [],
+                    "version": 0,
                 }
             )
-            return []
-        return res
+            return boards.put(self.type, 0, [])
+        return boards.put(self.type, int(item.get("version", 0)), res)
 
-    def clear_active(self) -> None:
-        """Clear all the active cells."""
-        self.table.update_item(
+    def _get_active(self) -> List[str]:
+        """Get all the active cells."""
+        return self._board().cells
+
+    def _write(
+        self, expression: str, cells: List[str], added: Optional[str] = None
+    ) -> None:
+        """Update the active cells, bumping the version, and cache the result."""
+        response = self.table.update_item(
             Key={
                 "key": self.KEY,
-                "type": self.TYPE,
+                "type": self.type,
             },
-            UpdateExpression="set active_cells = :i",
+            UpdateExpression=f"{expression} ADD #v :one",
+            ExpressionAttributeNames={"#v": "version"},
             ExpressionAttributeValues={
-                ":i": [],
+                ":i": cells,
+                ":one": 1,
             },
             ReturnValues="UPDATED_NEW",
         )
+        new = response.get("Attributes", {})
+        if self.TYPE in new and "version" in new:
+            boards.put(self.type, int(new["version"]), new[self.TYPE], added)
+
+    def clear_active(self) -> None:
+        """Clear all the active cells."""
+        self._write("set active_cells = :i", [])
 
     def _get_random_cell(self):
         """Get a random cell."""
         # 50 x 50 grid
-        active = self._get_active()
+        active = self._board().active
         cell = None
         while True:
             if len(active) == 2500:
@@ -161,17 +280,7 @@ class CellState:
         if not cell:
             return {}
 
-        self.table.update_item(
-            Key={
-                "key": self.KEY,
-                "type": self.TYPE,
-            },
-            UpdateExpression="set active_cells = list_append(active_cells, :i)",
-            ExpressionAttributeValues={
-                ":i": [cell],
-            },
-            ReturnValues="UPDATED_NEW",
-        )
+        self._write("set active_cells = list_append(active_cells, :i)", [cell], cell)
         return {
             "x": int(cell.split(",")[0]),
             "y": int(cell.split(",")[1]),
@@ -179,63 +288,85 @@ class CellState:
 
     def get_active_list(self):
         """Get the active cells as a dict."""
-        active = self._get_active()
-        payload = [
-            {
-                "x": int(cell.split(",")[0]),
-                "y": int(cell.split(",")[1]),
-            }
-            for cell in active
-        ]
-        return payload
+        return self._board().payload
+
+    def snapshot(self) -> delivery.Frame:
+        """Return the pre-encoded all_active_cells frame."""
+        return self._board().frame
+
+    def box_counts(self, boxes: List[Dict]) -> List[Optional[int]]:
+        """Return the number of active cells inside each box.
+
+        Malformed stored boxes count as None.
+        """
+        board = self._board()
+        corners = [boards.box_of(b) for b in boxes]
+        return [board.count(*c) if c is not None else None for c in corners]
 
 
 class Control:
-    def __init__(self, connectionId: str) -> None:
-        """Initialize the control class."""
-        self.state = CellState()
-        self.bcast = Broadcast()
+    def __init__(self, connectionId: str, domain: str = "", stage: str = "") -> None:
+        """Initialize the control class.
+
+        Collaborators are built on first use, so cheap actions such as
+        ping never construct the cell state or the broadcaster.
+        """
         self.connectionId = connectionId
-        self.stage = ""
-        self.domain = ""
+        self.stage = stage
+        self.domain = domain
         self.user = ""
-        self.dynamodb = boto3.resource("dynamodb", region_name=config.region)
-        self.table = self.dynamodb.Table(config.table)
-        self.action_map = {
-            "hello": self.action_hello,
-            "ping": self.action_ping,
-            "save_alert_box": self.action_save_alert_box,
-            "send_alert_boxes": self.action_send_alert_boxes,
-            "send_all_active_cells": self.action_send_all_active_cells,
-            "send_connection_id": self.action_send_connection_id,
-            "clear_alert_boxes": self.action_clear_alert_boxes,
-            "clear_backend_state": self.action_clear_backend_state,
-        }
-
-    def parse_message(self, message: Dict) -> None:
-        """Parse the message and call the appropriate action."""
-        self._set_by_connection_id()
-        action = message.get("action")
-        if action in self.action_map:
-            res = self.action_map[action](message)
+        self.ttl = 0
+        self.channel = DEFAULT_CHANNEL
+
+    @cached_property
+    def state(self) -> "CellState":
+        return CellState(self.channel)
+
+    @cached_property
+    def bcast(self) -> "Broadcast":
+        return Broadcast(self.channel)
+
+    @cached_property
+    def table(self):
+        return clients.table()
+
+    def parse_message(self, message: Union[Message, Dict, str, bytes]) -> None:
+        """Validate the message and call the appropriate action.
+
+        Frames that fail validation or are over the connection's rate
+        limit are answered with an error before any other backend work.
+        """
+        if not isinstance(message, Message):
+            try:
+                message = decode(message)
+            except MessageError as e:
+                self.send_message(self._status_err(str(e)))
+                return
+        if not ratelimit.allow(self.connectionId, message.action):
+            self.send_message(
+                self._status_err(f"Rate limit exceeded for {message.action}")
+            )
+            return
+        with timer(f"action.{message.action}"):
+            if self._set_by_connection_id():
+                self.refresh_ttl()
+            res = self.action_map[message.action](self, message)
             if res:
                 self.send_message(res)
-        else:
-            self.send_message(self._status_err(f"Unknown action {action}"))
 
-    def action_hello(self, _: Dict):
+    def action_hello(self, _: Message):
         return {"action": "info", "message": "Hello World!"}
 
-    def action_ping(self, _: Dict):
+    def action_ping(self, _: Message):
         return {"action": "info", "message": "pong!"}
 
-    def action_clear_backend_state(self, _: Dict):
+    def action_clear_backend_state(self, _: Message):
         """Clear the backend state."""
         self.state.clear_active()
         pl = self.action_send_all_active_cells(_)
         self.bcast.send_message(pl)
 
-    def action_clear_alert_boxes(self, _: Dict):
+    def action_clear_alert_boxes(self, _: Message):
         """Clear all the alert boxes."""
         self.table.update_item(
             Key={
@@ -250,17 +381,14 @@ class Control:
         )
         return {"action": "alert_boxes", "message": []}
 
-    def action_send_connection_id(self, _: Dict):
+    def action_send_connection_id(self, _: Message):
         return {"action": "connection_id", "message": self.connectionId}
 
-    def action_send_all_active_cells(self, _: Dict):
+    def action_send_all_active_cells(self, _: Message):
         """Send the active cells to the user."""
-        return {
-            "action": "all_active_cells",
-            "message": self.state.get_active_list(),
-        }
+        return self.state.snapshot()
 
-    def action_send_alert_boxes(self, _: Dict):
+    def action_send_alert_boxes(self, _: Message):
         """Send the alert boxes to the user."""
         boxes = self._get_alert_boxes()
         return {
@@ -268,10 +396,55 @@ class Control:
             "message": self.to_dict(boxes),
         }
 
-    def action_save_alert_box(self, data: Dict):
+    def action_subscribe(self, message: SubscribeMessage):
+        """Move the connection to another channel and send its board."""
+        if message.channel != self.channel:
+            try:
+                self.table.update_item(
+                    Key={
+                        "key": "websocket",
+                        "type": self.connectionId,
+                    },
+                    UpdateExpression="set channel = :c",
+                    ConditionExpression="attribute_exists(#type)",
+                    ExpressionAttributeNames={"#type": "type"},
+                    ExpressionAttributeValues={":c": message.channel},
+                )
+            except ClientError as e:
+                if (
+                    e.response.get("Error", {}).get("Code")
+                    != "ConditionalCheckFailedException"
+                ):
+                    raise
+                return self._status_err("Not connected")
+            channels.leave(self.table, self.connectionId, self.channel)
+            self.channel = message.channel
+            channels.join(self.table, self.connectionId, self.channel, self._member())
+            # collaborators built for the old channel are rebuilt on use
+            self.__dict__.pop("state", None)
+            self.__dict__.pop("bcast", None)
+        return self.action_send_all_active_cells(message)
+
+    def action_box_stats(self, _: Message):
+        """Send the number of active cells inside each alert box."""
+        boxes = self.to_dict(self._get_alert_boxes())
+        counts = self.state.box_counts(boxes)
+        return {
+            "action": "box_stats",
+            "message": [
+                {**box, "active": n} for box, n in zip(boxes, counts) if n is not None
+            ],
+        }
+
+    def action_save_alert_box(self, message: AlertBoxMessage):
         """Save the alert box to the database."""
-        print("action_save_alert_box", data)
-        message = data.get("message", {})
+        box = message.to_item()
+        (active,) = self.state.box_counts([box])
+        if active:
+            # cells lit before the box existed never raise an alert
+            self.send_message(
+                self._status_alert(f"{active} cells are already active in the new box")
+            )
         try:
             self.table.update_item(
                 Key={
@@ -280,35 +453,21 @@ class Control:
                 },
                 UpdateExpression="set alert_boxes = list_append(alert_boxes, :i)",
                 ExpressionAttributeValues={
-                    ":i": [
-                        {
-                            "x1": message.get("x1"),
-                            "y1": message.get("y1"),
-                            "x2": message.get("x2"),
-                            "y2": message.get("y2"),
-                        }
-                    ]
+                    ":i": [box],
                 },
                 ReturnValues="UPDATED_NEW",
             )
-            return self.action_send_alert_boxes({})
+            return self.action_send_alert_boxes(message)
         except ClientError as e:
             if e.response.get("Error", {}).get("Code") == "ValidationException":
                 self.table.put_item(
                     Item={
                         "key": "alert_box",
                         "type": self.user,
-                        "alert_boxes": [
-                            {
-                                "x1": message.get("x1"),
-                                "y1": message.get("y1"),
-                                "x2": message.get("x2"),
-                                "y2": message.get("y2"),
-                            }
-                        ],
+                        "alert_boxes": [box],
                     }
                 )
-            return self.action_send_alert_boxes({})
+            return self.action_send_alert_boxes(message)
         except Exception as e:
             logger.error(e)
             return self._status_err(str(e))
@@ -361,15 +520,59 @@ class Control:
             self.domain = response["Item"].get("domain")
             self.stage = response["Item"].get("stage")
             self.user = response["Item"].get("user")
+            self.ttl = int(response["Item"].get("ttl", 0))
+            self.channel = response["Item"].get("channel", DEFAULT_CHANNEL)
             return True
         return False
 
+    def refresh_ttl(self) -> None:
+        """Push the connection's expiry out, at most every half TTL."""
+        now = int(time.time())
+        if self.ttl - now > config.connection_ttl // 2:
+            return
+        self.ttl = now + config.connection_ttl
+        try:
+            self.table.update_item(
+                Key={
+                    "key": "websocket",
+                    "type": self.connectionId,
+                },
+                UpdateExpression="set #ttl = :t",
+                # never resurrect a record removed by $disconnect
+                ConditionExpression="attribute_exists(#type)",
+                ExpressionAttributeNames={"#ttl": "ttl", "#type": "type"},
+                ExpressionAttributeValues={":t": self.ttl},
+            )
+            self.table.update_item(
+                Key={
+                    "key": self.connectionId,
+                    "type": channels.partition(self.channel),
+                },
+                UpdateExpression="set #ttl = :t",
+                ConditionExpression="attribute_exists(#type)",
+                ExpressionAttributeNames={"#ttl": "ttl", "#type": "type"},
+                ExpressionAttributeValues={":t": self.ttl},
+            )
+        except ClientError as e:
+            if (
+                e.response.get("Error", {}).get("Code")
+                != "ConditionalCheckFailedException"
+            ):
+                raise
+
     def delete_connection(self):
-        self.table.delete_item(
+        response = self.table.delete_item(
             Key={
                 "key": "websocket",
                 "type": self.connectionId,
-            }
+            },
+            ReturnValues="ALL_OLD",
+        )
+        # the record names the channel the connection is a member of
+        channels.leave(
+            self.table,
+            self.connectionId,
+            response.get("Attributes", {}).get("channel"),
         )
 
     def save_connection(
@@ -377,11 +580,14 @@ class Control:
         domain: str,
         stage: str,
         user: str,
+        channel: str = DEFAULT_CHANNEL,
     ) -> None:
-        """Save the connection to the database."""
+        """Save the connection to the database and join its channel."""
         self.domain = domain
         self.stage = stage
         self.user = user
+        self.channel = channel
+        self.ttl = int(time.time()) + config.connection_ttl
         self.table.put_item(
             Item={
                 "key": "websocket",
@@ -389,9 +595,21 @@ class Control:
                 "domain": domain,
                 "stage": stage,
                 "user": user,
+                "channel": channel,
                 "created": int(time.time()),
+                "ttl": self.ttl,
             }
         )
+        channels.join(self.table, self.connectionId, channel, self._member())
+
+    def _member(self) -> Dict:
+        """Return the fields stored on the channel member item."""
+        return {
+            "domain": self.domain,
+            "stage": self.stage,
+            "user": self.user,
+            "ttl": self.ttl,
+        }
 
     def dump_json(self, data):
         return json.dumps(data, indent=4, cls=DecimalEncoder)
@@ -399,96 +617,213 @@ class Control:
     def to_dict(self, data):
         return json.loads(json.dumps(data, cls=DecimalEncoder))
 
-    def is_alert(self, cell: Dict[str, int]):
-        """Check if the cell is in an alert box."""
-        boxes = self._get_alert_boxes()
-        for box in boxes:
-            if (
-                cell["x"] >= box["x1"]
-                and cell["x"] < box["x2"]
-                and cell["y"] >= box["y1"]
-                and cell["y"] < box["y2"]
-            ):
-                return True
-        return False
+    def notify_cell(
+        self, cell: Dict[str, int], boxes: Optional[List[Dict]] = None
+    ) -> bool:
+        """Send an alert if the cell is inside one of the user's alert boxes."""
+        if not self.is_alert(cell, boxes):
+            return False
+        self.send_message(alert_message(cell))
+        return True
+
+    def is_alert(self, cell: Dict[str, int], boxes: Optional[List[Dict]] = None):
+        """Check if the cell is in an alert box.
+
+        `boxes` may be passed in when they were already fetched.
+        """
+        if boxes is None:
+            boxes = self._get_alert_boxes()
+        return in_boxes(cell, boxes)
 
+    @timed("deliver")
     def send_message(self, data):
-        self._set_by_connection_id()
+        if not self.domain:
+            self._set_by_connection_id()
         if not self.domain:
             raise Exception(f"No domain set for connection '{self.connectionId}'")
-        if config.is_offline or self.domain == "localhost":
-            gwapi = boto3.client(
-                "apigatewaymanagementapi",
-                endpoint_url="http://localhost:3001",
-            )
-        else:
-            gwapi = boto3.client(
-                "apigatewaymanagementapi",
-                endpoint_url=f"https://{self.domain}/{self.stage}",
-            )
+        gwapi = clients.gateway_for(self.domain, self.stage)
         try:
-            return gwapi.post_to_connection(
-                ConnectionId=self.connectionId, Data=json.dumps(data).encode("utf-8")
-            )
+            res = None
+            for frame in delivery.frames(data):
+                res = delivery.post(gwapi, self.connectionId, frame)
+            return res
         except ClientError as e:
-            if "An error occurred (410)" in str(e):
-                logger.info(f"Force removing connection id '{self.connectionId}'")
+            if is_gone(e):
+                logger.info("Force removing connection id '%s'", self.connectionId)
                 self.delete_connection()
+                return None
+            raise
         except EndpointConnectionError:
-            logger.info(f"Force removing connection id '{self.connectionId}'")
+            logger.info("Force removing connection id '%s'", self.connectionId)
             self.delete_connection()
 
+    # built once for the class, handlers are called as func(self, message)
+    action_map = {
+        "hello": action_hello,
+        "ping": action_ping,
+        "save_alert_box": action_save_alert_box,
+        "send_alert_boxes": action_send_alert_boxes,
+        "send_all_active_cells": action_send_all_active_cells,
+        "send_connection_id": action_send_connection_id,
+        "clear_alert_boxes": action_clear_alert_boxes,
+        "clear_backend_state": action_clear_backend_state,
+        "subscribe": action_subscribe,
+        "box_stats": action_box_stats,
+    }
+
 
 class Broadcast:
-    def __init__(self) -> None:
-        """Initialize the broadcast class."""
-        self.dynamodb = boto3.resource("dynamodb", region_name=config.region)
-        self.table = self.dynamodb.Table(config.table)
-        self.router = SnsRouter()
+    def __init__(self, channel: str = DEFAULT_CHANNEL) -> None:
+        """Initialize the broadcast class for the channel's members."""
+        self.table = clients.table()
+        self.channel = channel
+
+    @cached_property
+    def router(self) -> "SnsRouter":
+        # small audiences are delivered directly and never publish
+        return SnsRouter()
+
+    def iterate_connections(self):
+        """Iterate over the channel's live connection records."""
+        now = int(time.time())
+        for item in channels.members(self.table, self.channel):
+            # expired members linger until DynamoDB's TTL sweep removes them
+            if is_live(item, now):
+                dom = item.get("domain")
+                if not dom == "localhost":
+                    yield item
 
     def iterate_connection_ids(self):
         """Iterate over all connections."""
-        response = self.table.scan()
-        for item in response.get("Items", []):
-            if item.get("key") == "websocket":
-                dom = item.get("domain")
-                if not dom == "localhost":
-                    yield str(item.get("type"))
+        for item in self.iterate_connections():
+            yield str(item.get("type"))
+
+    def _direct(self, connections: List[Dict]) -> bool:
+        """Return True if the audience is small enough to skip SNS."""
+        return len(connections) <= config.direct_fanout_max
 
+    def _control(self, item: Dict) -> "Control":
+        """Build a Control hydrated from a scanned connection record."""
+        control = Control(str(item.get("type")), item.get("domain"), item.get("stage"))
+        control.user = item.get("user")
+        return control
+
+    @timed("fanout.cell_notify")
     def cell_notify(self, cell: Dict[str, int]):
-        """Check if the cell is in an alert box."""
-        for connection_id in self.iterate_connection_ids():
-            pl = {
-                "connection_id": connection_id,
-                "data": {
-                    "cell": cell,
-                },
-            }
-            self.router.publish(ROUTE_CELL_NOTIFY, pl)
+        """Alert the connections that have the cell in an alert box.
+
+        Alert boxes for every connected user are prefetched in batches,
+        so only alerting connections are sent to.
+        """
+        connections = list(self.iterate_connections())
+        boxes = store.alert_boxes(
+            clients.dynamodb(), {item.get("user") for item in connections}
+        )
+        targets = [
+            item
+            for item in connections
+            if in_boxes(cell, boxes.get(item.get("user"), []))
+        ]
+        self._deliver(targets, alert_message(cell))
 
+    @timed("fanout.send_message")
     def send_message(self, data):
-        """Send a message to all connections."""
-        for connection_id in self.iterate_connection_ids():
-            pl = {
-                "connection_id": connection_id,
-                "data": data,
+        """Send a message to all connections.
+
+        Snapshot frames fanned out through SNS are stamped, so deliveries
+        overtaken by a newer snapshot of the same kind are dropped.
+        """
+        connections = list(self.iterate_connections())
+        snapshot = None
+        kind = snapshots.kind_of(data)
+        # direct posts go out in order, only SNS needs the stamp
+        if kind and not self._direct(connections):
+            # boards are independent, so are their snapshots
+            kind = channels.scoped(kind, self.channel)
+            seq = snapshots.stamp(kind)
+            if config.snapshot_window and snapshots.superseded(kind, seq):
+                logger.info("Coalesced %s snapshot %s", kind, seq)
+                return
+            snapshot = {"kind": kind, "seq": seq}
+        self._deliver(connections, data, snapshot)
+
+    def _deliver(
+        self, connections: List[Dict], data, snapshot: Optional[Dict] = None
+    ) -> None:
+        """Send data to the scanned connections, directly or through SNS.
+
+        Connections still throttled after the direct post's retries are
+        handed to SNS, whose retries deliver the frame later.
+        """
+        if self._direct(connections):
+            throttled = []
+            for item in connections:
+                try:
+                    # gone connections are removed by send_message itself
+                    self._control(item).send_message(data)
+                except delivery.DeliveryError as e:
+                    logger.warning(
+                        "Direct send to %s throttled out: %s", item["type"], e
+                    )
+                    throttled.append(item)
+            if not throttled:
+                return
+            connections = throttled
+        # large frames are compressed once for every publish
+        for body in delivery.bodies(data):
+            if snapshot:
+                body["snapshot"] = snapshot
+            for message in self._messages(connections, body):
+                self.router.publish(ROUTE_SEND_MESSAGE, message)
+
+    def _messages(self, connections: List[Dict], body: Dict) -> Iterator[Dict]:
+        """Split the connections into SNS messages sharing one body.
+
+        SNS invokes the handler once per message, so each message carries
+        the frame for up to SNS_GROUP_MAX connections, within SNS_MAX.
+        """
+        base = len(json.dumps(body).encode("utf-8")) + len(', "connections": []')
+        targets: List[Dict] = []
+        size = base
+        for item in connections:
+            target = {
+                "connection_id": str(item.get("type")),
+                # lets the SNS handler post without re-reading the record
+                "connection": store.hydrated(item),
             }
-            self.router.publish(ROUTE_SEND_MESSAGE, pl)
+            n = len(json.dumps(target).encode("utf-8")) + len(", ")
+            full = len(targets) >= config.sns_group_max or size + n > delivery.SNS_MAX
+            if targets and full:
+                yield {**body, "connections": targets}
+                targets, size = [], base
+            targets.append(target)
+            size += n
+        if targets:
+            yield {**body, "connections": targets}
+
 
 class SnsRouter:
     """Sns Router Handler for longer jobs."""
 
     def __init__(self):
         """Initialize the SnsRouter."""
-        self.sns = boto3.client("sns", region_name=config.region)
-        logger.info("Topic ARN: %s", config.sns_topic)
+        self.sns = clients.sns()
+        logger.debug("Topic ARN: %s", config.sns_topic)
 
     def publish(self, action: str, message: Dict):
-        """Send a message to the Sns topic."""
-        self.sns.publish(
+        """Send a message to the Sns topic.
+
+        Raises ValueError for messages over SNS_MAX, see delivery.bodies.
+        """
+        body = json.dumps(message)
+        size = len(body.encode("utf-8"))
+        if size > delivery.SNS_MAX:
+            raise ValueError(f"{action} message of {size} bytes is over the SNS limit")
+        delivery.publish(
+            self.sns,
             Subject=action,
             TopicArn=config.sns_topic,
-            Message=json.dumps(message),
+            Message=body,
         )
 
 
@@ -499,16 +834,41 @@ class SnsRecordHandler:
         """Initialize the SnsRecord."""
         self.record = record
         self.action = record["Sns"]["Subject"]
+        self.message_id = record["Sns"].get("MessageId")
+        # what dedupe claims, one per connection of a grouped message
+        self.claim_id = self.message_id
         self.message = json.loads(record["Sns"]["Message"])
         self.connection_id = self.message.get("connection_id")
-        self.data = self.message.get("data", {})
-        self.dynamodb = boto3.resource("dynamodb", region_name=config.region)
-        self.table = self.dynamodb.Table(config.table)
+        self.connection = self.message.get("connection")
+        self.snapshot = self.message.get("snapshot")
+        self.data = delivery.unpack(self.message)
         self.func_map = {
             ROUTE_SEND_MESSAGE: self.action_send_message,
             ROUTE_CELL_NOTIFY: self.action_cell_notify,
         }
 
+    @classmethod
+    def expand(cls, record) -> List["SnsRecordHandler"]:
+        """Return a handler per connection the record is addressed to."""
+        handler = cls(record)
+        targets = handler.message.get("connections")
+        if targets is None:
+            return [handler]
+        return [handler._for(target) for target in targets]
+
+    def _for(self, target: Dict) -> "SnsRecordHandler":
+        # the frame is parsed once and shared by every connection
+        handler = copy.copy(self)
+        handler.connection_id = target.get("connection_id")
+        handler.connection = target.get("connection")
+        if self.message_id:
+            handler.claim_id = f"{self.message_id}#{handler.connection_id}"
+        handler.func_map = {
+            ROUTE_SEND_MESSAGE: handler.action_send_message,
+            ROUTE_CELL_NOTIFY: handler.action_cell_notify,
+        }
+        return handler
+
     def action_cell_notify(self):
         if not all([self._check_valid_connection_id(), self._check_valid_data()]):
             return
@@ -516,22 +876,18 @@ class SnsRecordHandler:
         control = Control(self.connection_id)
         control._set_by_connection_id()
         if control.domain == "localhost":
-            logger.info(f"Skipping localhost connection {self.connection_id}")
+            logger.debug("Skipping localhost connection %s", self.connection_id)
             return
-        is_alert = control.is_alert(cell)
-        if not is_alert:
-            logger.info(f"Skipping non-alert connection {self.connection_id} / {cell}")
+        if not control.notify_cell(cell):
+            logger.debug(
+                "Skipping non-alert connection %s / %s", self.connection_id, cell
+            )
             return
-        logger.info(f"Sending alert to {self.connection_id} / {cell}")
-        message = {
-            "action": "alert",
-            "message": f"Cell {cell['x']},{cell['y']} is in an alert box",
-        }
-        control.send_message(message)
+        logger.info("Sent alert to %s / %s", self.connection_id, cell)
 
     def action_send_message(self):
         """Send a message to the websocket."""
-        control = Control(self.message["connection_id"])
+        control = Control(self.connection_id)
         if not all([self._check_valid_connection_id(), self._check_valid_data()]):
             return
         control.send_message(self.data)
@@ -539,7 +895,7 @@ class SnsRecordHandler:
     def handle_message(self):
         """Handle the message."""
         if self.action not in self.func_map:
-            logger.error(f"Unknown action: {self.action}")
+            logger.error("Unknown action: %s", self.action)
             return
         self.func_map[self.action]()
 
@@ -557,6 +913,154 @@ class SnsRecordHandler:
             return False
         return True
 
+    def is_valid(self):
+        """Check the record can be handled."""
+        if self.action not in self.func_map:
+            logger.error("Unknown action: %s", self.action)
+            return False
+        return all([self._check_valid_connection_id(), self._check_valid_data()])
+
+
+class SnsBatchHandler:
+    """Handle the SNS records of one invocation as a unit.
+
+    A record addressed to a group of connections is expanded into one
+    per connection. Records are grouped by connection, the connection
+    records and alert boxes they need are prefetched with BatchGetItem,
+    and connections are delivered to concurrently. Frames for the same
+    connection go through an Outbox, keeping their arrival order and
+    dropping snapshots that a newer one in the batch supersedes. Records
+    already delivered to their connection are dropped first, see
+    app/dedupe.py.
+    """
+
+    def __init__(self, records: List[Dict]) -> None:
+        """Initialize the SnsBatchHandler."""
+        self.records = [
+            handler for record in records for handler in SnsRecordHandler.expand(record)
+        ]
+        self.dynamodb = clients.dynamodb()
+        self.connections: Dict[str, Dict] = {}
+        self.boxes: Dict[str, List[Dict]] = {}
+        self.snapshots: Dict[str, int] = {}
+        self.failed: List[str] = []
+
+    def _claim(self) -> None:
+        fresh = []
+        try:
+            for record in self.records:
+                if dedupe.claim(record.claim_id):
+                    fresh.append(record)
+        except Exception:
+            # kept claims would drop the retry as a duplicate
+            self._release(fresh)
+            raise
+        if len(fresh) < len(self.records):
+            logger.info("Dropping %s duplicate records", len(self.records) - len(fresh))
+            metrics.record(
+                "sns.duplicates", len(self.records) - len(fresh), unit="Count"
+            )
+        self.records = fresh
+
+    def _release(self, records: List[SnsRecordHandler]) -> None:
+        for record in records:
+            try:
+                dedupe.release(record.claim_id)
+            except Exception as e:
+                logger.error("Releasing %s failed: %s", record.claim_id, e)
+
+    def _group(self) -> Dict[str, List[SnsRecordHandler]]:
+        groups: Dict[str, List[SnsRecordHandler]] = {}
+        for record in self.records:
+            if record.is_valid():
+                groups.setdefault(record.connection_id, []).append(record)
+        return groups
+
+    def _prefetch(self, groups: Dict[str, List[SnsRecordHandler]]) -> None:
+        # records published with a hydrated connection need no read
+        for cid, records in groups.items():
+            if records[0].connection:
+                self.connections[cid] = records[0].connection
+        missing = [cid for cid in groups if cid not in self.connections]
+        self.connections.update(store.connections(self.dynamodb, missing))
+        users = {
+            self.connections[cid].get("user")
+            for cid, records in groups.items()
+            if cid in self.connections
+            and any(r.action == ROUTE_CELL_NOTIFY for r in records)
+        }
+        self.boxes = store.alert_boxes(self.dynamodb, users)
+        seen: Dict[str, int] = {}
+        for record in self.records:
+            if record.snapshot:
+                kind, seq = record.snapshot["kind"], record.snapshot["seq"]
+                seen[kind] = max(seen.get(kind, 0), seq)
+        if seen:
+            self.snapshots = snapshots.newest(seen)
+
+    def _stale(self, record: SnsRecordHandler) -> bool:
+        """Check if a newer snapshot of the record's kind was broadcast."""
+        if not record.snapshot:
+            return False
+        return self.snapshots.get(record.snapshot["kind"], 0) > record.snapshot["seq"]
+
+    def _deliver(self, connection_id: str, records: List[SnsRecordHandler]) -> None:
+        item = self.connections.get(connection_id)
+        if item is None:
+            logger.info("Skipping unknown connection %s", connection_id)
+            return
+        control = Control(connection_id, item.get("domain"), item.get("stage"))
+        control.user = item.get("user")
+        outbox = delivery.Outbox()
+        for record in records:
+            if self._stale(record):
+                logger.debug("Dropping superseded snapshot for %s", connection_id)
+                continue
+            if record.action == ROUTE_SEND_MESSAGE:
+                outbox.put(record.data)
+                continue
+            if control.domain == "localhost":
+                logger.debug("Skipping localhost connection %s", connection_id)
+                continue
+            cell = record.data.get("cell")
+            if control.is_alert(cell, self.boxes.get(control.user, [])):
+                outbox.put(alert_message(cell))
+        try:
+            outbox.flush(control.send_message)
+        except delivery.DeliveryError as e:
+            logger.error("Delivery to %s throttled out: %s", connection_id, e)
+            self.failed.append(connection_id)
+        except Exception as e:
+            logger.error("Delivery to %s failed: %s", connection_id, e)
+
+    def handle(self) -> None:
+        """Handle every record in the batch."""
+        # releases what it claimed if a claim fails partway
+        self._claim()
+        groups = self._group()
+        if not groups:
+            return
+        try:
+            self._prefetch(groups)
+            workers = min(len(groups), config.sns_workers)
+            if workers == 1:
+                for connection_id, records in groups.items():
+                    self._deliver(connection_id, records)
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    list(pool.map(self._deliver, groups.keys(), groups.values()))
+        except Exception:
+            # the whole batch is retried, none of it was delivered for sure
+            self._release(self.records)
+            raise
+        if self.failed:
+            # only the throttled connections are delivered again on retry
+            self._release([r for cid in self.failed for r in groups[cid]])
+            # fail the invocation so SNS retries rather than dropping frames
+            raise delivery.DeliveryError(
+                f"Throttled delivery to {len(self.failed)} connections"
+            )
+
 
 def test_send_message():
     _id = """
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""dedupe.py: Drops SNS records that were already delivered.
+
+SNS delivers at least once, so a record may arrive again in the same or
+another container. Each MessageId is claimed with one conditional write
+of a dedupe item that expires after DEDUPE_TTL seconds, and ids seen by
+the container are kept in an LRU so repeats there cost no write at all.
+A claim is released when its delivery fails, so the retry is handled.
+Messages addressed to a group of connections are claimed per connection,
+so a retry only reaches the connections that were not delivered to.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from botocore.exceptions import ClientError
+
+from app import clients
+from app.config import Config
+from app.logs import get_logger
+
+config = Config()
+
+logger = get_logger()
+
+KEY = "dedupe"
+# message ids remembered per container, least recently seen are dropped
+MAX_IDS = 10000
+# claims are released only by the container that made them
+OWNER = uuid.uuid4().hex
+
+_seen: "OrderedDict[str, bool]" = OrderedDict()
+_seen_lock = threading.Lock()
+
+
+def _remember(message_id: str) -> bool:
+    """Add the id to the LRU, returns False if it was there already."""
+    with _seen_lock:
+        if message_id in _seen:
+            _seen.move_to_end(message_id)
+            return False
+        _seen[message_id] = True
+        if len(_seen) > MAX_IDS:
+            _seen.popitem(last=False)
+        return True
+
+
+def claim(message_id: Optional[str]) -> bool:
+    """Claim a message, returns False if it was delivered already."""
+    if not message_id:
+        return True
+    if not _remember(message_id):
+        return False
+    now = int(time.time())
+    try:
+        clients.table().put_item(
+            Item={
+                "key": KEY,
+                "type": message_id,
+                "owner": OWNER,
+                "ttl": now + config.dedupe_ttl,
+            },
+            # DynamoDB deletes expired items lazily, they no longer count
+            ConditionExpression="attribute_not_exists(#key) OR #ttl < :now",
+            ExpressionAttributeNames={"#key": "key", "#ttl": "ttl"},
+            ExpressionAttributeValues={":now": now},
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+            # not known to be a duplicate, so it is delivered
+            forget(message_id)
+            raise
+        return False
+    return True
+
+
+def forget(message_id: Optional[str]) -> None:
+    """Drop the id from the LRU."""
+    with _seen_lock:
+        _seen.pop(message_id, None)
+
+
+def release(message_id: Optional[str]) -> None:
+    """Release a claim so the message is delivered when it comes again."""
+    if not message_id:
+        return
+    forget(message_id)
+    try:
+        clients.table().delete_item(
+            Key={"key": KEY, "type": message_id},
+            ConditionExpression="#owner = :o",
+            ExpressionAttributeNames={"#owner": "owner"},
+            ExpressionAttributeValues={":o": OWNER},
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+            raise
+        logger.debug("Claim on %s was not ours", message_id)
+
+
+def reset() -> None:
+    """Forget every message id."""
+    with _seen_lock:
+        _seen.clear()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""delivery.py: Throttle-aware delivery to API Gateway and SNS.
+
+Every call goes through a token bucket for its endpoint, so a container
+does not exceed its share of the account limit, and throttling errors
+are retried with full-jitter exponential backoff instead of dropping the
+frame. Frames for one connection go through an `Outbox`, which keeps
+them in order and lets a newer snapshot replace an older queued one.
+
+Frames of COMPRESS_MIN_BYTES or more are zlib compressed, base64 encoded
+and sent as one or more `chunk` frames, each at most CHUNK_MAX_BYTES:
+
+    {"action": "chunk", "message": {"id": "...", "seq": 0, "total": 2,
+     "encoding": "zlib+base64", "data": "..."}}
+
+Clients concatenate the `data` of chunks 0..total-1 sharing an `id`,
+decode and inflate it, and handle the result as an ordinary frame.
+
+SNS messages carry the frame packed the same way. A frame too large for
+one SNS message even packed is published as its chunk frames instead,
+one per message, which the SNS handler posts as they are.
+"""
+import base64
+import json
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from functools import cached_property
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from app.config import Config
+from app.logs import get_logger
+from app.store import backoff
+
+config = Config()
+
+logger = get_logger()
+
+THROTTLE_CODES = {
+    "LimitExceededException",
+    "TooManyRequestsException",
+    "ThrottlingException",
+    "Throttling",
+    "ThrottledException",
+    "RequestLimitExceeded",
+    "ProvisionedThroughputExceededException",
+}
+
+# frames that replace the whole client-side state of a kind
+SNAPSHOT_KINDS = {
+    "all_active_cells": "board",
+    "board_cleared": "board",
+    "alert_boxes": "alert_boxes",
+}
+
+
+ENCODING = "zlib+base64"
+CHUNK_ACTION = "chunk"
+# SNS rejects messages over 256KB
+SNS_MAX = 256 * 1024
+# room kept in an SNS message for the snapshot stamp and connections
+SNS_RESERVE = 4 * 1024
+
+
+class DeliveryError(Exception):
+    """A call was still throttled after every retry."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens if available, without waiting."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        """Take tokens, sleeping until they are available."""
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket(endpoint: str, rate: float, burst: float) -> TokenBucket:
+    """Return the shared bucket for an endpoint."""
+    with _buckets_lock:
+        if endpoint not in _buckets:
+            _buckets[endpoint] = TokenBucket(rate, burst)
+        return _buckets[endpoint]
+
+
+def is_throttle(e: ClientError) -> bool:
+    """Check if an error is a throttle that is safe to retry."""
+    error = e.response.get("Error", {})
+    status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return error.get("Code") in THROTTLE_CODES or status == 429
+
+
+def call(limiter: TokenBucket, func: Callable, **kwargs) -> Any:
+    """Call func(**kwargs) under the rate limit, retrying throttles."""
+    for attempt in range(config.delivery_attempts):
+        limiter.acquire()
+        try:
+            return func(**kwargs)
+        except ClientError as e:
+            if not is_throttle(e):
+                raise
+            if attempt + 1 == config.delivery_attempts:
+                raise DeliveryError(str(e)) from e
+            delay = backoff(attempt + 1)
+            logger.info("Throttled, retrying in %.3fs: %s", delay, e)
+            time.sleep(delay)
+
+
+def post(gwapi, connection_id: str, data: bytes) -> Any:
+    """Post a frame to a connection through its endpoint's bucket."""
+    limiter = bucket(
+        gwapi.meta.endpoint_url if hasattr(gwapi, "meta") else "gateway",
+        config.delivery_rate,
+        config.delivery_burst,
+    )
+    return call(
+        limiter, gwapi.post_to_connection, ConnectionId=connection_id, Data=data
+    )
+
+
+def publish(sns, **kwargs) -> Any:
+    """Publish to SNS under the publish rate limit."""
+    limiter = bucket("sns", config.publish_rate, config.publish_burst)
+    return call(limiter, sns.publish, **kwargs)
+
+
+class Frame(dict):
+    """A frame that is encoded once, however many sockets it is sent to."""
+
+    @cached_property
+    def encoded(self) -> bytes:
+        return json.dumps(self).encode("utf-8")
+
+    @cached_property
+    def frames(self) -> List[bytes]:
+        return chunked(self.encoded)
+
+
+class Encoded(bytes):
+    """A websocket message already in its wire form, posted as it is."""
+
+
+def encode(data: Any) -> bytes:
+    """Return the wire form of a frame."""
+    if isinstance(data, Frame):
+        return data.encoded
+    if isinstance(data, Encoded):
+        return bytes(data)
+    return json.dumps(data).encode("utf-8")
+
+
+def compress(raw: bytes) -> str:
+    """Return `raw` compressed, as text that fits in JSON."""
+    return base64.b64encode(zlib.compress(raw)).decode("ascii")
+
+
+def decompress(body: str) -> bytes:
+    """Reverse `compress`."""
+    return zlib.decompress(base64.b64decode(body))
+
+
+def chunked(raw: bytes) -> List[bytes]:
+    """Return the websocket messages carrying an encoded frame."""
+    if len(raw) < config.compress_min:
+        return [raw]
+    body = compress(raw)
+    size = config.chunk_max
+    pieces = [body[i : i + size] for i in range(0, len(body), size)]
+    message_id = uuid.uuid4().hex
+    return [
+        json.dumps(
+            {
+                "action": CHUNK_ACTION,
+                "message": {
+                    "id": message_id,
+                    "seq": seq,
+                    "total": len(pieces),
+                    "encoding": ENCODING,
+                    "data": piece,
+                },
+            }
+        ).encode("utf-8")
+        for seq, piece in enumerate(pieces)
+    ]
+
+
+def frames(data: Any) -> List[bytes]:
+    """Return the websocket messages carrying a frame."""
+    if isinstance(data, Frame):
+        return data.frames
+    if isinstance(data, Encoded):
+        return [bytes(data)]
+    return chunked(encode(data))
+
+
+def pack(data: Any) -> Dict[str, Any]:
+    """Return the SNS envelope fields carrying a frame."""
+    raw = encode(data)
+    if len(raw) < config.compress_min:
+        return {"data": data}
+    return {"packed": compress(raw)}
+
+
+def bodies(data: Any) -> List[Dict[str, Any]]:
+    """Return the SNS envelope fields carrying a frame, one per message."""
+    body = pack(data)
+    if len(json.dumps(body).encode("utf-8")) + SNS_RESERVE <= SNS_MAX:
+        return [body]
+    # the client reassembles the chunks, whichever order they arrive in
+    return [{"frame": chunk.decode("utf-8")} for chunk in frames(data)]
+
+
+def unpack(message: Dict[str, Any]) -> Any:
+    """Return the frame carried by an SNS envelope."""
+    if "packed" in message:
+        return Frame(json.loads(decompress(message["packed"])))
+    if "frame" in message:
+        return Encoded(message["frame"].encode("utf-8"))
+    return message.get("data", {})
+
+
+class Outbox:
+    """Ordered frames queued for one connection.
+
+    A snapshot frame supersedes any queued snapshot of the same kind: the
+    older one is dropped and the newer one takes the latest position, so
+    incremental frames queued in between are still applied before it.
+    """
+
+    def __init__(self) -> None:
+        self._frames: "OrderedDict[int, Tuple[Optional[str], Any]]" = OrderedDict()
+        self._kinds: Dict[str, int] = {}
+        self._seq = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def put(self, data: Any) -> None:
+        kind = None
+        if isinstance(data, dict):
+            kind = SNAPSHOT_KINDS.get(data.get("action"))
+        if kind is not None and kind in self._kinds:
+            del self._frames[self._kinds.pop(kind)]
+            self.coalesced += 1
+        self._seq += 1
+        self._frames[self._seq] = (kind, data)
+        if kind is not None:
+            self._kinds[kind] = self._seq
+
+    def drain(self) -> List[Any]:
+        """Return the queued frames in order and empty the outbox."""
+        frames = [data for _, data in self._frames.values()]
+        self._frames.clear()
+        self._kinds.clear()
+        return frames
+
+    def flush(self, send: Callable[[Any], Any]) -> None:
+        """Send every queued frame in order."""
+        for data in self.drain():
+            send(data)
@@ -1,16 +1,11 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """DynamoDB Stream Handler."""
-import boto3
+from app import channels
+from app.control import Broadcast, CellState
+from app.logs import get_logger
 
-import logging
-from app.config import Config
-from app.control import Broadcast
-
-config = Config()
-
-logger = logging.getLogger("handler_logger")
-logger.setLevel(logging.DEBUG)
+logger = get_logger()
 
 
 class Record:
@@ -19,8 +14,6 @@ class Record:
     def __init__(self, record):
         """Initialize Record."""
         self.record = record
-        db = boto3.resource("dynamodb", region_name=config.region)
-        self.table = db.Table(config.table)
 
     def __str__(self):
         """Return string representation."""
@@ -54,8 +47,16 @@ class ActiveCells(Record):
 
     @property
     def is_state_record(self):
-        """Return True if state record."""
-        return self.keys == ("active_cells", "state")
+        """Return True if state record, of any channel's board."""
+        _type, _key = self.keys
+        return _key == CellState.KEY and (
+            _type == CellState.TYPE or _type.startswith(f"{CellState.TYPE}#")
+        )
+
+    @property
+    def channel(self):
+        """Return the channel whose board changed."""
+        return channels.unscoped(self.keys[0])
 
     @property
     def new_image(self):
@@ -85,10 +86,10 @@ class ActiveCells(Record):
 
     def send_alerts(self) -> None:
         """Return dict representation."""
-        bcast = Broadcast()
         if not self.is_state_record:
             logger.info("Not a state record, exiting: %s", self.keys)
             return
+        bcast = Broadcast(self.channel)
 
         logger.info("New active cells: %s, sending broadcast", self.new_active_cells)
         for txt in self.new_active_cells:
@@ -14,27 +14,36 @@
 import json
 import time
 import urllib.request
-import logging
 
 from jose import jwk, jwt
 from jose.utils import base64url_decode
 
 from app.config import Config
+from app.logs import get_logger
+from app.metrics import timed
+
 config = Config()
 
-logger = logging.getLogger("handler_logger")
-logger.setLevel(logging.DEBUG)
+logger = get_logger()
 
 
 keys_url = "https://cognito-idp.{}.amazonaws.com/{}/.well-known/jwks.json".format(
     config.region, config.userpool_id
 )
 # instead of re-downloading the public keys every time
-# we download them only on cold start
+# we download them once per container, on first use
 # https://aws.amazon.com/blogs/compute/container-reuse-in-lambda/
-with urllib.request.urlopen(keys_url) as f:
-    response = f.read()
-keys = json.loads(response.decode("utf-8"))["keys"]
+keys = None
+
+
+def get_keys():
+    """Return the user pool public keys, downloading them once."""
+    global keys
+    if keys is None:
+        with urllib.request.urlopen(keys_url) as f:
+            response = f.read()
+        keys = json.loads(response.decode("utf-8"))["keys"]
+    return keys
 
 
 class JwtToken:
@@ -86,11 +95,13 @@ class JwtToken:
             "status": self.status,
         }
 
+    @timed("jwt.verify")
     def _get_claims(self):
         # get the kid from the headers prior to verification
         headers = jwt.get_unverified_headers(self.token)
         kid = headers["kid"]
         # search for the kid in the downloaded public keys
+        keys = get_keys()
         key_index = -1
         for i in range(len(keys)):
             if kid == keys[i]["kid"]:
@@ -108,7 +119,7 @@ class JwtToken:
         # verify the signature
         if not public_key.verify(message.encode("utf8"), decoded_signature):
             return {}, "Signature verification failed"
-        logger.info("Signature successfully verified")
+        logger.debug("Signature successfully verified")
         # since we passed the verification, we can now safely
         # use the unverified claims
         claims = jwt.get_unverified_claims(self.token)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""logs.py: Structured, sampled logging for the hot paths.
+
+Events are never rendered eagerly. `log_event` first decides whether the
+route is sampled, and only then hands the logger a lazy summary that is
+built and size-capped when (and if) a handler actually emits the record.
+
+LOG_SAMPLE_RATES is a comma separated list of `route=rate` pairs, `*`
+sets the default rate, e.g. `*=0.01,connect=1`.
+"""
+import json
+import logging
+import random
+from typing import Any, Dict
+
+from app.config import Config
+
+LOGGER_NAME = "handler_logger"
+
+config = Config()
+
+
+def parse_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for part in spec.split(","):
+        route, sep, rate = part.partition("=")
+        if not sep:
+            continue
+        rates[route.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+SAMPLE_RATES = parse_rates(config.log_sample_rates)
+DEFAULT_RATE = SAMPLE_RATES.get("*", 1.0)
+
+
+def get_logger() -> logging.Logger:
+    """Return the shared handler logger at the configured level."""
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(config.log_level)
+    return logger
+
+
+def sampled(route: str) -> bool:
+    """Return True if this invocation of `route` should log its event."""
+    rate = SAMPLE_RATES.get(route, DEFAULT_RATE)
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+def summarize(event: Any) -> Dict[str, Any]:
+    """Return the few fields of a Lambda event worth logging."""
+    if not isinstance(event, dict):
+        return {"type": type(event).__name__}
+    ctx = event.get("requestContext")
+    if isinstance(ctx, dict):
+        return {
+            "route": ctx.get("routeKey"),
+            "event_type": ctx.get("eventType"),
+            "cid": ctx.get("connectionId"),
+            "body_bytes": len(event.get("body") or ""),
+        }
+    records = event.get("Records")
+    if isinstance(records, list):
+        first = records[0] if records else {}
+        return {
+            "records": len(records),
+            "source": first.get("EventSource") or first.get("eventSource"),
+            "subject": first.get("Sns", {}).get("Subject"),
+            "event_name": first.get("eventName"),
+        }
+    return {"keys": sorted(str(k) for k in event)[:10]}
+
+
+class Structured:
+    """Log message rendered as a JSON line on first use."""
+
+    __slots__ = ("fields", "limit")
+
+    def __init__(self, fields: Dict[str, Any], limit: int) -> None:
+        self.fields = fields
+        self.limit = limit
+
+    def __str__(self) -> str:
+        fields = dict(self.fields)
+        if "event" in fields:
+            fields["event"] = summarize(fields["event"])
+        line = json.dumps(fields, default=str)
+        if len(line) > self.limit:
+            return line[: self.limit] + "...(truncated)"
+        return line
+
+
+def log_event(
+    logger: logging.Logger, route: str, msg: str, event: Any, **fields: Any
+) -> None:
+    """Log a summary of `event` for the sampled fraction of `route` calls."""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    if not (logger.isEnabledFor(logging.DEBUG) or sampled(route)):
+        return
+    fields = {"msg": msg, "route": route, **fields, "event": event}
+    logger.info("%s", Structured(fields, config.log_event_max))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""memory.py: Opt-in per-invocation memory accounting.
+
+With MEMORY_TRACE=on, tracemalloc runs for the life of the container and
+each wrapped invocation is bracketed by snapshots. The report gives how
+far the invocation's traced memory peaked above its start, its net
+growth, the growth since the container's first invocation (a steady
+climb across warm invocations points at a leaking cache), the process
+max RSS and the top allocation sites by growth. It is logged as one JSON
+line and recorded as `memory.*` metrics. Tracing slows every allocation,
+so leave it off unless sizing memory or hunting a leak.
+"""
+import functools
+import resource
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from app.config import Config
+from app.logs import Structured, get_logger
+from app.metrics import metrics
+
+config = Config()
+
+logger = get_logger()
+
+# tracemalloc's and this module's bookkeeping is not the application's
+_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+]
+
+# traced application bytes after the container's first invocation
+_baseline: Optional[int] = None
+
+
+def enabled() -> bool:
+    """Check if memory accounting is switched on."""
+    return config.memory_trace
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_FILTERS)
+
+
+def _top(stats: List[tracemalloc.StatisticDiff]) -> List[Dict]:
+    return [
+        {
+            "site": str(stat.traceback[0]),
+            "size_diff_kb": round(stat.size_diff / 1024, 1),
+            "count_diff": stat.count_diff,
+        }
+        for stat in stats[: config.memory_top]
+        if stat.size_diff
+    ]
+
+
+def report(route: str, before: tracemalloc.Snapshot, start: int) -> Dict:
+    """Build, log and record the memory report of one invocation."""
+    global _baseline
+    _, peak = tracemalloc.get_traced_memory()
+    # sizes come from the filtered snapshots, which leave out the
+    # snapshots' own memory; the peak cannot, it includes `before`
+    stats = _snapshot().compare_to(before, "lineno")
+    total = sum(stat.size for stat in stats)
+    if _baseline is None:
+        _baseline = total
+    fields = {
+        "msg": "Memory",
+        "route": route,
+        "peak_kb": round((peak - start) / 1024, 1),
+        "growth_kb": round(sum(stat.size_diff for stat in stats) / 1024, 1),
+        "container_growth_kb": round((total - _baseline) / 1024, 1),
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "top": _top(stats),
+    }
+    for name in ("peak_kb", "growth_kb", "container_growth_kb", "max_rss_kb"):
+        metrics.record(f"memory.{name[:-3]}", fields[name], unit="Kilobytes")
+    logger.info("%s", Structured(fields, config.memory_log_max))
+    return fields
+
+
+def accounted(route: str) -> Callable:
+    """Decorate a Lambda entry point to report its memory use."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(event, context):
+            if not enabled():
+                return func(event, context)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(config.memory_frames)
+            before = _snapshot()
+            start, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            try:
+                return func(event, context)
+            finally:
+                report(route, before, start)
+
+        return wrapper
+
+    return decorator
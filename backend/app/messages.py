@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""messages.py: Typed websocket message schemas."""
+import json
+import re
+from typing import Any, Dict, Type, Union
+
+GRID_SIZE = 50
+DEFAULT_CHANNEL = "default"
+CHANNEL_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+class MessageError(ValueError):
+    """Raised when an inbound frame does not match its action schema."""
+
+
+class Message:
+    """Message without a payload, only the action is carried."""
+
+    __slots__ = ("action",)
+
+    def __init__(self, action: str) -> None:
+        self.action = action
+
+    @classmethod
+    def from_payload(cls, action: str, _: Any) -> "Message":
+        """Build the message from the raw `message` payload."""
+        return cls(action)
+
+
+class AlertBoxMessage(Message):
+    """Alert box coordinates, normalized so that x1 < x2 and y1 < y2."""
+
+    __slots__ = ("x1", "y1", "x2", "y2")
+
+    def __init__(self, action: str, x1: int, y1: int, x2: int, y2: int) -> None:
+        super().__init__(action)
+        self.x1 = x1
+        self.y1 = y1
+        self.x2 = x2
+        self.y2 = y2
+
+    @classmethod
+    def from_payload(cls, action: str, payload: Any) -> "AlertBoxMessage":
+        if not isinstance(payload, dict):
+            raise MessageError(f"{action}: message must be an object")
+        coords = []
+        for name in ("x1", "y1", "x2", "y2"):
+            val = payload.get(name)
+            # bool is a subclass of int, reject it explicitly
+            if type(val) is not int:
+                raise MessageError(f"{action}: {name} must be an integer")
+            if not 0 <= val <= GRID_SIZE:
+                raise MessageError(f"{action}: {name} out of range 0-{GRID_SIZE}")
+            coords.append(val)
+        x1, y1, x2, y2 = coords
+        # boxes dragged up/left arrive with swapped corners
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = min(y1, y2), max(y1, y2)
+        if x1 == x2 or y1 == y2:
+            raise MessageError(f"{action}: alert box is empty")
+        return cls(action, x1, y1, x2, y2)
+
+    def to_item(self) -> Dict[str, int]:
+        """Return the box as stored in DynamoDB."""
+        return {
+            "x1": self.x1,
+            "y1": self.y1,
+            "x2": self.x2,
+            "y2": self.y2,
+        }
+
+
+def channel_name(action: str, val: Any) -> str:
+    """Validate a channel name, usable as part of a DynamoDB key."""
+    if not isinstance(val, str) or not CHANNEL_RE.fullmatch(val):
+        raise MessageError(f"{action}: channel must match {CHANNEL_RE.pattern}")
+    return val
+
+
+class SubscribeMessage(Message):
+    """Move the connection to another channel."""
+
+    __slots__ = ("channel",)
+
+    def __init__(self, action: str, channel: str) -> None:
+        super().__init__(action)
+        self.channel = channel
+
+    @classmethod
+    def from_payload(cls, action: str, payload: Any) -> "SubscribeMessage":
+        if not isinstance(payload, dict):
+            raise MessageError(f"{action}: message must be an object")
+        return cls(action, channel_name(action, payload.get("channel")))
+
+
+SCHEMAS: Dict[str, Type[Message]] = {
+    "hello": Message,
+    "ping": Message,
+    "save_alert_box": AlertBoxMessage,
+    "send_alert_boxes": Message,
+    "send_all_active_cells": Message,
+    "send_connection_id": Message,
+    "clear_alert_boxes": Message,
+    "clear_backend_state": Message,
+    "subscribe": SubscribeMessage,
+    "box_stats": Message,
+}
+
+# resolved once at import so dispatch is a single dict lookup
+DECODERS = {action: schema.from_payload for action, schema in SCHEMAS.items()}
+
+
+def decode(raw: Union[str, bytes, Dict, None]) -> Message:
+    """Decode and validate an inbound frame in one pass."""
+    if isinstance(raw, (str, bytes)):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            raise MessageError("Message is not valid JSON") from None
+    if not isinstance(raw, dict):
+        raise MessageError("Message must be a JSON object")
+    action = raw.get("action")
+    decoder = DECODERS.get(action) if isinstance(action, str) else None
+    if decoder is None:
+        raise MessageError(f"Unknown action {action}")
+    return decoder(action, raw.get("message"))
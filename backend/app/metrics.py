@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""metrics.py: Hot-path latency instrumentation.
+
+Timings are collected per invocation and flushed as CloudWatch Embedded
+Metric Format (EMF) lines when the handler returns. Every sample is kept,
+so CloudWatch can compute p50/p99 per route. Set METRICS=off (the default
+when running offline) to make every timer a no-op.
+"""
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+import boto3
+
+from app.config import Config
+
+config = Config()
+
+# EMF limits: 100 metrics per document, 100 values per metric
+MAX_METRICS = 100
+MAX_VALUES = 100
+
+
+class Metrics:
+    """Per-invocation timing collector."""
+
+    def __init__(self, namespace: str, enabled: bool) -> None:
+        self.namespace = namespace
+        self.enabled = enabled
+        self.route = "none"
+        self.samples: Dict[str, List[float]] = {}
+        self.units: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, millis: float, unit: str = "Milliseconds") -> None:
+        """Record one sample, a timing in milliseconds unless `unit` says not."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.units[name] = unit
+            self.samples.setdefault(name, []).append(round(millis, 3))
+            full = len(self.samples[name]) >= MAX_VALUES
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        """Emit the collected samples as EMF documents and reset."""
+        with self._lock:
+            samples, self.samples = self.samples, {}
+        names = sorted(samples)
+        for i in range(0, len(names), MAX_METRICS):
+            print(self._document(names[i : i + MAX_METRICS], samples), flush=True)
+
+    def _document(self, names: List[str], samples: Dict[str, List[float]]) -> str:
+        doc = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [["Stage", "Route"]],
+                        "Metrics": [
+                            {"Name": name, "Unit": self.units.get(name, "Milliseconds")}
+                            for name in names
+                        ],
+                    }
+                ],
+            },
+            "Stage": config.stage,
+            "Route": self.route,
+        }
+        for name in names:
+            doc[name] = samples[name]
+        return json.dumps(doc)
+
+
+metrics = Metrics(config.metrics_namespace, config.metrics_mode == "emf")
+
+
+@contextmanager
+def timer(name: str):
+    """Time the enclosed block as metric `name`."""
+    if not metrics.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.record(name, (time.perf_counter() - start) * 1000)
+
+
+def timed(name: str) -> Callable:
+    """Decorate a function so each call is timed as metric `name`."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def instrumented(route: str) -> Callable:
+    """Decorate a Lambda entry point: time it and flush metrics on return."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(event, context):
+            if not metrics.enabled:
+                return func(event, context)
+            metrics.route = route
+            try:
+                with timer("invocation"):
+                    return func(event, context)
+            finally:
+                metrics.flush()
+
+        return wrapper
+
+    return decorator
+
+
+def _before_call(model=None, context=None, **_):
+    if context is None or model is None:
+        return
+    service = model.service_model.service_id.hyphenize()
+    context["metrics_name"] = f"aws.{service}.{model.name}"
+    context["metrics_start"] = time.perf_counter()
+
+
+def _after_call(context=None, **_):
+    # after-call-error carries no model, use what before-call stored
+    start = (context or {}).pop("metrics_start", None)
+    if start is None:
+        return
+    metrics.record(context["metrics_name"], (time.perf_counter() - start) * 1000)
+
+
+def instrument_boto3() -> None:
+    """Time every boto3 call made from the default session."""
+    if boto3.DEFAULT_SESSION is None:
+        boto3.setup_default_session()
+    events = boto3.DEFAULT_SESSION.events
+    events.register("before-call", _before_call, unique_id="metrics-before")
+    events.register("after-call", _after_call, unique_id="metrics-after")
+    events.register("after-call-error", _after_call, unique_id="metrics-error")
+
+
+if metrics.enabled:
+    instrument_boto3()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""profiler.py: On-demand sampling profiler for handler invocations.
+
+PROFILE_RATES picks the fraction of invocations profiled per route, in
+the LOG_SAMPLE_RATES format, e.g. `sns=0.01`; it defaults to none. A
+profiled invocation runs a background thread that every
+PROFILE_INTERVAL_MS records the stack of every other thread, so thread
+pool workers are seen too. Samples are wall-clock: time spent waiting on
+AWS shows up under the call that waits.
+
+The stacks are written in collapsed format, one `frame;frame;... count`
+line per stack, ready for flamegraph.pl or speedscope. PROFILE_OUTPUT is
+a directory (default /tmp/profiles) or an s3://bucket/prefix URL.
+"""
+import functools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Optional
+
+from app import clients
+from app.config import Config
+from app.logs import get_logger, parse_rates
+
+config = Config()
+
+logger = get_logger()
+
+RATES = parse_rates(config.profile_rates)
+DEFAULT_RATE = RATES.get("*", 0.0)
+
+
+def sampled(route: str) -> bool:
+    """Return True if this invocation of `route` should be profiled."""
+    rate = RATES.get(route, DEFAULT_RATE)
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+def _name(frame) -> str:
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{module}.{name}".replace(";", ":")
+
+
+def collapse(frame) -> str:
+    """Return a frame's stack, outermost call first."""
+    names = []
+    while frame is not None:
+        names.append(_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    """Collects the stacks of every other thread at a fixed interval."""
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    self.stacks[collapse(frame)] += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self) -> str:
+        """Return the samples in collapsed-stack format."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+def write(name: str, body: str) -> str:
+    """Store a profile under PROFILE_OUTPUT and return where it went."""
+    output = config.profile_output
+    if output.startswith("s3://"):
+        bucket, _, prefix = output[len("s3://") :].partition("/")
+        key = f"{prefix.rstrip('/')}/{name}" if prefix else name
+        clients.s3().put_object(Bucket=bucket, Key=key, Body=body.encode("utf-8"))
+        return f"s3://{bucket}/{key}"
+    os.makedirs(output, exist_ok=True)
+    path = os.path.join(output, name)
+    with open(path, "w") as f:
+        f.write(body)
+    return path
+
+
+def profiled(route: str) -> Callable:
+    """Decorate a Lambda entry point to profile a sample of invocations."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(event, context):
+            if not sampled(route):
+                return func(event, context)
+            sampler = Sampler(config.profile_interval)
+            sampler.start()
+            try:
+                return func(event, context)
+            finally:
+                sampler.stop()
+                request_id = getattr(context, "aws_request_id", "local")
+                name = f"{route}-{int(time.time())}-{request_id}.folded"
+                try:
+                    where = write(name, sampler.folded())
+                    logger.info("Profile of %s written to %s", route, where)
+                except Exception as e:
+                    logger.error("Writing profile %s failed: %s", name, e)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""ratelimit.py: Inbound rate limits per connection and per action.
+
+Every frame takes a token from its connection's bucket (INBOUND_RATE
+per second, INBOUND_BURST deep), and the expensive actions listed in
+INBOUND_ACTION_RATES (`action=rate:burst,...`) also take one from a
+bucket of their own. Buckets live in the container, so they cost
+nothing, but a connection's frames may be spread over several
+containers. Once an action's bucket is nearly empty, the frames it let
+through are added to a shared DynamoDB counter per fixed INBOUND_WINDOW
+in one conditional write, which fails once the window's allowance is
+used up. Frames within the burst never touch the table, and errors
+other than the failed condition let the frame through.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from app import clients
+from app.config import Config
+from app.delivery import TokenBucket
+from app.logs import get_logger
+
+config = Config()
+
+logger = get_logger()
+
+KEY = "ratelimit"
+# buckets kept per container, least recently used ones are dropped
+MAX_BUCKETS = 10000
+# share of an action's burst below which the shared counter is consulted
+SYNC_BELOW = 0.5
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse `action=rate:burst` pairs."""
+    limits = {}
+    for part in spec.split(","):
+        action, sep, limit = part.partition("=")
+        if not sep:
+            continue
+        rate, _, burst = limit.partition(":")
+        limits[action.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+ACTION_LIMITS = parse_limits(config.inbound_action_rates)
+
+
+class ActionBucket(TokenBucket):
+    """Token bucket that counts the frames not yet in the shared counter."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        super().__init__(rate, burst)
+        self.unsynced = 0
+
+    def try_acquire_counted(self) -> Optional[int]:
+        """Take a token, returning how many frames are due for the counter.
+
+        None means no token was available, 0 that the bucket is not
+        nearly empty yet, so nothing is due.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens < 1:
+                return None
+            self.tokens -= 1
+            self.unsynced += 1
+            if self.tokens >= self.burst * SYNC_BELOW:
+                return 0
+            due, self.unsynced = self.unsynced, 0
+            return due
+
+    def unsync(self, frames: int) -> None:
+        """Put back frames whose write to the counter failed."""
+        with self._lock:
+            self.unsynced += frames
+
+
+_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+_buckets_lock = threading.Lock()
+
+
+def _bucket(name: str, rate: float, burst: float, cls=TokenBucket) -> TokenBucket:
+    with _buckets_lock:
+        bucket = _buckets.get(name)
+        if bucket is None:
+            bucket = _buckets[name] = cls(rate, burst)
+            if len(_buckets) > MAX_BUCKETS:
+                _buckets.popitem(last=False)
+        else:
+            _buckets.move_to_end(name)
+        return bucket
+
+
+def _shared(
+    connection_id: str, action: str, frames: int, rate: float, burst: float
+) -> bool:
+    """Add the frames to the window's shared counter, if they fit."""
+    window = int(time.time() // config.inbound_window)
+    allowance = burst + rate * config.inbound_window
+    try:
+        clients.table().update_item(
+            Key={
+                "key": KEY,
+                "type": f"{connection_id}#{action}#{window}",
+            },
+            UpdateExpression="ADD #count :frames SET #ttl = :ttl",
+            ConditionExpression="attribute_not_exists(#count) OR #count <= :room",
+            ExpressionAttributeNames={"#count": "count", "#ttl": "ttl"},
+            ExpressionAttributeValues={
+                ":frames": frames,
+                ":room": int(allowance) - frames,
+                ":ttl": (window + 2) * int(config.inbound_window),
+            },
+        )
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+            raise
+        return False
+
+
+def allow(connection_id: str, action: str) -> bool:
+    """Check if a frame may be handled, taking its tokens."""
+    connection = _bucket(connection_id, config.inbound_rate, config.inbound_burst)
+    if not connection.try_acquire():
+        return False
+    limit = ACTION_LIMITS.get(action)
+    if limit is None:
+        return True
+    bucket = _bucket(f"{connection_id}#{action}", *limit, cls=ActionBucket)
+    due = bucket.try_acquire_counted()
+    if due is None:
+        return False
+    if not due:
+        return True
+    try:
+        return _shared(connection_id, action, due, *limit)
+    except Exception as e:
+        # the limit is a guard, a failing table must not fail the frame
+        logger.warning("Shared rate limit of %s unavailable: %s", action, e)
+        bucket.unsync(due)
+        return True
+
+
+def reset() -> None:
+    """Drop every bucket."""
+    with _buckets_lock:
+        _buckets.clear()
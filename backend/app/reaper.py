@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""reaper.py: Removes connection records whose sockets are gone.
+
+Connection records carry a `ttl` that activity refreshes. Records that
+are close to or past it are checked against the management API with
+`get_connection`; live sockets get a fresh TTL, gone ones are deleted
+in bulk.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+from app import channels, clients
+from app.config import Config
+from app.control import Control, is_gone
+from app.logs import get_logger
+from app.messages import DEFAULT_CHANNEL
+
+config = Config()
+
+logger = get_logger()
+
+
+class Reaper:
+    """Find, verify and remove stale connection records."""
+
+    def __init__(self) -> None:
+        """Initialize the Reaper."""
+        self.table = clients.table()
+
+    def stale(self) -> Iterator[Dict]:
+        """Yield connection records not refreshed within half their TTL."""
+        cutoff = int(time.time()) + config.connection_ttl // 2
+        kwargs = {
+            "FilterExpression": Attr("key").eq("websocket")
+            & (Attr("ttl").not_exists() | Attr("ttl").lt(cutoff)),
+        }
+        while True:
+            response = self.table.scan(**kwargs)
+            yield from response.get("Items", [])
+            if "LastEvaluatedKey" not in response:
+                return
+            kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def is_alive(self, item: Dict) -> bool:
+        """Ask the management API whether the socket is still open."""
+        gwapi = clients.gateway_for(item.get("domain"), item.get("stage"))
+        try:
+            gwapi.get_connection(ConnectionId=item["type"])
+            return True
+        except ClientError as e:
+            if is_gone(e):
+                return False
+            # unknown errors (throttles etc.) keep the record for next run
+            logger.error("get_connection %s failed: %s", item["type"], e)
+            return True
+        except EndpointConnectionError:
+            return False
+
+    def delete(self, items: List[Dict]) -> None:
+        """Remove connection records and memberships with BatchWriteItem."""
+        with self.table.batch_writer() as batch:
+            for item in items:
+                batch.delete_item(Key={"key": "websocket", "type": item["type"]})
+                if item.get("channel"):
+                    batch.delete_item(
+                        Key={
+                            "key": item["type"],
+                            "type": channels.partition(item["channel"]),
+                        }
+                    )
+
+    def run(self) -> Dict[str, int]:
+        """Reap once and return what was done."""
+        items = list(self.stale())
+        if not items:
+            return {"checked": 0, "removed": 0, "refreshed": 0}
+        workers = min(len(items), config.reaper_workers)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            alive = list(pool.map(self.is_alive, items))
+        gone = [item for item, ok in zip(items, alive) if not ok]
+        live = [item for item, ok in zip(items, alive) if ok]
+        self.delete(gone)
+        for item in live:
+            control = Control(item["type"], item.get("domain"), item.get("stage"))
+            control.ttl = int(item.get("ttl", 0))
+            control.channel = item.get("channel", DEFAULT_CHANNEL)
+            control.refresh_ttl()
+        logger.info("Reaped %s of %s stale connections", len(gone), len(items))
+        return {"checked": len(items), "removed": len(gone), "refreshed": len(live)}
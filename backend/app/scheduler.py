@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""scheduler.py: Drives the random cell simulation on many boards at once.
+
+Each board (channel) is leased with a `Lock`, so concurrent invocations
+split the boards between them instead of all waiting on one global lock.
+Every tick the leased boards are stepped concurrently on a thread pool;
+ticks are scheduled on absolute deadlines so the time spent stepping
+does not stretch the period, and deadlines missed under load are skipped
+rather than run back to back.
+
+The loop runs until the Lambda context is about to time out, then
+releases its leases. Invocations overlap (the schedule fires before the
+previous one times out), so boards still leased at start are retried
+for a short handoff window and are picked up as soon as they are freed.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from app.channels import scoped
+from app.config import Config
+from app.control import Broadcast, CellState, Lock
+from app.logs import get_logger
+
+config = Config()
+
+logger = get_logger()
+
+LEASE_NAME = "schedule_random"
+
+
+class Ticker:
+    """Waits for tick deadlines fixed at start + n * period."""
+
+    def __init__(
+        self,
+        rate: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.period = 1.0 / rate
+        self.clock = clock
+        self.sleep = sleep
+        self.start = clock()
+        self.ticks = 0
+        self.skipped = 0
+
+    @property
+    def next_deadline(self) -> float:
+        """Return the clock value of the next deadline."""
+        return self.start + (self.ticks + 1) * self.period
+
+    def wait(self) -> int:
+        """Sleep until the next deadline, returning how many were skipped."""
+        now = self.clock()
+        self.ticks += 1
+        deadline = self.start + self.ticks * self.period
+        missed = 0
+        if deadline <= now:
+            # run once at the next deadline instead of catching up
+            missed = int((now - deadline) // self.period) + 1
+            self.ticks += missed
+            self.skipped += missed
+            deadline += missed * self.period
+        self.sleep(deadline - now)
+        return missed
+
+
+def step(channel: str) -> Optional[Dict[str, int]]:
+    """Light a random cell on the board, clearing it once full."""
+    cs = CellState(channel)
+    bc = Broadcast(channel)
+    res = cs.add_random_active()
+    if res:
+        bc.send_message(
+            {
+                "action": "add_active_cell",
+                "message": {
+                    "x": res["x"],
+                    "y": res["y"],
+                },
+            }
+        )
+    else:
+        # if no more cells are available, clear the board
+        cs.clear_active()
+        bc.send_message(
+            {
+                "action": "board_cleared",
+            }
+        )
+    return res
+
+
+class Scheduler:
+    """Step every leased board once per tick."""
+
+    def __init__(
+        self,
+        boards: Iterable[str],
+        rate: float = config.tick_rate,
+        workers: int = config.scheduler_workers,
+        margin: float = config.schedule_margin,
+        handoff: float = config.schedule_handoff,
+    ) -> None:
+        """Initialize the Scheduler."""
+        self.boards = list(dict.fromkeys(boards))
+        self.rate = rate
+        self.workers = workers
+        self.margin = margin
+        self.handoff = handoff
+        self.leases: Dict[str, Lock] = {}
+        self.errors = 0
+
+    def _acquire(self, channel: str) -> Optional[Lock]:
+        lease = Lock(scoped(LEASE_NAME, channel))
+        return lease if lease.lock() else None
+
+    def _renew(self, lease: Lock) -> bool:
+        # renewed once half the lease has run out
+        if lease.expires - time.time() > lease.ttl / 2:
+            return True
+        return lease.renew()
+
+    def _step(self, channel: str) -> bool:
+        try:
+            step(channel)
+            return True
+        except Exception as e:
+            logger.error("Tick of board %s failed: %s", channel, e)
+            return False
+
+    def _lease(self, pool: ThreadPoolExecutor, boards: List[str]) -> None:
+        leases = pool.map(self._acquire, boards)
+        for channel, lease in zip(boards, leases):
+            if lease:
+                self.leases[channel] = lease
+
+    def run(self, context) -> Dict:
+        """Tick until the invocation is about to time out.
+
+        `context` is the Lambda context, only its
+        `get_remaining_time_in_millis()` is used.
+        """
+
+        def remaining() -> float:
+            return context.get_remaining_time_in_millis() / 1000
+
+        workers = max(1, min(len(self.boards), self.workers))
+        start = time.monotonic()
+        ticker = Ticker(self.rate)
+        ticks = 0
+        steps = 0
+        # the slowest tick seen, the loop stops when one no longer fits
+        slowest = 0.0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            self._lease(pool, self.boards)
+            try:
+                while True:
+                    pending = [b for b in self.boards if b not in self.leases]
+                    if pending and time.monotonic() - start < self.handoff:
+                        self._lease(pool, pending)
+                    elif not self.leases:
+                        break
+                    tick_start = time.monotonic()
+                    ok = list(pool.map(self._step, self.leases))
+                    ticks += 1 if ok else 0
+                    steps += sum(ok)
+                    self.errors += len(ok) - sum(ok)
+                    held = list(pool.map(self._renew, self.leases.values()))
+                    for channel, alive in zip(list(self.leases), held):
+                        if not alive:
+                            del self.leases[channel]
+                    slowest = max(slowest, time.monotonic() - tick_start)
+                    until_next = ticker.next_deadline - time.monotonic()
+                    if remaining() - until_next < self.margin + slowest:
+                        break
+                    ticker.wait()
+            finally:
+                leased = len(self.leases)
+                # released early so the next invocation can take over
+                list(pool.map(Lock.unlock, self.leases.values()))
+        # the last tick's period counts even though the loop left early
+        elapsed = max(time.monotonic(), ticker.next_deadline) - start
+        logger.info("Handing off %s boards", leased)
+        return {
+            "boards": len(self.boards),
+            "leased": leased,
+            "ticks": ticks,
+            "skipped_ticks": ticker.skipped,
+            "steps": steps,
+            "errors": self.errors,
+            "elapsed": round(elapsed, 3),
+            "ticks_per_sec": round(steps / elapsed, 2) if elapsed else 0.0,
+        }
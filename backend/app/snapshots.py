@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""snapshots.py: Coalescing of board snapshots across invocations.
+
+A snapshot frame (a full board or alert box list) replaces everything a
+client knows of its kind, so when several are broadcast in a burst only
+the newest matters. Each snapshot fanned out through SNS is stamped
+with a sequence number stored per kind, and SNS deliveries drop frames
+a newer snapshot has superseded (SNS does not preserve order). The
+newest sequence number is cached per container, raised by every
+delivery it sees and read again at most every SNAPSHOT_CACHE_MS, so
+deliveries do not all read the same item.
+
+With SNAPSHOT_WINDOW_MS set, the broadcaster also waits that long and
+gives up if it was overtaken, saving the fan-out at the cost of
+blocking the caller. It is off by default.
+"""
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from botocore.exceptions import ClientError
+
+from app import clients, store
+from app.config import Config
+from app.delivery import SNAPSHOT_KINDS
+
+config = Config()
+
+KEY = "snapshot"
+
+# newest sequence number known per kind, and when the table was last read
+_known: Dict[str, int] = {}
+_read_at: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def kind_of(data) -> Optional[str]:
+    """Return the snapshot kind of a frame, None for incremental frames."""
+    if isinstance(data, dict):
+        return SNAPSHOT_KINDS.get(data.get("action"))
+    return None
+
+
+def stamp(kind: str) -> int:
+    """Record a new snapshot of `kind` and return its sequence number."""
+    seq = time.time_ns()
+    try:
+        clients.table().update_item(
+            Key={
+                "key": KEY,
+                "type": kind,
+            },
+            UpdateExpression="set seq = :s",
+            ConditionExpression="attribute_not_exists(seq) OR seq < :s",
+            ExpressionAttributeValues={":s": seq},
+        )
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+            raise
+    return seq
+
+
+def latest(kinds: Iterable[str]) -> Dict[str, int]:
+    """Return the newest sequence number per kind."""
+    found = store.batch_get(clients.dynamodb(), [(KEY, kind) for kind in kinds])
+    return {_type: int(item.get("seq", 0)) for (_, _type), item in found.items()}
+
+
+def superseded(kind: str, seq: int) -> bool:
+    """Wait out the window, then check whether a newer snapshot exists."""
+    if config.snapshot_window > 0:
+        time.sleep(config.snapshot_window)
+    return latest([kind]).get(kind, 0) > seq
+
+
+def newest(seen: Dict[str, int]) -> Dict[str, int]:
+    """Return the newest sequence number known per kind.
+
+    `seen` holds the newest sequence number per kind the caller has in
+    hand. The table is read only for kinds not read in the last
+    SNAPSHOT_CACHE_MS, a snapshot broadcast since then may be missed and
+    older deliveries then go out as they would without coalescing.
+    """
+    now = time.monotonic()
+    with _lock:
+        for kind, seq in seen.items():
+            _known[kind] = max(_known.get(kind, 0), seq)
+        expired = now - config.snapshot_cache
+        due = [kind for kind in seen if _read_at.get(kind, expired) <= expired]
+        for kind in due:
+            _read_at[kind] = now
+    found = latest(due) if due else {}
+    with _lock:
+        for kind, seq in found.items():
+            _known[kind] = max(_known.get(kind, 0), seq)
+        return {kind: _known.get(kind, 0) for kind in seen}
+
+
+def reset() -> None:
+    """Forget every cached sequence number."""
+    with _lock:
+        _known.clear()
+        _read_at.clear()
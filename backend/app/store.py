@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""store.py: Batched DynamoDB reads for fan-out.
+
+Fan-outs need a connection record and the user's alert boxes for every
+connection. Reading them one `get_item` at a time costs several round
+trips per connection; these helpers fetch them with BatchGetItem, 100
+keys per call, retrying unprocessed keys with jittered backoff.
+"""
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.config import Config
+from app.logs import get_logger
+
+config = Config()
+
+logger = get_logger()
+
+# DynamoDB BatchGetItem accepts at most 100 keys per call
+BATCH_GET_MAX = 100
+# retries of unprocessed keys, with full-jitter exponential backoff
+BACKOFF_BASE = 0.05
+BACKOFF_CAP = 2.0
+MAX_ATTEMPTS = 8
+
+ItemKey = Tuple[str, str]
+
+
+def backoff(attempt: int) -> float:
+    """Return the full-jitter delay before retry `attempt`."""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt))
+
+
+def batch_get(dynamodb, keys: Iterable[ItemKey]) -> Dict[ItemKey, Dict]:
+    """Fetch items by (key, type), returning the ones that exist."""
+    unique = list(dict.fromkeys(keys))
+    found: Dict[ItemKey, Dict] = {}
+    for i in range(0, len(unique), BATCH_GET_MAX):
+        pending: List[Dict] = [
+            {"key": key, "type": _type} for key, _type in unique[i : i + BATCH_GET_MAX]
+        ]
+        attempt = 0
+        while pending:
+            response = dynamodb.batch_get_item(
+                RequestItems={config.table: {"Keys": pending}}
+            )
+            for item in response.get("Responses", {}).get(config.table, []):
+                found[(item["key"], item["type"])] = item
+            unprocessed = response.get("UnprocessedKeys", {}).get(config.table, {})
+            pending = unprocessed.get("Keys", [])
+            if not pending:
+                break
+            attempt += 1
+            if attempt >= MAX_ATTEMPTS:
+                logger.error("Giving up on %s unprocessed keys", len(pending))
+                break
+            time.sleep(backoff(attempt))
+    return found
+
+
+def connections(dynamodb, connection_ids: Iterable[str]) -> Dict[str, Dict]:
+    """Return connection records keyed by connection id."""
+    found = batch_get(dynamodb, [("websocket", cid) for cid in connection_ids])
+    return {_type: item for (_, _type), item in found.items()}
+
+
+def alert_boxes(dynamodb, users: Iterable[Optional[str]]) -> Dict[str, List[Dict]]:
+    """Return alert boxes keyed by user, users without boxes are omitted."""
+    found = batch_get(dynamodb, [("alert_box", user) for user in users if user])
+    return {_type: item.get("alert_boxes", []) for (_, _type), item in found.items()}
+
+
+def hydrated(item: Dict) -> Dict[str, str]:
+    """Return the connection fields a sender needs to post without a read."""
+    return {
+        "domain": item.get("domain"),
+        "stage": item.get("stage"),
+        "user": item.get("user"),
+    }
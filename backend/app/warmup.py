@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""warmup.py: Warm-up events that pre-initialize a container.
+
+A schedule invokes the functions with `{"warmup": true}`. The handler
+then does no real work: it builds the clients and primes the caches its
+route needs and returns, so the next real request finds them ready.
+Each step is timed as an `init.*` metric.
+"""
+import functools
+import time
+from typing import Callable, Dict
+
+from app import clients, jwt
+from app.control import CellState
+from app.logs import get_logger
+from app.metrics import metrics
+
+logger = get_logger()
+
+EVENT_KEY = "warmup"
+
+# the first warm-up of a container pays for everything
+_cold = True
+
+
+def is_warmup(event) -> bool:
+    """Check if the event is a warm-up rather than a request."""
+    return isinstance(event, dict) and event.get(EVENT_KEY) is True
+
+
+def _dynamodb() -> None:
+    # the first request on the connection pays for TLS, do it here
+    CellState().snapshot()
+
+
+def _sns() -> None:
+    clients.sns()
+
+
+STEPS: Dict[str, Dict[str, Callable[[], None]]] = {
+    "connect": {"dynamodb": _dynamodb, "jwks": jwt.get_keys},
+    "message": {"dynamodb": _dynamodb, "sns": _sns},
+    "sns": {"dynamodb": _dynamodb},
+}
+
+
+def warm(route: str) -> Dict:
+    """Run the route's warm-up steps and report their timings."""
+    global _cold
+    timings = {}
+    start = time.perf_counter()
+    for name, step in STEPS.get(route, {}).items():
+        step_start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            logger.error("Warm-up step %s failed: %s", name, e)
+        timings[name] = round((time.perf_counter() - step_start) * 1000, 3)
+        metrics.record(f"init.{name}", timings[name])
+    total = (time.perf_counter() - start) * 1000
+    metrics.record("init", total)
+    cold, _cold = _cold, False
+    logger.info("Warmed %s in %.1fms (cold: %s)", route, total, cold)
+    return {"warmup": route, "cold": cold, "ms": timings}
+
+
+def warmed(route: str) -> Callable:
+    """Decorate a Lambda entry point to answer warm-up events.
+
+    Apply it outermost, so warm-ups are neither timed as invocations nor
+    traced or profiled; their `init.*` metrics are flushed here.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(event, context):
+            if not is_warmup(event):
+                return func(event, context)
+            metrics.route = route
+            try:
+                return warm(route)
+            finally:
+                metrics.flush()
+
+        return wrapper
+
+    return decorator
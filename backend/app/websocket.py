@@ -2,14 +2,14 @@
 # -*- coding: utf-8 -*-
 """Main Handler entrypoint for lambdas."""
 import json
-import logging
 
 from app.config import Config
 from app.control import Control
 from app.jwt import JwtToken
+from app.logs import get_logger, log_event
+from app.messages import DEFAULT_CHANNEL, MessageError, channel_name
 
-logger = logging.getLogger("handler_logger")
-logger.setLevel(logging.DEBUG)
+logger = get_logger()
 config = Config()
 
 
@@ -28,27 +28,15 @@ class WebSocketMessageHandler:
 
     def __init__(self, event: dict) -> None:
         self.connectionID = event.get("requestContext", {}).get("connectionId")
-        self.control = Control(self.connectionID)
         self.event = event
-        self.body = self._get_body()
+        self.body = self.event.get("body", "")
         self.domain = event.get("requestContext", {}).get("domainName")
         self.stage = event.get("requestContext", {}).get("stage")
-        logger.info(
-            "Message received (CID: {}, Event: {})".format(
-                self.connectionID,
-                self.event,
-            )
-        )
-
-    def _get_body(self):
-        try:
-            return json.loads(self.event.get("body", ""))
-        except:
-            logger.debug("event body could not be JSON decoded.")
-            return {}
+        # domain/stage come from the request so replies need no lookup
+        self.control = Control(self.connectionID, self.domain, self.stage)
+        log_event(logger, "message", "Message received", event)
 
     def handle_message(self):
-        logger.info("Message Event: {}".format(self.event))
         self.control.parse_message(self.body)
         return _get_response(200, "Event OK")
 
@@ -58,7 +46,8 @@ class WebSocketConnectHandler:
     Handles connecting and disconnecting for the Websocket.
 
     Connect verifes the passed in token, and if successful,
-    adds the connectionID to the database.
+    adds the connectionID to the database and to the channel
+    named by the `channel` query parameter.
 
     Disconnect removes the connectionID from the database.
     """
@@ -71,6 +60,9 @@ class WebSocketConnectHandler:
         self.domain = event.get("requestContext", {}).get("domainName")
         self.stage = event.get("requestContext", {}).get("stage")
         self.token = event.get("queryStringParameters", {}).get("token")
+        self.channel = event.get("queryStringParameters", {}).get(
+            "channel", DEFAULT_CHANNEL
+        )
         if self.token:
             self.tok = JwtToken(self.token)
             self.username = self.tok.username
@@ -100,11 +92,12 @@ class WebSocketConnectHandler:
             self.domain,
             self.stage,
             self.username,
+            self.channel,
         )
         return _get_response(200, "Connect successful.")
 
     def _handle_disconnect(self):
-        logger.info("Disconnect requested (CID: {})".format(self.connectionID))
+        logger.info("Disconnect requested (CID: %s)", self.connectionID)
         # Ensure connectionID is set
         if not self.connectionID:
             logger.error("Failed: connectionId value not set.")
@@ -115,12 +108,7 @@ class WebSocketConnectHandler:
         return _get_response(200, "Disconnect successful.")
 
     def _check_valid(self):
-        logger.info(
-            "Message received (CID: {}, Event: {})".format(
-                self.connectionID,
-                self.event,
-            )
-        )
+        log_event(logger, "connect", "Connect received", self.event)
         if not self.connectionID:
             logger.error("Failed: connectionId value not set.")
             return False, 500, "connectionId value not set."
@@ -135,4 +123,9 @@ class WebSocketConnectHandler:
             msg = f"Failed: Token verification failed. {self.tok.status}"
             logger.debug(msg)
             return False, 400, msg
+
+        try:
+            channel_name("connect", self.channel)
+        except MessageError as e:
+            return False, 400, str(e)
         return True, 200, "Valid"
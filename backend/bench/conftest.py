@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""conftest.py: Fixtures shared by the benchmark suite."""
+import pytest
+
+import bench.env  # noqa: F401
+from bench import fakes
+
+
+@pytest.fixture
+def aws():
+    """Fresh in-memory AWS for one benchmark."""
+    stand_in = fakes.install()
+    yield stand_in
+    stand_in.uninstall()
+
+
+@pytest.fixture
+def table(aws):
+    from app.config import Config
+
+    return aws.dynamodb.Table(Config().table)
+
+
+@pytest.fixture(scope="session")
+def user_pool():
+    from app.config import Config
+
+    return fakes.FakeUserPool(Config().app_client_id)
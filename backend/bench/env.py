@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""env.py: Environment for running the app modules outside of Lambda.
+
+Import this before any `app` module, app.config reads the environment
+at import time.
+"""
+import os
+
+DEFAULTS = {
+    "STAGE": "bench",
+    "PREFIX": "bench",
+    "SNS_TOPIC": "arn:aws:sns:us-east-2:000000000000:bench",
+    "REGION": "us-east-2",
+    "TABLE": "bench",
+    "USERPOOL_ID": "us-east-2_bench",
+    "CLIENT_ID": "bench",
+    "LOG_LEVEL": "WARNING",
+    "METRICS": "off",
+    # measure the code, not the per-container rate limits
+    "DELIVERY_RATE": "1000000",
+    "DELIVERY_BURST": "100000",
+    "PUBLISH_RATE": "1000000",
+    "PUBLISH_BURST": "100000",
+    "SNAPSHOT_WINDOW_MS": "0",
+    "INBOUND_RATE": "1000000",
+    "INBOUND_BURST": "100000",
+    "INBOUND_ACTION_RATES": "",
+    "AWS_ACCESS_KEY_ID": "bench",
+    "AWS_SECRET_ACCESS_KEY": "bench",
+    "AWS_DEFAULT_REGION": "us-east-2",
+}
+
+for _k, _v in DEFAULTS.items():
+    os.environ.setdefault(_k, _v)
@@ -0,0 +1,829 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""fakes.py: In-memory stand-ins for DynamoDB, SNS and the API Gateway
+management API.
+
+Only the calls and expression syntax used by the app are implemented.
+Errors are raised as botocore `ClientError`s with the codes AWS uses, so
+the app's error handling runs unchanged. `install()` routes
+`boto3.resource`/`boto3.client` to the fakes for the listed services.
+"""
+import decimal
+import itertools
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import boto3
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+Key = Tuple[str, str]
+
+
+def client_error(code: str, operation: str, status: int = 400, msg: str = ""):
+    """Build a ClientError the way botocore does."""
+    return ClientError(
+        {
+            "Error": {"Code": code, "Message": msg or code},
+            "ResponseMetadata": {"HTTPStatusCode": status},
+        },
+        operation,
+    )
+
+
+def _to_dynamo(value: Any) -> Any:
+    """Copy a value in, converting numbers like the boto3 serializer."""
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, int):
+        return decimal.Decimal(value)
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, dict):
+        return {k: _to_dynamo(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_dynamo(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return {_to_dynamo(v) for v in value}
+    return value
+
+
+def _copy(value: Any) -> Any:
+    """Copy a stored value out, strings and numbers are immutable."""
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    if isinstance(value, set):
+        return set(value)
+    return value
+
+
+# -- expressions ---------------------------------------------------------------
+
+_TOKEN = re.compile(r"\s*(<>|<=|>=|[=<>(),+\-]|:[\w]+|#[\w]+|[A-Za-z_][\w.]*)")
+
+
+def _tokenize(expr: str) -> List[str]:
+    tokens, pos = [], 0
+    expr = expr.strip()
+    while pos < len(expr):
+        match = _TOKEN.match(expr, pos)
+        if not match:
+            raise ValueError(f"Cannot parse expression at: {expr[pos:]}")
+        tokens.append(match.group(1))
+        pos = match.end()
+    return tokens
+
+
+class _Expr:
+    """Tiny evaluator for the DynamoDB expression grammar subset in use."""
+
+    def __init__(self, expr: str, names: Dict, values: Dict) -> None:
+        self.tokens = _tokenize(expr)
+        self.pos = 0
+        self.names = names or {}
+        self.values = {k: _to_dynamo(v) for k, v in (values or {}).items()}
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self, expected: Optional[str] = None) -> str:
+        tok = self.peek()
+        if tok is None or (expected and tok.upper() != expected.upper()):
+            raise ValueError(f"Expected {expected}, got {tok}")
+        self.pos += 1
+        return tok
+
+    def name(self, tok: str) -> str:
+        return self.names[tok] if tok.startswith("#") else tok
+
+    # operands
+    def operand(self, item: Dict) -> Any:
+        tok = self.take()
+        if tok.startswith(":"):
+            return self.values[tok]
+        func = tok.lower()
+        if func in ("list_append", "if_not_exists") and self.peek() == "(":
+            self.take("(")
+            if func == "if_not_exists":
+                path = self.name(self.take())
+                self.take(",")
+                default = self.operand(item)
+                self.take(")")
+                return item[path] if path in item else default
+            first = self.operand(item)
+            self.take(",")
+            second = self.operand(item)
+            self.take(")")
+            if first is None or second is None:
+                raise client_error(
+                    "ValidationException",
+                    "UpdateItem",
+                    msg="The provided expression refers to an attribute that "
+                    "does not exist in the item",
+                )
+            return list(first) + list(second)
+        return item.get(self.name(tok))
+
+    def value(self, item: Dict) -> Any:
+        val = self.operand(item)
+        while self.peek() in ("+", "-"):
+            op = self.take()
+            other = self.operand(item)
+            if val is None or other is None:
+                raise client_error(
+                    "ValidationException",
+                    "UpdateItem",
+                    msg="An operand in the update expression has an incorrect "
+                    "data type",
+                )
+            val = val + other if op == "+" else val - other
+        return val
+
+    # conditions
+    def condition(self, item: Dict) -> bool:
+        result = self._and(item)
+        while self.peek() and self.peek().upper() == "OR":
+            self.take()
+            other = self._and(item)
+            result = result or other
+        return result
+
+    def _and(self, item: Dict) -> bool:
+        result = self._not(item)
+        while self.peek() and self.peek().upper() == "AND":
+            self.take()
+            other = self._not(item)
+            result = result and other
+        return result
+
+    def _not(self, item: Dict) -> bool:
+        if self.peek() and self.peek().upper() == "NOT":
+            self.take()
+            return not self._not(item)
+        return self._compare(item)
+
+    def _compare(self, item: Dict) -> bool:
+        tok = self.peek()
+        if tok == "(":
+            self.take("(")
+            result = self.condition(item)
+            self.take(")")
+            return result
+        func = tok.lower()
+        if func in ("attribute_exists", "attribute_not_exists", "begins_with"):
+            self.take()
+            self.take("(")
+            path = self.name(self.take())
+            if func == "begins_with":
+                self.take(",")
+                prefix = self.operand(item)
+                self.take(")")
+                val = item.get(path)
+                return isinstance(val, str) and val.startswith(prefix)
+            self.take(")")
+            return (path in item) == (func == "attribute_exists")
+        left = self.operand(item)
+        op = self.take()
+        right = self.operand(item)
+        if op.upper() == "BETWEEN":
+            self.take("AND")
+            upper = self.operand(item)
+            return left is not None and right <= left <= upper
+        if left is None or right is None:
+            return op == "<>" and left != right
+        return {
+            "=": left == right,
+            "<>": left != right,
+            "<": left < right,
+            "<=": left <= right,
+            ">": left > right,
+            ">=": left >= right,
+        }[op]
+
+    # updates
+    def update(self, item: Dict) -> None:
+        while self.peek():
+            clause = self.take().upper()
+            while True:
+                if clause == "SET":
+                    path = self.name(self.take())
+                    self.take("=")
+                    item[path] = self.value(item)
+                elif clause == "REMOVE":
+                    item.pop(self.name(self.take()), None)
+                elif clause in ("ADD", "DELETE"):
+                    path = self.name(self.take())
+                    val = self.operand(item)
+                    cur = item.get(path)
+                    if clause == "DELETE":
+                        item[path] = (cur or set()) - val
+                    elif isinstance(val, set):
+                        item[path] = (cur or set()) | val
+                    else:
+                        item[path] = (cur or 0) + val
+                else:
+                    raise ValueError(f"Unsupported update clause {clause}")
+                if self.peek() != ",":
+                    break
+                self.take(",")
+
+
+def _build(expr: Any, names: Dict, values: Dict, is_key: bool = False):
+    """Resolve boto3 condition objects into expression strings."""
+    if isinstance(expr, ConditionBase):
+        built = ConditionExpressionBuilder().build_expression(expr, is_key)
+        names = {**(names or {}), **built.attribute_name_placeholders}
+        values = {**(values or {}), **built.attribute_value_placeholders}
+        expr = built.condition_expression
+    return expr, names, values
+
+
+def _check(op: str, item: Dict, expr: Any, names: Dict, values: Dict) -> None:
+    if expr is None:
+        return
+    expr, names, values = _build(expr, names, values)
+    if not _Expr(expr, names, values).condition(item):
+        raise client_error(
+            "ConditionalCheckFailedException", op, msg="The conditional request failed"
+        )
+
+
+def _project(item: Dict, projection: Optional[str], names: Dict) -> Dict:
+    if not projection:
+        return _copy(item)
+    names = names or {}
+    fields = [names.get(f.strip(), f.strip()) for f in projection.split(",")]
+    return {f: _copy(item[f]) for f in fields if f in item}
+
+
+# -- dynamodb ------------------------------------------------------------------
+
+
+class FakeTable:
+    """In-memory table keyed on (key, type)."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.table_name = name
+        self.items: Dict[Key, Dict] = {}
+        self.listeners: List[
+            Callable[[str, Dict, Optional[Dict], Optional[Dict]], None]
+        ] = []
+        self.calls: Dict[str, int] = {}
+        # seconds slept per call, to model the network round trip
+        self.latency = 0.0
+        self._lock = threading.RLock()
+
+    def _count(self, op: str) -> None:
+        self.calls[op] = self.calls.get(op, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _emit(self, keys: Dict, old: Optional[Dict], new: Optional[Dict]) -> None:
+        if old is None and new is None:
+            return
+        event = "INSERT" if old is None else "REMOVE" if new is None else "MODIFY"
+        for listener in self.listeners:
+            listener(event, keys, old, new)
+
+    @staticmethod
+    def _key(key: Dict) -> Key:
+        return (key["key"], key["type"])
+
+    def get_item(
+        self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **_
+    ):
+        self._count("GetItem")
+        with self._lock:
+            item = self.items.get(self._key(Key))
+            if item is None:
+                return {}
+            return {
+                "Item": _project(item, ProjectionExpression, ExpressionAttributeNames)
+            }
+
+    def put_item(
+        self,
+        Item,
+        ConditionExpression=None,
+        ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None,
+        **_,
+    ):
+        self._count("PutItem")
+        item = _to_dynamo(Item)
+        key = self._key(item)
+        with self._lock:
+            old = self.items.get(key)
+            _check(
+                "PutItem",
+                old or {},
+                ConditionExpression,
+                ExpressionAttributeNames,
+                ExpressionAttributeValues,
+            )
+            self.items[key] = item
+        self._emit({"key": key[0], "type": key[1]}, old, _copy(item))
+        return {}
+
+    def update_item(
+        self,
+        Key,
+        UpdateExpression,
+        ExpressionAttributeValues=None,
+        ExpressionAttributeNames=None,
+        ConditionExpression=None,
+        ReturnValues="NONE",
+        **_,
+    ):
+        self._count("UpdateItem")
+        key = self._key(Key)
+        with self._lock:
+            old = self.items.get(key)
+            _check(
+                "UpdateItem",
+                old or {},
+                ConditionExpression,
+                ExpressionAttributeNames,
+                ExpressionAttributeValues,
+            )
+            item = _copy(old) if old else {"key": key[0], "type": key[1]}
+            _Expr(
+                UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues
+            ).update(item)
+            self.items[key] = item
+        self._emit({"key": key[0], "type": key[1]}, old, _copy(item))
+        if ReturnValues == "ALL_NEW":
+            return {"Attributes": _copy(item)}
+        if ReturnValues == "UPDATED_NEW":
+            changed = {
+                k: _copy(v) for k, v in item.items() if old is None or old.get(k) != v
+            }
+            return {"Attributes": changed}
+        return {}
+
+    def delete_item(
+        self,
+        Key,
+        ConditionExpression=None,
+        ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None,
+        ReturnValues="NONE",
+        **_,
+    ):
+        self._count("DeleteItem")
+        key = self._key(Key)
+        with self._lock:
+            old = self.items.get(key)
+            _check(
+                "DeleteItem",
+                old or {},
+                ConditionExpression,
+                ExpressionAttributeNames,
+                ExpressionAttributeValues,
+            )
+            self.items.pop(key, None)
+        self._emit({"key": key[0], "type": key[1]}, old, None)
+        if ReturnValues == "ALL_OLD" and old is not None:
+            return {"Attributes": _copy(old)}
+        return {}
+
+    def scan(
+        self,
+        FilterExpression=None,
+        ProjectionExpression=None,
+        ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None,
+        **_,
+    ):
+        self._count("Scan")
+        expr, names, values = _build(
+            FilterExpression, ExpressionAttributeNames, ExpressionAttributeValues
+        )
+        with self._lock:
+            items = list(self.items.values())
+        if expr:
+            items = [i for i in items if _Expr(expr, names, values).condition(i)]
+        items = [_project(i, ProjectionExpression, names) for i in items]
+        return {"Items": items, "Count": len(items)}
+
+    def batch_writer(self, overwrite_by_pkeys=None) -> "FakeBatchWriter":
+        return FakeBatchWriter(self)
+
+    def query(
+        self,
+        KeyConditionExpression,
+        FilterExpression=None,
+        ProjectionExpression=None,
+        ExpressionAttributeNames=None,
+        ExpressionAttributeValues=None,
+        **_,
+    ):
+        self._count("Query")
+        expr, names, values = _build(
+            KeyConditionExpression,
+            ExpressionAttributeNames,
+            ExpressionAttributeValues,
+            is_key=True,
+        )
+        fexpr, names, values = _build(FilterExpression, names, values)
+        with self._lock:
+            items = [
+                i
+                for i in self.items.values()
+                if _Expr(expr, names, values).condition(i)
+            ]
+        if fexpr:
+            items = [i for i in items if _Expr(fexpr, names, values).condition(i)]
+        items.sort(key=lambda i: i["key"])
+        items = [_project(i, ProjectionExpression, names) for i in items]
+        return {"Items": items, "Count": len(items)}
+
+
+class FakeBatchWriter:
+    """Buffers puts/deletes and flushes them as BatchWriteItem calls."""
+
+    def __init__(self, table: FakeTable) -> None:
+        self.table = table
+        self.pending: List[Tuple[str, Dict]] = []
+
+    def put_item(self, Item):
+        self.pending.append(("put", Item))
+        if len(self.pending) >= 25:
+            self.flush()
+
+    def delete_item(self, Key):
+        self.pending.append(("delete", Key))
+        if len(self.pending) >= 25:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending:
+            return
+        self.table._count("BatchWriteItem")
+        for op, arg in self.pending:
+            if op == "put":
+                self.table.put_item(Item=arg)
+                self.table.calls["PutItem"] -= 1
+            else:
+                self.table.delete_item(Key=arg)
+                self.table.calls["DeleteItem"] -= 1
+        self.pending = []
+
+    def __enter__(self) -> "FakeBatchWriter":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.flush()
+
+
+class FakeDynamoResource:
+    """Stand-in for `boto3.resource("dynamodb")`."""
+
+    def __init__(self, unprocessed_ratio: float = 0.0) -> None:
+        self.tables: Dict[str, FakeTable] = {}
+        # fraction of batch keys returned as unprocessed, like a throttle
+        self.unprocessed_ratio = unprocessed_ratio
+
+    def Table(self, name: str) -> FakeTable:
+        if name not in self.tables:
+            self.tables[name] = FakeTable(name)
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems, **_):
+        responses, unprocessed = {}, {}
+        if sum(len(r["Keys"]) for r in RequestItems.values()) > 100:
+            raise client_error(
+                "ValidationException",
+                "BatchGetItem",
+                msg="Too many items requested for the BatchGetItem call",
+            )
+        for name, request in RequestItems.items():
+            table = self.Table(name)
+            table._count("BatchGetItem")
+            keys = list(request["Keys"])
+            skip = int(len(keys) * self.unprocessed_ratio)
+            if skip:
+                unprocessed[name] = {"Keys": keys[-skip:]}
+                keys = keys[:-skip]
+            options = {k: v for k, v in request.items() if k != "Keys"}
+            found = [table.get_item(Key=key, **options).get("Item") for key in keys]
+            table.calls["GetItem"] -= len(keys)
+            responses[name] = [item for item in found if item is not None]
+        return {"Responses": responses, "UnprocessedKeys": unprocessed}
+
+
+class FakeStream:
+    """DynamoDB stream of a fake table, records are queued until drained."""
+
+    def __init__(self, table: FakeTable) -> None:
+        self.table = table
+        self.queue: Deque[Dict] = deque()
+        self._seq = itertools.count(1)
+        self._serializer = TypeSerializer()
+        self._lock = threading.Lock()
+        table.listeners.append(self._on_change)
+
+    def _image(self, item: Dict) -> Dict:
+        return {k: self._serializer.serialize(v) for k, v in item.items()}
+
+    def _on_change(self, event: str, keys: Dict, old, new) -> None:
+        dynamodb = {
+            "ApproximateCreationDateTime": time.time(),
+            "Keys": self._image(keys),
+            "SequenceNumber": str(next(self._seq)),
+            "StreamViewType": "NEW_AND_OLD_IMAGES",
+        }
+        if old is not None:
+            dynamodb["OldImage"] = self._image(old)
+        if new is not None:
+            dynamodb["NewImage"] = self._image(new)
+        record = {
+            "eventID": uuid.uuid4().hex,
+            "eventName": event,
+            "eventVersion": "1.1",
+            "eventSource": "aws:dynamodb",
+            "dynamodb": dynamodb,
+        }
+        with self._lock:
+            self.queue.append(record)
+
+    def drain(self, deliver: Callable[[Dict], Any], batch_size: int = 100) -> int:
+        """Deliver queued records as stream events until the queue is empty."""
+        delivered = 0
+        while True:
+            with self._lock:
+                if not self.queue:
+                    return delivered
+                batch = [
+                    self.queue.popleft()
+                    for _ in range(min(batch_size, len(self.queue)))
+                ]
+            deliver({"Records": batch})
+            delivered += len(batch)
+
+
+# -- s3 ------------------------------------------------------------------------
+
+
+class FakeS3:
+    """Stand-in for the S3 client, objects are kept by (bucket, key)."""
+
+    def __init__(self) -> None:
+        self.objects: Dict[Tuple[str, str], bytes] = {}
+
+    def put_object(self, Bucket, Key, Body, **_):
+        self.objects[(Bucket, Key)] = Body
+        return {}
+
+
+# -- sns -----------------------------------------------------------------------
+
+
+class FakeSns:
+    """Stand-in for the SNS client, published records are queued."""
+
+    def __init__(self) -> None:
+        self.queue: Deque[Tuple[float, Dict]] = deque()
+        self.published = 0
+        self._lock = threading.Lock()
+
+    def publish(self, TopicArn, Message, Subject=None, **_):
+        message_id = str(uuid.uuid4())
+        record = {
+            "EventSource": "aws:sns",
+            "EventVersion": "1.0",
+            "EventSubscriptionArn": f"{TopicArn}:fake",
+            "Sns": {
+                "Type": "Notification",
+                "MessageId": message_id,
+                "TopicArn": TopicArn,
+                "Subject": Subject,
+                "Message": Message,
+                "Timestamp": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+                "MessageAttributes": {},
+            },
+        }
+        with self._lock:
+            self.queue.append((time.perf_counter(), record))
+            self.published += 1
+        return {"MessageId": message_id}
+
+    def drain(self, deliver: Callable[[Dict], Any], batch_size: int = 1) -> int:
+        """Deliver queued records as SNS events until the queue is empty."""
+        delivered = 0
+        while True:
+            with self._lock:
+                if not self.queue:
+                    return delivered
+                batch = [
+                    self.queue.popleft()[1]
+                    for _ in range(min(batch_size, len(self.queue)))
+                ]
+            deliver({"Records": batch})
+            delivered += len(batch)
+
+
+# -- api gateway management api ------------------------------------------------
+
+
+class FakeGateway:
+    """Stand-in for the `@connections` API, frames land in per-connection inboxes."""
+
+    def __init__(self) -> None:
+        self.connections: Dict[str, Dict] = {}
+        self.inbox: Dict[str, List[Tuple[float, bytes]]] = {}
+        self.posts = 0
+        self.bytes = 0
+        self.on_post: Optional[Callable[[str, bytes], None]] = None
+        # every Nth post is rejected as throttled, 0 disables
+        self.throttle_every = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def open(self, connection_id: str) -> None:
+        with self._lock:
+            self.connections[connection_id] = {
+                "ConnectedAt": time.time(),
+                "LastActiveAt": time.time(),
+            }
+            self.inbox[connection_id] = []
+
+    def close(self, connection_id: str) -> None:
+        with self._lock:
+            self.connections.pop(connection_id, None)
+
+    def _gone(self, op: str):
+        return client_error("GoneException", op, 410, "Connection is gone")
+
+    def post_to_connection(self, ConnectionId, Data, **_):
+        if isinstance(Data, str):
+            Data = Data.encode("utf-8")
+        with self._lock:
+            if ConnectionId not in self.connections:
+                raise self._gone("PostToConnection")
+            if (
+                self.throttle_every
+                and (self.posts + self.throttled + 1) % self.throttle_every == 0
+            ):
+                self.throttled += 1
+                raise client_error("LimitExceededException", "PostToConnection", 429)
+            self.inbox[ConnectionId].append((time.perf_counter(), Data))
+            self.posts += 1
+            self.bytes += len(Data)
+        if self.on_post:
+            self.on_post(ConnectionId, Data)
+        return {}
+
+    def get_connection(self, ConnectionId, **_):
+        with self._lock:
+            if ConnectionId not in self.connections:
+                raise self._gone("GetConnection")
+            return dict(self.connections[ConnectionId])
+
+    def delete_connection(self, ConnectionId, **_):
+        with self._lock:
+            if self.connections.pop(ConnectionId, None) is None:
+                raise self._gone("DeleteConnection")
+        return {}
+
+
+# -- cognito -------------------------------------------------------------------
+
+
+class FakeUserPool:
+    """Local RSA key set that signs Cognito-shaped id tokens."""
+
+    def __init__(self, client_id: str, kid: str = "fake-kid") -> None:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from jose import jwk
+
+        self.client_id = client_id
+        self.kid = kid
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.private_pem = key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        public_pem = key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        # parsing the PEM is the slow part of signing, do it once
+        self.signer = jwk.construct(self.private_pem, "RS256")
+        public = jwk.construct(public_pem, "RS256").to_dict()
+        public.update(kid=kid, use="sig")
+        self.keys = [public]
+
+    def token(self, username: str, ttl: int = 3600) -> str:
+        """Return a signed id token for `username`."""
+        from jose import jwt
+
+        now = int(time.time())
+        claims = {
+            "sub": username,
+            "cognito:username": username,
+            "cognito:groups": ["fake"],
+            "email": f"{username}@example.com",
+            "aud": self.client_id,
+            "token_use": "id",
+            "iat": now,
+            "exp": now + ttl,
+        }
+        return jwt.encode(
+            claims, self.signer, algorithm="RS256", headers={"kid": self.kid}
+        )
+
+    def install(self) -> "FakeUserPool":
+        """Make app.jwt verify against this key set instead of Cognito."""
+        import app.jwt
+
+        app.jwt.keys = self.keys
+        return self
+
+
+class FakeAws:
+    """The set of fakes shared by every client the app creates."""
+
+    def __init__(self) -> None:
+        self.dynamodb = FakeDynamoResource()
+        self.sns = FakeSns()
+        self.s3 = FakeS3()
+        self.gateway = FakeGateway()
+        self._patched: List[Tuple[Any, str, Any]] = []
+
+    def resource(self, service, *args, **kwargs):
+        if service == "dynamodb":
+            return self.dynamodb
+        return self._orig_resource(service, *args, **kwargs)
+
+    def client(self, service, *args, **kwargs):
+        if service == "sns":
+            return self.sns
+        if service == "apigatewaymanagementapi":
+            return self.gateway
+        if service == "s3":
+            return self.s3
+        return self._orig_client(service, *args, **kwargs)
+
+    def install(self) -> "FakeAws":
+        """Route boto3.resource/boto3.client to the fakes."""
+        self._orig_resource = boto3.resource
+        self._orig_client = boto3.client
+        for attr, new in (("resource", self.resource), ("client", self.client)):
+            self._patched.append((boto3, attr, getattr(boto3, attr)))
+            setattr(boto3, attr, new)
+        self._reset_app()
+        return self
+
+    def uninstall(self) -> None:
+        while self._patched:
+            obj, attr, orig = self._patched.pop()
+            setattr(obj, attr, orig)
+        self._reset_app()
+
+    @staticmethod
+    def _reset_app() -> None:
+        """Drop clients and boards the app cached from a previous boto3."""
+        from app import boards, clients, dedupe, ratelimit, snapshots
+
+        clients.reset()
+        boards.reset()
+        dedupe.reset()
+        ratelimit.reset()
+        snapshots.reset()
+
+
+def install() -> FakeAws:
+    """Install a fresh set of fakes and return them."""
+    return FakeAws().install()
+
+
+class FakeContext:
+    """Lambda context with a wall-clock deadline."""
+
+    def __init__(self, function_name: str = "bench", timeout: float = 30.0) -> None:
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self.memory_limit_in_mb = 128
+        self._deadline = time.time() + timeout
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self._deadline - time.time()) * 1000))
+
+
+_ids = itertools.count()
+
+
+def connection_id() -> str:
+    """Return a unique fake connection id."""
+    return f"conn-{next(_ids):06d}-{uuid.uuid4().hex[:8]}"
@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""gateway.py: Local API Gateway websocket emulator.
+
+Serves websockets with asyncio and routes them to the Lambda handlers in
+process, the way the deployed websocket API does: `$connect` and
+`$disconnect` go to `handler.connect`, every message to
+`handler.message` (`$default`). Handlers run on a thread pool, one
+worker per concurrent invocation, against the in-memory fakes in
+bench.fakes, and the SNS and DynamoDB stream records they produce are
+pumped to `handler.sns` and `handler.dynstream` as they are published.
+
+The `@connections` management API is served to the app in process, in
+place of the fake gateway, and over HTTP (POST/GET/DELETE
+/@connections/{id}) for handlers running elsewhere, e.g. offline ones
+posting to http://localhost:3001. Tokens are signed by the fake user
+pool, one is printed at start. Run from the backend directory:
+
+    python -m bench.gateway --port 3001 --rate 1
+"""
+import argparse
+import asyncio
+import base64
+import datetime
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl, unquote
+
+from botocore.exceptions import ClientError
+
+import bench.env  # noqa: F401
+from bench import fakes, ws
+from bench.loadtest import Recorder, print_report
+
+logger = logging.getLogger("gateway")
+
+MANAGEMENT_RE = re.compile(r"/@connections/([^/]+)$")
+# seconds between polls of an idle SNS topic or stream
+PUMP_INTERVAL = 0.002
+# API Gateway closes connections idle for 10 minutes
+IDLE_TIMEOUT = 600
+
+
+class Client:
+    """An open websocket and what API Gateway tracks about it."""
+
+    __slots__ = ("socket", "connected_at", "last_active", "source_ip", "user_agent")
+
+    def __init__(self, source_ip: str, user_agent: str) -> None:
+        self.socket: Optional[ws.Connection] = None
+        self.connected_at = time.time()
+        self.last_active = self.connected_at
+        self.source_ip = source_ip
+        self.user_agent = user_agent
+
+
+class ManagementApi:
+    """The gateway's `@connections` API, with boto3 client signatures.
+
+    Called from handler threads, frames are handed to the event loop.
+    """
+
+    def __init__(self, gateway: "Gateway") -> None:
+        self.gateway = gateway
+        self.posts = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def _client(self, connection_id: str, op: str) -> Client:
+        client = self.gateway.connections.get(connection_id)
+        if client is None or not client.socket.open:
+            raise fakes.client_error("GoneException", op, 410, "Connection is gone")
+        return client
+
+    def post_to_connection(self, ConnectionId, Data, **_):
+        client = self._client(ConnectionId, "PostToConnection")
+        if isinstance(Data, str):
+            Data = Data.encode("utf-8")
+        with self._lock:
+            self.posts += 1
+            self.bytes += len(Data)
+        try:
+            # JSON goes out as text frames, like API Gateway sends it
+            data: Union[str, bytes] = Data.decode("utf-8")
+        except UnicodeDecodeError:
+            data = Data
+        self.gateway.loop.call_soon_threadsafe(client.socket.send_nowait, data)
+        return {}
+
+    def get_connection(self, ConnectionId, **_):
+        client = self._client(ConnectionId, "GetConnection")
+        return {
+            "ConnectedAt": _datetime(client.connected_at),
+            "LastActiveAt": _datetime(client.last_active),
+            "Identity": {
+                "SourceIp": client.source_ip,
+                "UserAgent": client.user_agent,
+            },
+        }
+
+    def delete_connection(self, ConnectionId, **_):
+        client = self._client(ConnectionId, "DeleteConnection")
+        asyncio.run_coroutine_threadsafe(client.socket.close(), self.gateway.loop)
+        return {}
+
+
+def _datetime(ts: float) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc)
+
+
+class Gateway:
+    """Websocket API emulator running the handlers on a thread pool."""
+
+    def __init__(
+        self,
+        aws: fakes.FakeAws,
+        host: str = "127.0.0.1",
+        port: int = 3001,
+        concurrency: int = 64,
+        sns_workers: int = 4,
+        idle_timeout: float = IDLE_TIMEOUT,
+    ) -> None:
+        # app modules bind boto3 at import, load them after the fakes
+        import handler
+        from app import clients
+        from app.config import Config
+
+        self.handler = handler
+        self.config = Config()
+        self.aws = aws
+        self.host = host
+        self.port = port
+        self.stage = self.config.stage
+        self.domain = f"{host}:{port}"
+        self.concurrency = concurrency
+        self.sns_workers = sns_workers
+        self.idle_timeout = idle_timeout
+        self.api = ManagementApi(self)
+        aws.gateway = self.api
+        clients.reset()
+        self.table = aws.dynamodb.Table(self.config.table)
+        self.stream = fakes.FakeStream(self.table)
+        self.recorder = Recorder()
+        self.connections: Dict[str, Client] = {}
+        # start times of the ticks that lit each cell
+        self.cells: Dict[Tuple[int, int], List[float]] = {}
+        self.ticks = 0
+        self.inflight = 0
+        self._inflight_lock = threading.Lock()
+        self._tasks: set = set()
+        self.pool: Optional[ThreadPoolExecutor] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # -- lifecycle ---------------------------------------------------------
+
+    async def start(self) -> None:
+        """Listen, and start pumping SNS and stream records."""
+        self.loop = asyncio.get_running_loop()
+        # pumps hold workers while draining, keep them out of the count
+        self.pool = ThreadPoolExecutor(
+            max_workers=self.concurrency + self.sns_workers + 1
+        )
+        self.server = await asyncio.start_server(
+            self._serve, self.host, self.port, backlog=4096, limit=ws.MAX_MESSAGE
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.domain = f"{self.host}:{self.port}"
+        self._spawn(self._pump("dynstream", self._drain_stream))
+        for _ in range(self.sns_workers):
+            self._spawn(self._pump("sns", self._drain_sns))
+        self._spawn(self._sweep())
+        # the handler pool is capped separately, like reserved concurrency
+        self.slots = asyncio.Semaphore(self.concurrency)
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    async def stop(self) -> None:
+        """Close every connection, running `$disconnect`, and stop."""
+        self.server.close()
+        for client in list(self.connections.values()):
+            await client.socket.close(1001, "Going away")
+        deadline = time.monotonic() + ws.CLOSE_TIMEOUT + 1
+        while self.connections and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        await self.settle()
+        for task in list(self._tasks):
+            task.cancel()
+        await self.server.wait_closed()
+        self.pool.shutdown(wait=True)
+
+    async def settle(self, timeout: float = 30) -> None:
+        """Wait until no invocation runs and no record is queued."""
+        deadline = time.monotonic() + timeout
+        quiet = 0
+        while quiet < 3 and time.monotonic() < deadline:
+            busy = self.inflight or self.aws.sns.queue or self.stream.queue
+            quiet = 0 if busy else quiet + 1
+            await asyncio.sleep(0.01)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    # -- invocations -------------------------------------------------------
+
+    def _call(self, route: str, func: Callable, *args) -> Any:
+        """Run one invocation on the calling thread, timing it."""
+        with self._inflight_lock:
+            self.inflight += 1
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        except Exception:
+            self.recorder.error(route)
+            raise
+        finally:
+            self.recorder.record(route, time.perf_counter() - start)
+            with self._inflight_lock:
+                self.inflight -= 1
+
+    async def invoke(self, route: str, func: Callable, event: Dict) -> Any:
+        """Invoke a handler on the pool, like a Lambda integration."""
+        async with self.slots:
+            return await self.loop.run_in_executor(
+                self.pool, self._call, route, func, event, fakes.FakeContext(route)
+            )
+
+    def _deliver(self, route: str, func: Callable) -> Callable[[Dict], None]:
+        def deliver(event: Dict) -> None:
+            try:
+                self._call(route, func, event, fakes.FakeContext(route))
+            except Exception as e:
+                logger.error("%s invocation failed: %s", route, e)
+
+        return deliver
+
+    def _drain_sns(self) -> int:
+        return self.aws.sns.drain(self._deliver("sns", self.handler.sns))
+
+    def _drain_stream(self) -> int:
+        return self.stream.drain(self._deliver("dynstream", self.handler.dynstream))
+
+    async def _pump(self, route: str, drain: Callable[[], int]) -> None:
+        while True:
+            moved = await self.loop.run_in_executor(self.pool, drain)
+            if not moved:
+                await asyncio.sleep(PUMP_INTERVAL)
+
+    async def tick_forever(self, rate: float, channel: Optional[str] = None) -> None:
+        """Step a board `rate` times a second, as `schedule_random` does."""
+        from app.messages import DEFAULT_CHANNEL
+        from app.scheduler import step
+
+        channel = channel or DEFAULT_CHANNEL
+        period = 1.0 / rate
+        start = self.loop.time()
+        n = 0
+        while True:
+            n += 1
+            delay = start + n * period - self.loop.time()
+            if delay < 0:
+                # missed deadlines are skipped, not run back to back
+                n += int(-delay // period) + 1
+                delay = start + n * period - self.loop.time()
+            await asyncio.sleep(delay)
+            started = time.perf_counter()
+            res = await self.loop.run_in_executor(
+                self.pool, self._call, "tick", step, channel
+            )
+            self.ticks += 1
+            if res:
+                self.cells.setdefault((res["x"], res["y"]), []).append(started)
+
+    # -- websocket routes --------------------------------------------------
+
+    def _event(
+        self, cid: str, client: Client, event_type: str, route_key: str, **extra
+    ) -> Dict:
+        now = time.time()
+        event = {
+            "requestContext": {
+                "routeKey": route_key,
+                "eventType": event_type,
+                "connectionId": cid,
+                "domainName": self.domain,
+                "stage": self.stage,
+                "apiId": "local",
+                "requestId": uuid.uuid4().hex,
+                "requestTimeEpoch": int(now * 1000),
+                "connectedAt": int(client.connected_at * 1000),
+                "messageDirection": "IN",
+                "identity": {
+                    "sourceIp": client.source_ip,
+                    "userAgent": client.user_agent,
+                },
+            },
+            "isBase64Encoded": False,
+        }
+        event.update(extra)
+        return event
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request_line, headers = await ws.read_head(reader)
+            method, target, _ = request_line.split(" ", 2)
+        except (
+            asyncio.IncompleteReadError,
+            asyncio.LimitOverrunError,
+            ValueError,
+            ConnectionError,
+        ):
+            writer.close()
+            return
+        path, _, query = target.partition("?")
+        match = MANAGEMENT_RE.search(path)
+        if match:
+            await self._manage(method, unquote(match.group(1)), headers, reader, writer)
+        elif ws.is_upgrade(headers):
+            await self._session(reader, writer, headers, query)
+        else:
+            writer.write(ws.response(426, b"Upgrade Required"))
+            writer.close()
+
+    async def _session(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        headers: ws.Headers,
+        query: str,
+    ) -> None:
+        cid = fakes.connection_id()
+        peer = writer.get_extra_info("peername") or ("127.0.0.1", 0)
+        client = Client(peer[0], headers.get("user-agent", ""))
+        extra: Dict[str, Any] = {"headers": headers}
+        params = dict(parse_qsl(query))
+        if params:
+            extra["queryStringParameters"] = params
+        event = self._event(cid, client, "CONNECT", "$connect", **extra)
+        try:
+            res = await self.invoke("connect", self.handler.connect, event)
+        except Exception as e:
+            logger.error("$connect of %s failed: %s", cid, e)
+            res = {"statusCode": 500, "body": "Internal server error"}
+        status = res.get("statusCode", 200) if isinstance(res, dict) else 200
+        if not 200 <= status < 300:
+            body = str(res.get("body", "")).encode("utf-8")
+            writer.write(ws.response(status, body))
+            writer.close()
+            return
+        client.socket = await ws.accept(reader, writer, headers)
+        self.connections[cid] = client
+        try:
+            async for message in client.socket:
+                client.last_active = time.time()
+                self._spawn(self._message(cid, client, message))
+        finally:
+            self.connections.pop(cid, None)
+            event = self._event(
+                cid,
+                client,
+                "DISCONNECT",
+                "$disconnect",
+                disconnectStatusCode=client.socket.close_code,
+                disconnectReason="",
+            )
+            try:
+                await self.invoke("disconnect", self.handler.connect, event)
+            except Exception as e:
+                logger.error("$disconnect of %s failed: %s", cid, e)
+
+    async def _message(
+        self, cid: str, client: Client, message: Union[str, bytes]
+    ) -> None:
+        extra: Dict[str, Any] = {"body": message}
+        if isinstance(message, bytes):
+            extra = {
+                "body": base64.b64encode(message).decode("ascii"),
+                "isBase64Encoded": True,
+            }
+        event = self._event(
+            cid, client, "MESSAGE", "$default", messageId=uuid.uuid4().hex, **extra
+        )
+        try:
+            await self.invoke("message", self.handler.message, event)
+        except Exception as e:
+            logger.error("$default of %s failed: %s", cid, e)
+            # what API Gateway answers when the integration fails
+            client.socket.send_nowait(
+                json.dumps(
+                    {
+                        "message": "Internal server error",
+                        "connectionId": cid,
+                        "requestId": event["requestContext"]["requestId"],
+                    }
+                )
+            )
+
+    async def _sweep(self) -> None:
+        while True:
+            await asyncio.sleep(min(30, self.idle_timeout))
+            cutoff = time.time() - self.idle_timeout
+            for client in list(self.connections.values()):
+                if client.last_active < cutoff:
+                    await client.socket.close(1001, "Going away")
+
+    # -- @connections over HTTP --------------------------------------------
+
+    async def _manage(
+        self,
+        method: str,
+        cid: str,
+        headers: ws.Headers,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        json_type = {"Content-Type": "application/json"}
+        try:
+            body = await ws.read_body(reader, headers)
+            if method == "POST":
+                self.api.post_to_connection(ConnectionId=cid, Data=body)
+                out = ws.response(200)
+            elif method == "GET":
+                info = self.api.get_connection(ConnectionId=cid)
+                doc = {
+                    "connectedAt": info["ConnectedAt"].isoformat(),
+                    "lastActiveAt": info["LastActiveAt"].isoformat(),
+                    "identity": {
+                        "sourceIp": info["Identity"]["SourceIp"],
+                        "userAgent": info["Identity"]["UserAgent"],
+                    },
+                }
+                out = ws.response(200, json.dumps(doc).encode("utf-8"), json_type)
+            elif method == "DELETE":
+                self.api.delete_connection(ConnectionId=cid)
+                out = ws.response(204)
+            else:
+                out = ws.response(404)
+        except ClientError as e:
+            doc = {"message": e.response["Error"]["Message"]}
+            out = ws.response(
+                410,
+                json.dumps(doc).encode("utf-8"),
+                {**json_type, "x-amzn-ErrorType": e.response["Error"]["Code"]},
+            )
+        except (asyncio.IncompleteReadError, ValueError):
+            out = ws.response(400)
+        writer.write(out)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    # -- report ------------------------------------------------------------
+
+    def report(self) -> Dict:
+        """Return what the fakes and handlers saw."""
+        return {
+            "connections": len(self.connections),
+            "ticks": self.ticks,
+            "frames_posted": self.api.posts,
+            "bytes_posted": self.api.bytes,
+            "sns_published": self.aws.sns.published,
+            "dynamodb_calls": dict(sorted(self.table.calls.items())),
+        }
+
+
+async def serve(args) -> None:
+    aws = fakes.install()
+    gateway = Gateway(
+        aws,
+        args.host,
+        args.port,
+        concurrency=args.concurrency,
+        sns_workers=args.sns_workers,
+    )
+    pool = fakes.FakeUserPool(gateway.config.app_client_id).install()
+    await gateway.start()
+    print(f"Listening on {gateway.url}")
+    print(f"{gateway.url}/?token={pool.token(args.user, ttl=24 * 3600)}")
+    start = time.perf_counter()
+    try:
+        if args.rate:
+            await gateway.tick_forever(args.rate)
+        else:
+            await asyncio.Event().wait()
+    finally:
+        await gateway.stop()
+        aws.uninstall()
+        report = gateway.report()
+        report["routes"] = gateway.recorder.summary(time.perf_counter() - start)
+        print_report(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    parser.add_argument(
+        "--rate", type=float, default=1.0, help="cell events/sec, 0 disables"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=64, help="concurrent invocations"
+    )
+    parser.add_argument(
+        "--sns-workers", type=int, default=4, help="concurrent SNS pumps"
+    )
+    parser.add_argument("--user", default="local", help="user of the printed token")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
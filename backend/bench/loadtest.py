@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""loadtest.py: In-process load test of the Lambda handlers.
+
+Drives `handler.connect`, `handler.message`, `handler.sns` and
+`handler.dynstream` against the in-memory fakes in bench.fakes. N clients
+connect and save alert boxes, then cell events are generated at the
+requested rate and every resulting SNS/stream record is delivered before
+the next tick. Run from the backend directory:
+
+    python -m bench.loadtest --clients 1000 --rate 5 --duration 10
+"""
+import argparse
+import json
+import random
+import time
+from typing import Dict, List, Optional
+
+import bench.env  # noqa: F401
+from bench import fakes
+
+DOMAIN = "bench.execute-api.us-east-2.amazonaws.com"
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of `samples`."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+class Recorder:
+    """Latency samples per route, in seconds."""
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, route: str, seconds: float) -> None:
+        self.samples.setdefault(route, []).append(seconds)
+
+    def error(self, route: str) -> None:
+        self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, elapsed: float) -> Dict[str, Dict]:
+        out = {}
+        for route, samples in sorted(self.samples.items()):
+            out[route] = {
+                "count": len(samples),
+                "errors": self.errors.get(route, 0),
+                "per_sec": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+                "p50_ms": round(percentile(samples, 50) * 1000, 3),
+                "p90_ms": round(percentile(samples, 90) * 1000, 3),
+                "p99_ms": round(percentile(samples, 99) * 1000, 3),
+                "max_ms": round(max(samples) * 1000, 3),
+            }
+        return out
+
+
+class LoadTest:
+    """One load-test run against a fresh set of fakes."""
+
+    def __init__(
+        self,
+        clients: int,
+        rate: float,
+        duration: float,
+        boxes: int = 1,
+        stream: bool = True,
+        sns_batch: int = 1,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.clients = clients
+        self.rate = rate
+        self.duration = duration
+        self.boxes = boxes
+        self.stream_enabled = stream
+        self.sns_batch = sns_batch
+        self.random = random.Random(seed)
+        self.aws = fakes.install()
+        # app modules bind boto3 at import, load them after the fakes
+        import handler
+        from app.config import Config
+
+        self.handler = handler
+        self.config = Config()
+        self.pool = fakes.FakeUserPool(self.config.app_client_id).install()
+        self.table = self.aws.dynamodb.Table(self.config.table)
+        self.stream = fakes.FakeStream(self.table)
+        self.recorder = Recorder()
+        self.connection_ids: List[str] = []
+
+    def close(self) -> None:
+        self.aws.uninstall()
+
+    def call(self, route: str, func, event: Dict) -> Optional[Dict]:
+        start = time.perf_counter()
+        try:
+            return func(event, fakes.FakeContext(route))
+        except Exception:
+            self.recorder.error(route)
+            return None
+        finally:
+            self.recorder.record(route, time.perf_counter() - start)
+
+    def ws_event(self, cid: str, event_type: str, route_key: str, **extra) -> Dict:
+        event = {
+            "requestContext": {
+                "connectionId": cid,
+                "eventType": event_type,
+                "routeKey": route_key,
+                "domainName": DOMAIN,
+                "stage": self.config.stage,
+            },
+            "queryStringParameters": {},
+        }
+        event.update(extra)
+        return event
+
+    def send(self, cid: str, action: str, message=None) -> None:
+        body = json.dumps({"action": action, "message": message or {}})
+        event = self.ws_event(cid, "MESSAGE", "$default", body=body)
+        self.call("message", self.handler.message, event)
+
+    def random_box(self) -> Dict[str, int]:
+        x1, y1 = self.random.randint(0, 45), self.random.randint(0, 45)
+        return {
+            "x1": x1,
+            "y1": y1,
+            "x2": x1 + self.random.randint(1, 5),
+            "y2": y1 + self.random.randint(1, 5),
+        }
+
+    def connect_clients(self) -> None:
+        for i in range(self.clients):
+            cid = fakes.connection_id()
+            self.aws.gateway.open(cid)
+            token = self.pool.token(f"user-{i}")
+            event = self.ws_event(
+                cid, "CONNECT", "$connect", queryStringParameters={"token": token}
+            )
+            res = self.call("connect", self.handler.connect, event)
+            if not res or res.get("statusCode") != 200:
+                self.recorder.error("connect")
+                continue
+            self.connection_ids.append(cid)
+            self.send(cid, "send_alert_boxes")
+            self.send(cid, "send_all_active_cells")
+            self.send(cid, "send_connection_id")
+            for _ in range(self.boxes):
+                self.send(cid, "save_alert_box", self.random_box())
+        self.pump()
+
+    def pump(self) -> None:
+        """Deliver stream and SNS records until both are idle."""
+        while True:
+            moved = 0
+            if self.stream_enabled:
+                moved += self.stream.drain(
+                    lambda e: self.call("dynstream", self.handler.dynstream, e)
+                )
+            else:
+                self.stream.queue.clear()
+            moved += self.aws.sns.drain(
+                lambda e: self.call("sns", self.handler.sns, e), self.sns_batch
+            )
+            if not moved:
+                return
+
+    def tick(self) -> None:
+        """One scheduler step, as done by `handler.schedule_random`."""
+        from app.messages import DEFAULT_CHANNEL
+        from app.scheduler import step
+
+        step(DEFAULT_CHANNEL)
+
+    def run(self) -> Dict:
+        start = time.perf_counter()
+        self.connect_clients()
+        connected = time.perf_counter()
+        events = int(self.rate * self.duration)
+        for i in range(events):
+            deadline = connected + i / self.rate
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            tick_start = time.perf_counter()
+            self.call("tick", lambda *_: self.tick(), {})
+            self.pump()
+            self.recorder.record("cell_event_e2e", time.perf_counter() - tick_start)
+        end = time.perf_counter()
+        gateway = self.aws.gateway
+        return {
+            "clients": len(self.connection_ids),
+            "cell_events": events,
+            "target_rate": self.rate,
+            "achieved_rate": round(events / (end - connected), 2) if events else 0,
+            "connect_seconds": round(connected - start, 3),
+            "run_seconds": round(end - connected, 3),
+            "frames_posted": gateway.posts,
+            "bytes_posted": gateway.bytes,
+            "sns_published": self.aws.sns.published,
+            "dynamodb_calls": dict(sorted(self.table.calls.items())),
+            "routes": self.recorder.summary(end - start),
+        }
+
+
+def print_report(report: Dict) -> None:
+    routes = report.pop("routes")
+    for key, val in report.items():
+        print(f"{key:<16} {val}")
+    print()
+    cols = ("count", "errors", "per_sec", "p50_ms", "p90_ms", "p99_ms", "max_ms")
+    print(f"{'route':<16}" + "".join(f"{c:>10}" for c in cols))
+    for route, stats in routes.items():
+        print(f"{route:<16}" + "".join(f"{stats[c]:>10}" for c in cols))
+    report["routes"] = routes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=2.0, help="cell events/sec")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--boxes", type=int, default=1, help="alert boxes/client")
+    parser.add_argument("--no-stream", action="store_true", help="skip dynstream")
+    parser.add_argument("--sns-batch", type=int, default=1, help="records/invocation")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+    test = LoadTest(
+        args.clients,
+        args.rate,
+        args.duration,
+        boxes=args.boxes,
+        stream=not args.no_stream,
+        sns_batch=args.sns_batch,
+        seed=args.seed,
+    )
+    try:
+        report = test.run()
+    finally:
+        test.close()
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""parse_dispatch.py: Compare raw-dict and typed message parse+dispatch.
+
+Run from the backend directory:
+
+    python -m bench.parse_dispatch
+"""
+import json
+import timeit
+
+import bench.env  # noqa: F401
+
+from app.control import Control
+
+NUMBER = 20000
+
+FRAMES = {
+    "ping": json.dumps({"action": "ping", "message": {}}),
+    "save_alert_box": json.dumps(
+        {"action": "save_alert_box", "message": {"x1": 1, "y1": 2, "x2": 10, "y2": 12}}
+    ),
+    "bad_frame": json.dumps({"action": "save_alert_box", "message": {"x1": "a"}}),
+}
+
+
+class _NullTable:
+    """Table stand-in that answers every call without I/O."""
+
+    item = {"domain": "bench.example.com", "stage": "bench", "user": "bench"}
+
+    def get_item(self, **_):
+        return {"Item": self.item}
+
+    def update_item(self, **_):
+        return {}
+
+    def put_item(self, **_):
+        return {}
+
+
+def _control() -> Control:
+    control = Control("bench-connection")
+    control.table = _NullTable()
+    control.send_message = lambda _: None
+    return control
+
+
+def legacy_parse_dispatch(control: Control, body: str) -> None:
+    """Replay of the former raw-dict path for comparison."""
+    message = json.loads(body)
+    control._set_by_connection_id()
+    action = message.get("action")
+    if action == "ping":
+        control.send_message({"action": "info", "message": "pong!"})
+    elif action == "save_alert_box":
+        data = message.get("message", {})
+        control.table.update_item(
+            Key={"key": "alert_box", "type": control.user},
+            UpdateExpression="set alert_boxes = list_append(alert_boxes, :i)",
+            ExpressionAttributeValues={
+                ":i": [
+                    {
+                        "x1": data.get("x1"),
+                        "y1": data.get("y1"),
+                        "x2": data.get("x2"),
+                        "y2": data.get("y2"),
+                    }
+                ]
+            },
+            ReturnValues="UPDATED_NEW",
+        )
+        control.send_message(control.action_send_alert_boxes(None))
+
+
+def main():
+    control = _control()
+    # alert box replies re-read the boxes, keep both paths comparable
+    control._get_alert_boxes = lambda: []
+    print(f"{'frame':<16} {'legacy us':>10} {'typed us':>10}")
+    for name, body in FRAMES.items():
+        legacy = timeit.timeit(
+            lambda: legacy_parse_dispatch(control, body), number=NUMBER
+        )
+        typed = timeit.timeit(lambda: control.parse_message(body), number=NUMBER)
+        print(
+            f"{name:<16} {legacy / NUMBER * 1e6:>10.2f} {typed / NUMBER * 1e6:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""scheduler.py: Achieved tick rate of the multi-board scheduler.
+
+Runs `app.scheduler.Scheduler` against the in-memory fakes in
+bench.fakes, with a few connections subscribed to every board and a
+modelled DynamoDB round trip, and prints the scheduler's report. Run
+from the backend directory:
+
+    python -m bench.scheduler --boards 200 --rate 1 --duration 10
+"""
+import argparse
+import json
+
+import bench.env  # noqa: F401
+from bench import fakes
+
+DOMAIN = "bench.execute-api.us-east-2.amazonaws.com"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boards", type=int, default=100)
+    parser.add_argument("--clients", type=int, default=2, help="connections/board")
+    parser.add_argument("--rate", type=float, default=1.0, help="ticks/sec/board")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument(
+        "--latency-ms", type=float, default=5.0, help="per DynamoDB call"
+    )
+    args = parser.parse_args()
+
+    aws = fakes.install()
+    try:
+        from app import clients
+        from app.control import Control
+        from app.scheduler import Scheduler
+
+        boards = [f"board-{i}" for i in range(args.boards)]
+        for board in boards:
+            for _ in range(args.clients):
+                cid = fakes.connection_id()
+                aws.gateway.open(cid)
+                Control(cid).save_connection(DOMAIN, "bench", "", board)
+        clients.table().latency = args.latency_ms / 1000
+        context = fakes.FakeContext(timeout=args.duration)
+        report = Scheduler(boards, args.rate, args.workers, margin=0).run(context)
+        report["target_ticks_per_sec"] = args.boards * args.rate
+        report["posts"] = aws.gateway.posts
+    finally:
+        aws.uninstall()
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""test_boards.py: Summed-area counts match counting the cells one by one."""
+import random
+from decimal import Decimal
+
+import pytest
+
+SIZE = 50
+
+
+def _brute(cells, x1, y1, x2, y2):
+    """Count by hand, corners in any order, anything off the grid is empty."""
+    xs = range(min(x1, x2), max(x1, x2))
+    ys = range(min(y1, y2), max(y1, y2))
+    return sum(1 for x, y in cells if x in xs and y in ys)
+
+
+def _boxes(rng, count):
+    # swapped corners and coordinates off the grid on both sides
+    return [tuple(rng.randint(-10, SIZE + 10) for _ in range(4)) for _ in range(count)]
+
+
+def _cells(rng, count):
+    return {(rng.randrange(SIZE), rng.randrange(SIZE)) for _ in range(count)}
+
+
+@pytest.mark.parametrize("fill", [0, 1, 100, 2500])
+def test_count_matches_brute_force(fill):
+    from app.boards import Board
+
+    rng = random.Random(fill)
+    cells = _cells(rng, fill)
+    board = Board(0, [f"{x},{y}" for x, y in cells])
+    for box in _boxes(rng, 500) + [(0, 0, SIZE, SIZE), (0, 0, 60, 60), (5, 0, 2, 50)]:
+        assert board.count(*box) == _brute(cells, *box), box
+
+
+def test_with_cell_matches_brute_force():
+    from app.boards import Board
+
+    rng = random.Random(1)
+    board = Board(0, [])
+    board.sat
+    cells = set()
+    for version in range(1, 300):
+        x, y = rng.randrange(SIZE), rng.randrange(SIZE)
+        # cells already active are added again now and then
+        board = board.with_cell(version, f"{x},{y}")
+        cells.add((x, y))
+        for box in _boxes(rng, 5):
+            assert board.count(*box) == _brute(cells, *box), box
+    assert board.sat == Board(0, board.cells).sat
+
+
+def test_reported_boxes():
+    from app.boards import Board
+
+    board = Board(0, ["3,3", "4,10"])
+    assert board.count(5, 0, 2, 50) == 2
+    assert board.count(0, 0, 60, 60) == 2
+
+
+def test_malformed_stored_boxes_are_skipped(aws, table):
+    from app.control import Control
+    from app.messages import Message
+
+    control = Control("bench-connection")
+    control.user = "bench-user"
+    state = control.state
+    table.put_item(
+        Item={
+            "key": state.KEY,
+            "type": state.type,
+            state.TYPE: ["1,1", "2,2"],
+            "version": 1,
+        }
+    )
+    good = {"x1": Decimal(3), "y1": Decimal(3), "x2": Decimal(0), "y2": Decimal(0)}
+    bad = [
+        {"x1": Decimal("1.5"), "y1": 0, "x2": 5, "y2": 5},
+        {"x1": None, "y1": 0, "x2": 5, "y2": 5},
+        {"x1": "left", "y1": 0, "x2": 5, "y2": 5},
+        {"x1": True, "y1": 0, "x2": 5, "y2": 5},
+        {"y1": 0, "x2": 5, "y2": 5},
+    ]
+    table.put_item(
+        Item={"key": "alert_box", "type": "bench-user", "alert_boxes": [good, *bad]}
+    )
+    stats = control.action_box_stats(Message("box_stats"))["message"]
+    assert [box["active"] for box in stats] == [2]
+    assert control.state.box_counts([good, *bad]) == [2] + [None] * len(bad)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""test_dedupe.py: Redelivered SNS records are dropped, failed ones retried."""
+import pytest
+
+from bench import fakes
+
+
+def _records(aws, count):
+    from app.control import ROUTE_SEND_MESSAGE, Control, SnsRouter
+
+    cid = fakes.connection_id()
+    aws.gateway.open(cid)
+    Control(cid).save_connection("bench.example.com", "bench", "bench-user")
+    for i in range(count):
+        SnsRouter().publish(
+            ROUTE_SEND_MESSAGE,
+            {"connection_id": cid, "data": {"action": "info", "message": i}},
+        )
+    return [aws.sns.queue.popleft()[1] for _ in range(count)], cid
+
+
+def test_redelivery_is_dropped(aws):
+    from app.control import SnsBatchHandler
+
+    records, _ = _records(aws, 1)
+    SnsBatchHandler(records).handle()
+    SnsBatchHandler(records).handle()
+    assert aws.gateway.posts == 1
+
+
+def test_failed_claim_releases_earlier_claims(aws, table):
+    from app.control import SnsBatchHandler
+
+    records, cid = _records(aws, 2)
+    put_item = table.put_item
+    claims = []
+
+    def throttled_second_claim(**kwargs):
+        if kwargs["Item"]["key"] == "dedupe":
+            claims.append(kwargs["Item"]["type"])
+            if len(claims) == 2:
+                raise fakes.client_error(
+                    "ProvisionedThroughputExceededException", "PutItem"
+                )
+        return put_item(**kwargs)
+
+    table.put_item = throttled_second_claim
+    with pytest.raises(Exception):
+        SnsBatchHandler(records).handle()
+    assert aws.gateway.posts == 0
+    # the SNS retry delivers both, the first claim was released
+    SnsBatchHandler(records).handle()
+    assert aws.gateway.posts == 2
+    assert [frame for _, frame in aws.gateway.inbox[cid]] == [
+        b'{"action": "info", "message": 0}',
+        b'{"action": "info", "message": 1}',
+    ]
+
+
+def _broadcast(aws, count):
+    from app.control import Broadcast, Control
+
+    cids = []
+    for i in range(count):
+        cid = fakes.connection_id()
+        aws.gateway.open(cid)
+        Control(cid).save_connection("bench.example.com", "bench", f"user-{i}")
+        cids.append(cid)
+    Broadcast().send_message({"action": "info", "message": "hello"})
+    return [record for _, record in aws.sns.queue], cids
+
+
+def test_connections_are_grouped_per_message(aws, monkeypatch):
+    from app import control
+    from app.control import SnsBatchHandler
+
+    monkeypatch.setattr(control.config, "sns_group_max", 5)
+    records, cids = _broadcast(aws, 12)
+    assert len(records) == 3
+    SnsBatchHandler(records).handle()
+    assert sorted(aws.gateway.inbox) == sorted(cids)
+    assert all(len(frames) == 1 for frames in aws.gateway.inbox.values())
+
+
+def test_grouped_retry_only_reaches_undelivered(aws, monkeypatch):
+    from app import delivery
+    from app.control import SnsBatchHandler
+
+    records, cids = _broadcast(aws, 12)
+    assert len(records) == 1
+    monkeypatch.setattr(delivery.config, "delivery_attempts", 1)
+    post = aws.gateway.post_to_connection
+
+    def throttled(ConnectionId, Data, **kwargs):
+        if ConnectionId == cids[0]:
+            raise fakes.client_error("LimitExceededException", "PostToConnection", 429)
+        return post(ConnectionId=ConnectionId, Data=Data, **kwargs)
+
+    aws.gateway.post_to_connection = throttled
+    with pytest.raises(delivery.DeliveryError):
+        SnsBatchHandler(records).handle()
+    assert aws.gateway.posts == 11
+    # the SNS retry only reaches the throttled connection
+    aws.gateway.post_to_connection = post
+    SnsBatchHandler(records).handle()
+    assert aws.gateway.posts == 12
+    assert all(len(frames) == 1 for frames in aws.gateway.inbox.values())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""test_delivery.py: Large frames survive packing, chunking and SNS splitting."""
+import base64
+import json
+import random
+
+import pytest
+
+from bench import fakes
+
+
+def _frame(size):
+    # random bytes do not compress, so the packed frame stays large
+    blob = random.Random(size).getrandbits(8 * size).to_bytes(size, "little")
+    return {"action": "all_active_cells", "message": base64.b64encode(blob).decode()}
+
+
+def _reassemble(messages):
+    """What a client does with the websocket messages of one frame."""
+    from app.delivery import CHUNK_ACTION, decompress
+
+    frames = [json.loads(message) for message in messages]
+    if frames[0].get("action") != CHUNK_ACTION:
+        assert len(frames) == 1
+        return frames[0]
+    chunks = sorted((frame["message"] for frame in frames), key=lambda c: c["seq"])
+    assert len({chunk["id"] for chunk in chunks}) == 1
+    assert [chunk["seq"] for chunk in chunks] == list(range(chunks[0]["total"]))
+    return json.loads(decompress("".join(chunk["data"] for chunk in chunks)))
+
+
+@pytest.mark.parametrize("size", [100, 50 * 1024, 400 * 1024])
+def test_frames_round_trip(size):
+    from app import delivery
+
+    data = _frame(size)
+    messages = delivery.frames(data)
+    assert all(len(m) <= delivery.config.chunk_max + 1024 for m in messages)
+    assert _reassemble(reversed(messages)) == data
+    assert _reassemble(delivery.frames(delivery.Frame(data))) == data
+
+
+@pytest.mark.parametrize("size", [100, 50 * 1024, 400 * 1024])
+def test_pack_round_trip(size):
+    from app import delivery
+
+    data = _frame(size)
+    body = json.loads(json.dumps(delivery.pack(data)))
+    assert delivery.unpack(body) == data
+
+
+def test_oversize_frame_is_split_across_messages():
+    from app import delivery
+
+    data = _frame(400 * 1024)
+    bodies = [json.loads(json.dumps(body)) for body in delivery.bodies(data)]
+    assert len(bodies) > 1
+    assert all(len(json.dumps(body)) < delivery.SNS_MAX for body in bodies)
+    posted = [delivery.frames(delivery.unpack(body)) for body in bodies]
+    assert all(len(messages) == 1 for messages in posted)
+    assert _reassemble([messages[0] for messages in posted]) == data
+
+
+def test_oversize_broadcast_is_reassembled(aws, monkeypatch):
+    from app import control
+    from app.control import Broadcast, Control, SnsBatchHandler
+
+    monkeypatch.setattr(control.config, "sns_group_max", 5)
+    cids = []
+    for i in range(12):
+        cid = fakes.connection_id()
+        aws.gateway.open(cid)
+        Control(cid).save_connection("bench.example.com", "bench", f"user-{i}")
+        cids.append(cid)
+    data = _frame(400 * 1024)
+    Broadcast().send_message(data)
+    records = [record for _, record in aws.sns.queue]
+    # every chunk to every group, delivered in reverse order
+    SnsBatchHandler(records[::-1]).handle()
+    for cid in cids:
+        assert _reassemble([frame for _, frame in aws.gateway.inbox[cid]]) == data
+
+
+def test_publish_refuses_oversize_messages(aws):
+    from app import delivery
+    from app.control import ROUTE_SEND_MESSAGE, SnsRouter
+
+    with pytest.raises(ValueError):
+        SnsRouter().publish(ROUTE_SEND_MESSAGE, {"data": "x" * delivery.SNS_MAX})
+    assert aws.sns.published == 0
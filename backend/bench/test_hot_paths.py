@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""test_hot_paths.py: Micro-benchmarks of the core hot functions.
+
+Run from the backend directory. `npm run bench_save` records a baseline
+as JSON under .benchmarks/, `npm run bench` saves a new run and fails
+when the mean of any benchmark regresses more than 15% against the
+previous one.
+"""
+import json
+import random
+
+import pytest
+
+from bench import fakes
+
+CELLS = [f"{x},{y}" for x in range(50) for y in range(50)]
+
+
+def _fill(table, fraction):
+    random.seed(1)
+    active = random.sample(CELLS, int(len(CELLS) * fraction))
+    table.put_item(
+        Item={"key": "state", "type": "active_cells", "active_cells": active}
+    )
+
+
+def _boxes(table, user, count):
+    random.seed(2)
+    boxes = []
+    for _ in range(count):
+        # keep every box clear of (49, 49) so is_alert scans them all
+        x1, y1 = random.randint(0, 40), random.randint(0, 40)
+        boxes.append({"x1": x1, "y1": y1, "x2": x1 + 5, "y2": y1 + 5})
+    table.put_item(Item={"key": "alert_box", "type": user, "alert_boxes": boxes})
+
+
+def _connect(aws, control_cls, count):
+    for i in range(count):
+        cid = fakes.connection_id()
+        aws.gateway.open(cid)
+        control_cls(cid).save_connection("bench.example.com", "bench", f"user-{i}")
+
+
+@pytest.mark.parametrize("fill", [0.0, 0.5, 0.9, 0.99])
+def test_get_random_cell(benchmark, table, fill):
+    from app.control import CellState
+
+    _fill(table, fill)
+    state = CellState()
+    assert benchmark(state._get_random_cell)
+
+
+@pytest.mark.parametrize("fill", [0.1, 0.9])
+def test_board_snapshot(benchmark, table, fill):
+    from app.control import CellState
+
+    _fill(table, fill)
+    state = CellState()
+
+    def run():
+        return state.snapshot().encoded
+
+    assert benchmark(run).startswith(b'{"action": "all_active_cells"')
+
+
+@pytest.mark.parametrize("boxes", [1, 100, 1000, 10000])
+def test_is_alert(benchmark, table, boxes):
+    from app.control import Control
+
+    _boxes(table, "bench-user", boxes)
+    control = Control("bench-connection")
+    control.user = "bench-user"
+    assert not benchmark(control.is_alert, {"x": 49, "y": 49})
+
+
+@pytest.mark.parametrize("boxes", [1, 100, 1000])
+def test_box_counts(benchmark, table, boxes):
+    from app.control import CellState
+
+    _fill(table, 0.5)
+    _boxes(table, "bench-user", boxes)
+    state = CellState()
+    items = table.get_item(Key={"key": "alert_box", "type": "bench-user"})["Item"]
+    assert len(benchmark(state.box_counts, items["alert_boxes"])) == boxes
+
+
+def test_new_active_cells_full_board(benchmark):
+    from boto3.dynamodb.types import TypeSerializer
+
+    from app.dynstream import ActiveCells
+
+    ser = TypeSerializer()
+    record = {
+        "eventName": "MODIFY",
+        "dynamodb": {
+            "Keys": {"type": {"S": "active_cells"}, "key": {"S": "state"}},
+            "OldImage": {"active_cells": ser.serialize(CELLS[:-1])},
+            "NewImage": {"active_cells": ser.serialize(CELLS)},
+        },
+    }
+
+    def run():
+        return ActiveCells(record).new_active_cells
+
+    assert benchmark(run) == {CELLS[-1]}
+
+
+def test_jwt_get_claims(benchmark, aws, user_pool):
+    from app.jwt import JwtToken
+
+    user_pool.install()
+    token = JwtToken(user_pool.token("bench-user"))
+    assert token.valid
+    claims, status = benchmark(token._get_claims)
+    assert status == "OK"
+
+
+def test_to_dict(benchmark, table):
+    from app.control import Control
+
+    _boxes(table, "bench-user", 1000)
+    control = Control("bench-connection")
+    control.user = "bench-user"
+    boxes = control._get_alert_boxes()
+    assert len(benchmark(control.to_dict, boxes)) == 1000
+
+
+@pytest.mark.parametrize("connections", [10, 100, 1000])
+def test_broadcast_fanout(benchmark, aws, table, connections):
+    from app.control import Broadcast, Control
+
+    _connect(aws, Control, connections)
+    bcast = Broadcast()
+
+    def run():
+        bcast.send_message({"action": "add_active_cell", "message": {"x": 1, "y": 1}})
+        aws.sns.queue.clear()
+
+    benchmark(run)
+    # small audiences are posted directly, large ones go through SNS
+    bcast.send_message({"action": "add_active_cell", "message": {"x": 1, "y": 1}})
+    messages = [json.loads(record["Sns"]["Message"]) for _, record in aws.sns.queue]
+    queued = sum(len(message["connections"]) for message in messages)
+    assert queued == connections or aws.gateway.posts >= connections
+
+
+def _eager(control_cls):
+    """Control building its collaborators up front, as it did before."""
+
+    class EagerControl(control_cls):
+        def __init__(self, *args) -> None:
+            super().__init__(*args)
+            import boto3
+
+            from app.config import Config
+
+            self.state
+            self.bcast.router
+            self.dynamodb = boto3.resource("dynamodb", region_name=Config().region)
+
+    return EagerControl
+
+
+@pytest.mark.parametrize("construction", ["lazy", "eager"])
+def test_control_per_message(benchmark, aws, construction):
+    """Per-message Control construction plus a ping through parse_message.
+
+    `eager` builds the cell state, the broadcaster with its SNS router and
+    a DynamoDB resource for every frame. Client construction is nearly
+    free against the fakes, so with real boto3 the gap is wider.
+    """
+    from app.control import Control
+
+    control_cls = Control if construction == "lazy" else _eager(Control)
+    cid = fakes.connection_id()
+    aws.gateway.open(cid)
+    Control(cid).save_connection("bench.example.com", "bench", "bench-user")
+
+    def run():
+        control = control_cls(cid, "bench.example.com", "bench")
+        control.parse_message('{"action": "ping"}')
+
+    benchmark(run)
+    assert b"pong!" in aws.gateway.inbox[cid][-1][1]
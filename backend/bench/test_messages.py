@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""test_messages.py: Inbound frames are validated before any backend work."""
+import json
+
+import pytest
+
+from bench import fakes
+
+
+def _box(**coords):
+    return json.dumps({"action": "save_alert_box", "message": coords})
+
+
+@pytest.mark.parametrize(
+    "raw, error",
+    [
+        ("not json", "not valid JSON"),
+        ("[1, 2]", "must be a JSON object"),
+        ('{"action": "nope"}', "Unknown action nope"),
+        ('{"message": {}}', "Unknown action None"),
+        (_box(x1=True, y1=0, x2=5, y2=5), "x1 must be an integer"),
+        (_box(x1=0, y1=0, x2=5.0, y2=5), "x2 must be an integer"),
+        (_box(x1=0, y1=0, x2=51, y2=5), "x2 out of range"),
+        (_box(x1=-1, y1=0, x2=5, y2=5), "x1 out of range"),
+        (_box(x1=0, y1=0, x2=5), "y2 must be an integer"),
+        (_box(x1=3, y1=0, x2=3, y2=5), "alert box is empty"),
+        ('{"action": "save_alert_box", "message": [0, 0, 5, 5]}', "must be an object"),
+    ],
+)
+def test_decode_rejects(raw, error):
+    from app.messages import MessageError, decode
+
+    with pytest.raises(MessageError, match=error):
+        decode(raw)
+
+
+def test_swapped_corners_are_normalized():
+    from app.messages import decode
+
+    box = decode(_box(x1=10, y1=20, x2=2, y2=4))
+    assert box.to_item() == {"x1": 2, "y1": 4, "x2": 10, "y2": 20}
+
+
+def test_cheap_actions_decode():
+    from app.messages import Message, decode
+
+    message = decode('{"action": "ping"}')
+    assert type(message) is Message and message.action == "ping"
+
+
+def test_invalid_frame_is_answered_without_db_calls(aws, table):
+    from app.control import Control
+
+    cid = fakes.connection_id()
+    aws.gateway.open(cid)
+    Control(cid).save_connection("bench.example.com", "bench", "bench-user")
+    calls = dict(table.calls)
+    control = Control(cid, "bench.example.com", "bench")
+    control.parse_message(_box(x1=0, y1=0, x2=99, y2=5))
+    assert table.calls == calls
+    reply = json.loads(aws.gateway.inbox[cid][-1][1])
+    assert reply["action"] == "error"
+    assert "x2 out of range" in reply["message"]
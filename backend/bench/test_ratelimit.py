@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""test_ratelimit.py: Inbound frames are limited per connection and action."""
+import time
+
+import pytest
+
+from bench import fakes
+
+ACTION = "save_alert_box"
+
+
+@pytest.fixture
+def limits(aws, monkeypatch):
+    from app import ratelimit
+
+    monkeypatch.setattr(ratelimit.config, "inbound_rate", 0.001)
+    monkeypatch.setattr(ratelimit.config, "inbound_burst", 100)
+    # a window's allowance is the burst, the refill is negligible
+    monkeypatch.setattr(ratelimit, "ACTION_LIMITS", {ACTION: (0.001, 4)})
+    return ratelimit
+
+
+def _allow(ratelimit, cid, action, count):
+    return [ratelimit.allow(cid, action) for _ in range(count)]
+
+
+def _counted(ratelimit, table, cid):
+    window = int(time.time() // ratelimit.config.inbound_window)
+    key = {"key": ratelimit.KEY, "type": f"{cid}#{ACTION}#{window}"}
+    return table.get_item(Key=key).get("Item", {}).get("count", 0)
+
+
+def test_burst_is_exhausted(limits, monkeypatch):
+    monkeypatch.setattr(limits.config, "inbound_burst", 3)
+    assert _allow(limits, "conn", "ping", 4) == [True, True, True, False]
+    # buckets are per connection
+    assert limits.allow("other", "ping")
+
+
+def test_action_limit(limits, table):
+    assert _allow(limits, "conn", ACTION, 5) == [True] * 4 + [False]
+    # other actions only take from the connection's bucket
+    assert _allow(limits, "conn", "ping", 3) == [True] * 3
+    assert _counted(limits, table, "conn") == 4
+
+
+def test_shared_counter_spans_containers(limits, table):
+    assert _allow(limits, "conn", ACTION, 4) == [True] * 4
+    # another container, its own buckets but the same window counter
+    limits.reset()
+    assert _allow(limits, "conn", ACTION, 3) == [True, True, False]
+    assert _counted(limits, table, "conn") == 4
+
+
+def test_table_errors_fail_open(limits, table):
+    update_item = table.update_item
+
+    def throttled(**kwargs):
+        raise fakes.client_error("ProvisionedThroughputExceededException", "UpdateItem")
+
+    table.update_item = throttled
+    assert _allow(limits, "conn", ACTION, 3) == [True] * 3
+    table.update_item = update_item
+    # the frames that could not be counted are added with the next write
+    assert limits.allow("conn", ACTION)
+    assert _counted(limits, table, "conn") == 4
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""test_scheduler.py: The scheduler report counts the ticks it ran."""
+from bench import fakes
+
+
+def test_ticks_are_counted(aws):
+    from app.scheduler import Scheduler
+
+    report = Scheduler(["a", "b"], rate=50, margin=0, handoff=0).run(
+        fakes.FakeContext(timeout=0.3)
+    )
+    assert report["ticks"] > 1
+    assert report["steps"] == 2 * report["ticks"]
+
+
+def test_lost_leases_end_the_count(aws, monkeypatch):
+    from app.scheduler import Scheduler
+
+    scheduler = Scheduler(["a", "b"], rate=50, margin=0, handoff=0)
+    # the leases are taken over after the first tick
+    monkeypatch.setattr(scheduler, "_renew", lambda lease: False)
+    report = scheduler.run(fakes.FakeContext(timeout=5))
+    assert report["ticks"] == 1
+    assert report["steps"] == 2
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""test_snapshots.py: SNS deliveries of superseded snapshots are dropped."""
+import json
+
+import pytest
+
+from bench import fakes
+
+
+def _board(cells):
+    return {"action": "all_active_cells", "message": cells}
+
+
+@pytest.fixture
+def broadcast(aws):
+    from app.control import Broadcast, Control
+
+    cids = []
+    for i in range(12):
+        cid = fakes.connection_id()
+        aws.gateway.open(cid)
+        Control(cid).save_connection("bench.example.com", "bench", f"user-{i}")
+        cids.append(cid)
+
+    def send(data):
+        Broadcast().send_message(data)
+        records = [record for _, record in aws.sns.queue]
+        aws.sns.queue.clear()
+        return records
+
+    send.cids = cids
+    return send
+
+
+def _received(aws, cid):
+    return [json.loads(frame) for _, frame in aws.gateway.inbox[cid]]
+
+
+@pytest.mark.parametrize("newer_first", [True, False])
+def test_superseded_snapshot_is_dropped(aws, broadcast, newer_first):
+    from app.control import SnsBatchHandler
+
+    older = broadcast(_board([{"x": 1, "y": 1}]))
+    newer = broadcast(_board([{"x": 2, "y": 2}]))
+    # SNS does not keep order, nor deliver both to the same invocation
+    for records in [newer, older] if newer_first else [older, newer]:
+        SnsBatchHandler(records).handle()
+    for cid in broadcast.cids:
+        assert _received(aws, cid) == [_board([{"x": 2, "y": 2}])]
+
+
+def test_newest_seq_is_cached(aws, broadcast, monkeypatch):
+    from app import snapshots
+    from app.control import SnsBatchHandler
+
+    reads = []
+    latest = snapshots.latest
+
+    def counted(kinds):
+        reads.append(list(kinds))
+        return latest(kinds)
+
+    monkeypatch.setattr(snapshots, "latest", counted)
+    for i in range(5):
+        SnsBatchHandler(broadcast(_board([{"x": i, "y": i}]))).handle()
+    assert len(reads) == 1
+    for cid in broadcast.cids:
+        assert len(_received(aws, cid)) == 5
+    monkeypatch.setattr(snapshots.config, "snapshot_cache", 0)
+    SnsBatchHandler(broadcast(_board([]))).handle()
+    assert len(reads) == 2
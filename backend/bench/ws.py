@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""ws.py: Minimal RFC 6455 websockets on asyncio streams.
+
+Just enough of the protocol for the gateway emulator and its load
+clients: the HTTP upgrade handshake, masked/unmasked frames, message
+fragmentation, ping/pong and the closing handshake. Extensions and
+subprotocols are not negotiated.
+"""
+import asyncio
+import base64
+import hashlib
+import os
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+CONTINUATION = 0x0
+TEXT = 0x1
+BINARY = 0x2
+CLOSE = 0x8
+PING = 0x9
+PONG = 0xA
+
+# API Gateway rejects messages over 128 KB
+MAX_MESSAGE = 128 * 1024
+# seconds a peer has to answer a close frame
+CLOSE_TIMEOUT = 5
+
+REASONS = {
+    101: "Switching Protocols",
+    200: "OK",
+    204: "No Content",
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "Not Found",
+    410: "Gone",
+    426: "Upgrade Required",
+    500: "Internal Server Error",
+}
+
+Headers = Dict[str, str]
+
+
+class ProtocolError(Exception):
+    """Raised when the peer breaks the protocol, carries the close code."""
+
+    def __init__(self, code: int, reason: str) -> None:
+        super().__init__(reason)
+        self.code = code
+
+
+class HandshakeError(Exception):
+    """Raised by `connect` when the server does not upgrade."""
+
+    def __init__(self, status: int, body: bytes) -> None:
+        super().__init__(f"Handshake failed with {status}: {body[:200]!r}")
+        self.status = status
+        self.body = body
+
+
+def accept_key(key: str) -> str:
+    """Return the Sec-WebSocket-Accept value for a Sec-WebSocket-Key."""
+    digest = hashlib.sha1((key + GUID).encode("ascii")).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def _mask(data: bytes, key: bytes) -> bytes:
+    # XOR as one big integer, much faster than a per-byte loop
+    n = len(data)
+    if not n:
+        return data
+    pad = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(data, "little") ^ int.from_bytes(pad, "little")).to_bytes(
+        n, "little"
+    )
+
+
+def encode_frame(opcode: int, payload: bytes, mask: bool) -> bytes:
+    """Encode a single final frame, clients must mask what they send."""
+    head = bytearray([0x80 | opcode])
+    bit = 0x80 if mask else 0
+    n = len(payload)
+    if n < 126:
+        head.append(bit | n)
+    elif n < 1 << 16:
+        head.append(bit | 126)
+        head += n.to_bytes(2, "big")
+    else:
+        head.append(bit | 127)
+        head += n.to_bytes(8, "big")
+    if mask:
+        key = os.urandom(4)
+        head += key
+        payload = _mask(payload, key)
+    return bytes(head) + payload
+
+
+async def read_frame(
+    reader: asyncio.StreamReader, max_size: int = MAX_MESSAGE
+) -> Tuple[bool, int, bytes]:
+    """Read one frame, returning (fin, opcode, payload)."""
+    b1, b2 = await reader.readexactly(2)
+    n = b2 & 0x7F
+    if n == 126:
+        n = int.from_bytes(await reader.readexactly(2), "big")
+    elif n == 127:
+        n = int.from_bytes(await reader.readexactly(8), "big")
+    if n > max_size:
+        raise ProtocolError(1009, f"Frame of {n} bytes is too big")
+    key = await reader.readexactly(4) if b2 & 0x80 else None
+    payload = await reader.readexactly(n)
+    if key:
+        payload = _mask(payload, key)
+    return bool(b1 & 0x80), b1 & 0x0F, payload
+
+
+async def read_head(reader: asyncio.StreamReader) -> Tuple[str, Headers]:
+    """Read an HTTP request or status line and its headers."""
+    raw = await reader.readuntil(b"\r\n\r\n")
+    lines = raw.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return lines[0], headers
+
+
+async def read_body(reader: asyncio.StreamReader, headers: Headers) -> bytes:
+    """Read a body framed by Content-Length."""
+    length = int(headers.get("content-length") or 0)
+    return await reader.readexactly(length) if length else b""
+
+
+def response(
+    status: int, body: bytes = b"", headers: Optional[Headers] = None
+) -> bytes:
+    """Build an HTTP/1.1 response, closing the connection unless upgraded."""
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}"]
+    fields = {}
+    if status != 101:
+        fields = {"Content-Length": str(len(body)), "Connection": "close"}
+    fields.update(headers or {})
+    lines += [f"{name}: {value}" for name, value in fields.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+
+class Connection:
+    """One side of an open websocket."""
+
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        client: bool,
+        max_size: int = MAX_MESSAGE,
+    ) -> None:
+        self.reader = reader
+        self.writer = writer
+        # clients mask every frame, servers never do
+        self.client = client
+        self.max_size = max_size
+        self.close_sent = False
+        self.close_code: Optional[int] = None
+
+    @property
+    def open(self) -> bool:
+        return not self.close_sent and self.close_code is None
+
+    def _write(self, opcode: int, payload: bytes) -> None:
+        if not self.writer.is_closing():
+            self.writer.write(encode_frame(opcode, payload, self.client))
+
+    def send_nowait(self, data: Union[str, bytes]) -> None:
+        """Queue a message, text for str and binary for bytes."""
+        if not self.open:
+            return
+        if isinstance(data, str):
+            self._write(TEXT, data.encode("utf-8"))
+        else:
+            self._write(BINARY, data)
+
+    async def send(self, data: Union[str, bytes]) -> None:
+        """Send a message, waiting for the write buffer to drain."""
+        self.send_nowait(data)
+        await self.writer.drain()
+
+    async def recv(self) -> Optional[Union[str, bytes]]:
+        """Return the next message, or None once the connection closed."""
+        parts = []
+        opcode = None
+        size = 0
+        while True:
+            try:
+                fin, op, payload = await read_frame(self.reader, self.max_size)
+            except ProtocolError as e:
+                await self._fail(e.code, str(e))
+                return None
+            except (asyncio.IncompleteReadError, ConnectionError):
+                self.close_code = self.close_code or 1006
+                self.writer.close()
+                return None
+            if op == PING:
+                self._write(PONG, payload)
+                continue
+            if op == PONG:
+                continue
+            if op == CLOSE:
+                self.close_code = (
+                    int.from_bytes(payload[:2], "big") if payload else 1005
+                )
+                if not self.close_sent:
+                    self.close_sent = True
+                    self._write(CLOSE, payload[:2])
+                self.writer.close()
+                return None
+            if op != CONTINUATION:
+                opcode = op
+            size += len(payload)
+            if size > self.max_size:
+                await self._fail(1009, "Message too big")
+                return None
+            parts.append(payload)
+            if fin:
+                break
+        data = b"".join(parts)
+        if opcode == TEXT:
+            try:
+                return data.decode("utf-8")
+            except UnicodeDecodeError:
+                await self._fail(1007, "Invalid UTF-8")
+                return None
+        return data
+
+    async def _fail(self, code: int, reason: str) -> None:
+        await self.close(code, reason)
+        self.close_code = code
+        self.writer.close()
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        """Start the closing handshake.
+
+        The peer's reply is read by whoever reads the connection, `recv`
+        returns None once it arrived.
+        """
+        if self.close_sent:
+            return
+        self.close_sent = True
+        self._write(CLOSE, code.to_bytes(2, "big") + reason.encode("utf-8")[:123])
+        # peers that never answer are cut off
+        asyncio.get_running_loop().call_later(CLOSE_TIMEOUT, self.writer.close)
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Union[str, bytes]:
+        message = await self.recv()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+
+async def accept(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: Headers
+) -> Connection:
+    """Answer an upgrade request whose head was already read."""
+    writer.write(
+        response(
+            101,
+            headers={
+                "Upgrade": "websocket",
+                "Connection": "Upgrade",
+                "Sec-WebSocket-Accept": accept_key(headers["sec-websocket-key"]),
+            },
+        )
+    )
+    await writer.drain()
+    return Connection(reader, writer, client=False)
+
+
+def is_upgrade(headers: Headers) -> bool:
+    """Check if a request asks for a websocket."""
+    return (
+        headers.get("upgrade", "").lower() == "websocket"
+        and "sec-websocket-key" in headers
+    )
+
+
+async def connect(url: str, max_size: int = MAX_MESSAGE) -> Connection:
+    """Open a client connection to a ws:// url."""
+    parts = urlsplit(url)
+    if parts.scheme != "ws":
+        raise ValueError(f"Only ws:// urls are supported, not {url}")
+    port = parts.port or 80
+    reader, writer = await asyncio.open_connection(parts.hostname, port, limit=max_size)
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    target = parts.path or "/"
+    if parts.query:
+        target += "?" + parts.query
+    writer.write(
+        (
+            f"GET {target} HTTP/1.1\r\n"
+            f"Host: {parts.hostname}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        ).encode("latin-1")
+    )
+    status_line, headers = await read_head(reader)
+    status = int(status_line.split()[1])
+    if status != 101:
+        body = await read_body(reader, headers)
+        writer.close()
+        raise HandshakeError(status, body)
+    if headers.get("sec-websocket-accept") != accept_key(key):
+        writer.close()
+        raise HandshakeError(status, b"Bad Sec-WebSocket-Accept")
+    return Connection(reader, writer, client=True, max_size=max_size)
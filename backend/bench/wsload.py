@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""wsload.py: End-to-end load test over real websockets.
+
+Starts the gateway emulator in bench.gateway and connects N websocket
+clients to it over TCP, then measures what a browser would see:
+the upgrade handshake (including `$connect`), `ping` round trips, the
+delay from each scheduler tick to its `add_active_cell` frame arriving
+at every client, and the closing handshake. Clients and emulator share
+one event loop, so client-side parsing counts against the numbers. Run
+from the backend directory:
+
+    python -m bench.wsload --clients 2000 --rate 2 --duration 10
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import random
+import resource
+import time
+from typing import Dict, List, Optional, Tuple
+
+import bench.env  # noqa: F401
+from bench import fakes, ws
+from bench.gateway import Gateway
+from bench.loadtest import Recorder, print_report
+
+
+class LoadClient:
+    """One websocket client, recording what arrives and when."""
+
+    def __init__(self, test: "WsLoadTest", url: str) -> None:
+        self.test = test
+        self.url = url
+        self.socket: Optional[ws.Connection] = None
+        self.reader: Optional[asyncio.Task] = None
+        self.pong: Optional[asyncio.Future] = None
+
+    async def connect(self) -> bool:
+        start = time.perf_counter()
+        try:
+            self.socket = await ws.connect(self.url)
+        except (ws.HandshakeError, OSError, asyncio.IncompleteReadError):
+            self.test.recorder.error("ws_connect")
+            return False
+        self.test.recorder.record("ws_connect", time.perf_counter() - start)
+        self.reader = asyncio.ensure_future(self.read())
+        return True
+
+    async def read(self) -> None:
+        cells = self.test.cells
+        counts = self.test.frames
+        async for raw in self.socket:
+            now = time.perf_counter()
+            data = json.loads(raw)
+            action = data.get("action") or "none"
+            counts[action] = counts.get(action, 0) + 1
+            if action == "add_active_cell":
+                cells.append((data["message"]["x"], data["message"]["y"], now))
+            elif action == "info" and data.get("message") == "pong!":
+                if self.pong and not self.pong.done():
+                    self.pong.set_result(now)
+
+    async def send(self, action: str, message: Optional[Dict] = None) -> None:
+        await self.socket.send(json.dumps({"action": action, "message": message or {}}))
+
+    async def ping(self) -> None:
+        # at most one ping in flight, like a heartbeat
+        if self.pong and not self.pong.done():
+            return
+        self.pong = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        await self.send("ping")
+        try:
+            end = await asyncio.wait_for(self.pong, 10)
+        except asyncio.TimeoutError:
+            self.test.recorder.error("ws_ping")
+            return
+        self.test.recorder.record("ws_ping", end - start)
+
+    async def close(self) -> None:
+        start = time.perf_counter()
+        await self.socket.close()
+        await self.reader
+        self.test.recorder.record("ws_disconnect", time.perf_counter() - start)
+
+
+class WsLoadTest:
+    """One end-to-end run against a fresh gateway and fakes."""
+
+    def __init__(
+        self,
+        clients: int,
+        rate: float,
+        duration: float,
+        pings: float = 10.0,
+        boxes: int = 1,
+        connect_concurrency: int = 200,
+        concurrency: int = 64,
+        sns_workers: int = 4,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.clients = clients
+        self.rate = rate
+        self.duration = duration
+        self.pings = pings
+        self.boxes = boxes
+        self.connect_concurrency = connect_concurrency
+        self.concurrency = concurrency
+        self.sns_workers = sns_workers
+        self.random = random.Random(seed)
+        self.recorder = Recorder()
+        self.frames: Dict[str, int] = {}
+        self.cells: List[Tuple[int, int, float]] = []
+        self.connected: List[LoadClient] = []
+
+    def random_box(self) -> Dict[str, int]:
+        x1, y1 = self.random.randint(0, 45), self.random.randint(0, 45)
+        return {
+            "x1": x1,
+            "y1": y1,
+            "x2": x1 + self.random.randint(1, 5),
+            "y2": y1 + self.random.randint(1, 5),
+        }
+
+    async def _open(self, url: str, slots: asyncio.Semaphore) -> None:
+        async with slots:
+            client = LoadClient(self, url)
+            if not await client.connect():
+                return
+            self.connected.append(client)
+            # what the frontend asks for once connected
+            await client.send("send_alert_boxes")
+            await client.send("send_all_active_cells")
+            for _ in range(self.boxes):
+                await client.send("save_alert_box", self.random_box())
+
+    async def _ping_forever(self) -> None:
+        period = 1.0 / self.pings
+        pending = set()
+        while True:
+            await asyncio.sleep(period)
+            task = asyncio.ensure_future(self.random.choice(self.connected).ping())
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+    def _cell_latencies(self, gateway: Gateway) -> None:
+        """Match every cell frame to the latest tick that lit its cell."""
+        for x, y, received in self.cells:
+            starts = gateway.cells.get((x, y))
+            if not starts:
+                continue
+            i = bisect.bisect_right(starts, received)
+            if i:
+                self.recorder.record("ws_cell_e2e", received - starts[i - 1])
+
+    async def run(self) -> Dict:
+        aws = fakes.install()
+        gateway = Gateway(
+            aws, port=0, concurrency=self.concurrency, sns_workers=self.sns_workers
+        )
+        pool = fakes.FakeUserPool(gateway.config.app_client_id)
+        pool.install()
+        await gateway.start()
+        try:
+            # tokens are signed up front, that is not what is measured
+            urls = [
+                f"{gateway.url}/?token={pool.token(f'user-{i}')}"
+                for i in range(self.clients)
+            ]
+            start = time.perf_counter()
+            slots = asyncio.Semaphore(self.connect_concurrency)
+            await asyncio.gather(*(self._open(url, slots) for url in urls))
+            await gateway.settle()
+            connected = time.perf_counter()
+            self.frames.clear()
+            load = [asyncio.ensure_future(gateway.tick_forever(self.rate))]
+            if self.pings and self.connected:
+                load.append(asyncio.ensure_future(self._ping_forever()))
+            await asyncio.sleep(self.duration)
+            for task in load:
+                task.cancel()
+            await gateway.settle()
+            end = time.perf_counter()
+            await asyncio.gather(*(client.close() for client in self.connected))
+            await gateway.settle()
+        finally:
+            await gateway.stop()
+            aws.uninstall()
+        self._cell_latencies(gateway)
+        lit = sum(len(starts) for starts in gateway.cells.values())
+        report = {
+            "clients": len(self.connected),
+            "connect_seconds": round(connected - start, 3),
+            "run_seconds": round(end - connected, 3),
+            "ticks": gateway.ticks,
+            "cell_frames": len(self.cells),
+            "cell_frames_expected": lit * len(self.connected),
+            "frames_received": dict(sorted(self.frames.items())),
+            **gateway.report(),
+        }
+        # client-side latencies next to the handler durations behind them
+        report["routes"] = {
+            **self.recorder.summary(end - start),
+            **gateway.recorder.summary(end - start),
+        }
+        return report
+
+
+def raise_file_limit() -> int:
+    """Raise the open file limit to the hard limit, two fds per client."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=2.0, help="cell events/sec")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument(
+        "--pings", type=float, default=10.0, help="pings/sec, all clients"
+    )
+    parser.add_argument("--boxes", type=int, default=1, help="alert boxes/client")
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    parser.add_argument(
+        "--concurrency", type=int, default=64, help="concurrent invocations"
+    )
+    parser.add_argument(
+        "--sns-workers", type=int, default=4, help="concurrent SNS pumps"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+    limit = raise_file_limit()
+    if args.clients * 2 + 64 > limit:
+        parser.error(f"--clients {args.clients} needs more than {limit} open files")
+    test = WsLoadTest(
+        args.clients,
+        args.rate,
+        args.duration,
+        pings=args.pings,
+        boxes=args.boxes,
+        connect_concurrency=args.connect_concurrency,
+        concurrency=args.concurrency,
+        sns_workers=args.sns_workers,
+        seed=args.seed,
+    )
+    report = asyncio.run(test.run())
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
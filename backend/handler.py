@@ -1,99 +1,103 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """Main Handler entrypoint for lambdas."""
-import logging
-import time
-
-from app.control import Broadcast, CellState, Lock, SnsRecordHandler
+from app.config import Config
+from app.control import SnsBatchHandler
 from app.dynstream import ActiveCells
+from app.logs import get_logger, log_event
+from app.memory import accounted
+from app.metrics import instrumented
+from app.profiler import profiled
+from app.reaper import Reaper
+from app.scheduler import Scheduler
+from app.warmup import warmed
 from app.websocket import WebSocketConnectHandler, WebSocketMessageHandler
 
-logger = logging.getLogger("handler_logger")
-logger.setLevel(logging.DEBUG)
+logger = get_logger()
 
-RAND_WAIT = 1
+config = Config()
 
 
+@warmed("connect")
+@instrumented("connect")
+@accounted("connect")
+@profiled("connect")
 def connect(event, _):
     """Handle a connection event."""
-    logger.info("Connect requested")
+    logger.debug("Connect requested")
     return WebSocketConnectHandler(event).handle_connection()
 
 
+@warmed("message")
+@instrumented("message")
+@accounted("message")
+@profiled("message")
 def message(event, _):
     """Handle a message event."""
-    logger.info("Message requested")
+    logger.debug("Message requested")
     return WebSocketMessageHandler(event).handle_message()
 
 
+@instrumented("dynstream")
+@accounted("dynstream")
+@profiled("dynstream")
 def dynstream(event, _):
     """Handle a dynmodbstream."""
-    logger.info("Dynstream requested: %s", str(event)[:100])
+    log_event(logger, "dynstream", "Dynstream requested", event)
     for record in event["Records"]:
         state_record = ActiveCells(record)
         state_record.send_alerts()
 
 
-def schedule_random(event, _):
+@instrumented("schedule_random")
+@accounted("schedule_random")
+@profiled("schedule_random")
+def schedule_random(event, context):
     """Handle a scheduled event."""
-    logger.info("Scheduled event requested: %s", event)
-    start = time.time()
-    cs = CellState()
-    bc = Broadcast()
-    lock = Lock("schedule_random")
-    is_locked = lock.lock()
-    if not is_locked:
-        logger.info("Lock is already in use, exiting")
-        return
-    # loop for 60 seconds
-    while time.time() - start < 55:
-        res = cs.add_random_active()
-        if res:
-            pl = {
-                "action": "add_active_cell",
-                "message": {
-                    "x": res["x"],
-                    "y": res["y"],
-                },
-            }
-            bc.send_message(pl)
-        else:
-            # if no more cells are available, clear the board
-            cs.clear_active()
-            bc.send_message(
-                {
-                    "action": "board_cleared",
-                }
-            )
-        time.sleep(RAND_WAIT)
-    logger.info("Unlocking")
-    lock.unlock()
+    log_event(logger, "schedule_random", "Scheduled event requested", event)
+    # boards may be named by the event, e.g. {"channels": ["a", "b"]}
+    boards = event.get("channels") or config.schedule_boards
+    stats = Scheduler(boards).run(context)
+    logger.info("Scheduler finished: %s", stats)
+    return stats
+
 
+@instrumented("reap")
+@accounted("reap")
+@profiled("reap")
+def reap(event, _):
+    """Remove connection records whose sockets are gone."""
+    log_event(logger, "reap", "Reap requested", event)
+    return Reaper().run()
 
+
+@warmed("sns")
+@instrumented("sns")
+@accounted("sns")
+@profiled("sns")
 def sns(event, _):
     """Handle an sns event."""
-    logger.info("SNS event requested: %s", event)
-    for record in event["Records"]:
-        SnsRecordHandler(record).handle_message()
-        #  {
-        #      "Records": [
-        #          {
-        #              "EventSource": "aws:sns",
-        #              "EventVersion": "1.0",
-        #              "EventSubscriptionArn": "arn:aws:sns:us-east-2:668805947503:sh-ws-demo-dev20230427145206341500000003:f17bc7f6-50e5-499b-bc78-1071a7e83737",
-        #              "Sns": {
-        #                  "Type": "Notification",
-        #                  "MessageId": "d8dc1647-9a1a-50da-8b72-4a8315ff3e71",
-        #                  "TopicArn": "arn:aws:sns:us-east-2:668805947503:sh-ws-demo-dev20230427145206341500000003",
-        #                  "Subject": None,
-        #                  "Message": '{"foo": "bar"}',
-        #                  "Timestamp": "2023-04-27T14:58:45.860Z",
-        #                  "SignatureVersion": "1",
-        #                  "Signature": "09Zh4d9XlNtLgnOscWaQHSO/YgrqF4JKPe50vNQmIticQK8Qxbd6MnL+LWFKhKQASLmgQT4MJuQVK6qqnyT/2fW5CBI+LA79KOLca6YrDSlfFAWBz9l6TY81zl8DyUfXI5a8gMQvg7k8G1d4eV1iySlJ6CnmVYIVJw3PxSMg9GloQtmDVrRZ+Cry09iYEZMsX0pFEDh0agRc9nvZRlrJGuRxXn6j6Z0X0ct7xT8zy1hK9wJNz8Ssu52tL4d45luQiXGyNdob6V3plWNXaUotaE0hWAQwNagWjfjL2XnLpRsDXt4/rKm9T9HOwVAXfFHVEac5ilB6WJep1w7E8kFV8w==",
-        #                  "SigningCertUrl": "https://sns.us-east-2.amazonaws.com/SimpleNotificationService-56e67fcb41f6fec09b0196692625d385.pem",
-        #                  "UnsubscribeUrl": "https://sns.us-east-2.amazonaws.com/?Action=Unsubscribe&SubscriptionArn=arn:aws:sns:us-east-2:668805947503:sh-ws-demo-dev20230427145206341500000003:f17bc7f6-50e5-499b-bc78-1071a7e83737",
-        #                  "MessageAttributes": {},
-        #              },
-        #          }
-        #      ]
-        #  }
+    log_event(logger, "sns", "SNS event requested", event)
+    SnsBatchHandler(event["Records"]).handle()
+    #  {
+    #      "Records": [
+    #          {
+    #              "EventSource": "aws:sns",
+    #              "EventVersion": "1.0",
+    #              "EventSubscriptionArn": "arn:aws:sns:us-east-2:668805947503:sh-ws-demo-dev20230427145206341500000003:f17bc7f6-50e5-499b-bc78-1071a7e83737",
+    #              "Sns": {
+    #                  "Type": "Notification",
+    #                  "MessageId": "d8dc1647-9a1a-50da-8b72-4a8315ff3e71",
+    #                  "TopicArn": "arn:aws:sns:us-east-2:668805947503:sh-ws-demo-dev20230427145206341500000003",
+    #                  "Subject": None,
+    #                  "Message": '{"foo": "bar"}',
+    #                  "Timestamp": "2023-04-27T14:58:45.860Z",
+    #                  "SignatureVersion": "1",
+    #                  "Signature": "09Zh4d9XlNtLgnOscWaQHSO/YgrqF4JKPe50vNQmIticQK8Qxbd6MnL+LWFKhKQASLmgQT4MJuQVK6qqnyT/2fW5CBI+LA79KOLca6YrDSlfFAWBz9l6TY81zl8DyUfXI5a8gMQvg7k8G1d4eV1iySlJ6CnmVYIVJw3PxSMg9GloQtmDVrRZ+Cry09iYEZMsX0pFEDh0agRc9nvZRlrJGuRxXn6j6Z0X0ct7xT8zy1hK9wJNz8Ssu52tL4d45luQiXGyNdob6V3plWNXaUotaE0hWAQwNagWjfjL2XnLpRsDXt4/rKm9T9HOwVAXfFHVEac5ilB6WJep1w7E8kFV8w==",
+    #                  "SigningCertUrl": "https://sns.us-east-2.amazonaws.com/SimpleNotificationService-56e67fcb41f6fec09b0196692625d385.pem",
+    #                  "UnsubscribeUrl": "https://sns.us-east-2.amazonaws.com/?Action=Unsubscribe&SubscriptionArn=arn:aws:sns:us-east-2:668805947503:sh-ws-demo-dev20230427145206341500000003:f17bc7f6-50e5-499b-bc78-1071a7e83737",
+    #                  "MessageAttributes": {},
+    #              },
+    #          }
+    #      ]
+    #  }
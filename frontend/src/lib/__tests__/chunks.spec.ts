@@ -0,0 +1,50 @@
+// @vitest-environment node
+import { describe, it, expect } from 'vitest'
+
+import { Reassembler } from '../chunks'
+
+// zlib.compress of '{"action": "info", "message": "hello from python"}',
+// base64 encoded, as backend/app/delivery.py produces it
+const fromPython = 'eJyrVkpMLsnMz1OyUlDKzEvLV9JRUMpNLS5OTE8FCWWk5uTkK6QV5ecqFFSWZADV1QIAnP0Qwg=='
+
+function chunks(id: string, body: string, total: number) {
+    const size = Math.ceil(body.length / total)
+    return Array.from({ length: total }, (_, seq) => ({
+        id: id,
+        seq: seq,
+        total: total,
+        encoding: 'zlib+base64',
+        data: body.slice(seq * size, (seq + 1) * size)
+    }))
+}
+
+describe('Reassembler', () => {
+    it('decodes a single chunk', async () => {
+        const frame = await new Reassembler().add(chunks('a', fromPython, 1)[0])
+        expect(frame).toEqual({ action: 'info', message: 'hello from python' })
+    })
+
+    it('waits for every chunk, whatever their order', async () => {
+        const r = new Reassembler()
+        const [first, second, third] = chunks('a', fromPython, 3)
+        expect(await r.add(third)).toBeNull()
+        expect(await r.add(first)).toBeNull()
+        expect(await r.add(second)).toEqual({ action: 'info', message: 'hello from python' })
+        expect(r.pending.size).toBe(0)
+    })
+
+    it('keeps interleaved frames apart', async () => {
+        const r = new Reassembler()
+        const a = chunks('a', fromPython, 2)
+        const b = chunks('b', fromPython, 2)
+        expect(await r.add(a[0])).toBeNull()
+        expect(await r.add(b[1])).toBeNull()
+        expect(await r.add(a[1])).toEqual({ action: 'info', message: 'hello from python' })
+        expect(r.pending.has('b')).toBe(true)
+    })
+
+    it('rejects unknown encodings', async () => {
+        const chunk = { ...chunks('a', fromPython, 1)[0], encoding: 'gzip' }
+        await expect(new Reassembler().add(chunk)).rejects.toThrow('unknown chunk encoding')
+    })
+})
@@ -0,0 +1,30 @@
+import type { Chunk } from '@/lib/types'
+
+// large frames arrive as 'chunk' frames, see backend/app/delivery.py
+export class Reassembler {
+    pending: Map<string, string[]> = new Map()
+
+    // returns the original frame once every chunk of it has arrived
+    async add(chunk: Chunk): Promise<any | null> {
+        const parts = this.pending.get(chunk.id) || new Array(chunk.total)
+        parts[chunk.seq] = chunk.data
+        if (parts.filter((p) => p !== undefined).length < chunk.total) {
+            this.pending.set(chunk.id, parts)
+            return null
+        }
+        this.pending.delete(chunk.id)
+        return JSON.parse(await decode(parts.join(''), chunk.encoding))
+    }
+}
+
+async function decode(body: string, encoding: string): Promise<string> {
+    if (encoding !== 'zlib+base64') {
+        throw new Error('unknown chunk encoding ' + encoding)
+    }
+    const bytes = Uint8Array.from(atob(body), (c) => c.charCodeAt(0))
+    // 'deflate' is the zlib format produced by Python's zlib.compress
+    const stream = new Blob([bytes])
+        .stream()
+        .pipeThrough(new (globalThis as any).DecompressionStream('deflate'))
+    return await new Response(stream).text()
+}
@@ -1,4 +1,5 @@
 import type { Cell, AlertBox } from '@/lib/types'
+import { Reassembler } from '@/lib/chunks'
 import { useAuthStore } from '@/stores/auth'
 import { useGeneralStore } from '@/stores/general'
 import { useToast, type ToastProps } from 'vue-toast-notification'
@@ -45,6 +46,10 @@ export class CanvasGrid {
     mouseTimeout: NodeJS.Timeout | null = null
     grid: Cell[][] = []
     websocket: WebSocket | null = null
+    chunks: Reassembler = new Reassembler()
+    // frames are handled one at a time, so a frame still being
+    // reassembled is not overtaken by the ones after it
+    received: Promise<void> = Promise.resolve()
 
     setup(canvas: HTMLCanvasElement) {
         const auth = useAuthStore()
@@ -69,8 +74,14 @@ export class CanvasGrid {
         }
     }
 
-    private process_action(event: MessageEvent) {
-        const data = JSON.parse(event.data)
+    private async process_action(event: MessageEvent) {
+        let data = JSON.parse(event.data)
+        if (data.action === 'chunk') {
+            data = await this.chunks.add(data.message)
+            if (data === null) {
+                return
+            }
+        }
         console.log('process action', data)
         switch (data.action) {
             case 'alert_boxes':
@@ -81,6 +92,10 @@ export class CanvasGrid {
             case 'all_active_cells':
                 this.setAllActiveCells(data.message)
                 break
+            case 'board_cleared':
+                // a snapshot of an empty board, it may supersede all_active_cells
+                this.setAllActiveCells([])
+                break
             case 'connection_id':
                 const gen = useGeneralStore()
                 gen.setConnectionId(data.message)
@@ -165,7 +180,9 @@ export class CanvasGrid {
 
         this.websocket?.addEventListener('message', (event: MessageEvent) => {
             console.log('message received', event.data)
-            this.process_action(event)
+            this.received = this.received
+                .then(() => this.process_action(event))
+                .catch((err) => console.log('process action failed', err))
         })
 
         this.websocket?.addEventListener('close', (event: CloseEvent) => {
@@ -11,3 +11,11 @@ export interface AlertBox {
     x2: number
     y2: number
 }
+
+export interface Chunk {
+    id: string
+    seq: number
+    total: number
+    encoding: string
+    data: string
+}
@@ -16,6 +16,11 @@ resource "aws_dynamodb_table" "dyn" {
     name = "type"
     type = "S"
   }
+
+  ttl {
+    attribute_name = "ttl"
+    enabled        = true
+  }
 }
 
 resource "aws_ssm_parameter" "dynamodb_table" {